@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+"""
+ *File: maskCache.py
+ *Date: 10/18/2026
+ *Original Author: Daniel Zhou
+ *Co-Author: Yooyoung Lee
+ *Status: Complete
+
+ *Description: this code contains an on-disk cache for the binarized reference masks and
+               their no-score zones, so that scoring several system outputs against the same
+               reference does not repeat the decoding and erosion/dilation of the reference masks.
+
+
+ *Disclaimer:
+ This software was developed at the National Institute of Standards
+ and Technology (NIST) by employees of the Federal Government in the
+ course of their official duties. Pursuant to Title 17 Section 105
+ of the United States Code, this software is not subject to copyright
+ protection and is in the public domain. NIST assumes no responsibility
+ whatsoever for use by other parties of its source code or open source
+ server, and makes no guarantees, expressed or implied, about its quality,
+ reliability, or any other characteristic."
+"""
+import os
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+class maskCache:
+    """
+    This class stores and retrieves the computed reference mask data as compressed numpy archives,
+    keyed by a hash of the reference mask file contents and the parameters the data depends on.
+    The least recently used entries are evicted once the cache exceeds its maximum size.
+    Entries may also be kept decoded in memory, so that a process scoring several system outputs
+    fetches each of them from disk only once.
+    """
+    def __init__(self,cacheDir,maxSize=2*1024**3,maxMemory=0):
+        """
+        Constructor
+
+        Attributes:
+        - cacheDir: the directory in which to store the cached entries
+        - maxSize: the maximum total size of the cache in bytes
+        - maxMemory: the maximum total size in bytes of the entries kept decoded in memory. 0 to keep
+                     none. The arrays of the entries kept in memory are read-only
+        """
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+        self.maxMemory = maxMemory
+        self.memory = OrderedDict()
+        self.memorySize = 0
+        if not os.path.isdir(cacheDir):
+            try:
+                os.makedirs(cacheDir)
+            except OSError:
+                #may have been made by another process in the meantime
+                if not os.path.isdir(cacheDir):
+                    raise
+
+    def __getstate__(self):
+        #the entries kept in memory stay with the process that decoded them
+        state = self.__dict__.copy()
+        state['memory'] = OrderedDict()
+        state['memorySize'] = 0
+        return state
+
+    def getKey(self,fname,params):
+        """
+        * Description: computes the cache key for a reference mask file
+        * Inputs:
+        *     fname: the name of the reference mask file
+        *     params: a list of the parameters the cached data depends on. Must have a stable repr
+        * Outputs:
+        *     the hex digest of the hash of the file contents and parameters
+        """
+        h = hashlib.md5()
+        with open(fname,'rb') as f:
+            for block in iter(lambda: f.read(1 << 20),b''):
+                h.update(block)
+        h.update(repr(params).encode('utf-8'))
+        return h.hexdigest()
+
+    def getPath(self,key):
+        return os.path.join(self.cacheDir,'.'.join([key,'npz']))
+
+    def load(self,key):
+        """
+        * Description: fetches the cached entry for the key
+        * Inputs:
+        *     key: the cache key as returned by getKey
+        * Outputs:
+        *     a dictionary of the cached arrays, or 0 if the key is not in the cache
+        """
+        entry = self.memory.pop(key,None)
+        if entry is not None:
+            #mark as recently used
+            self.memory[key] = entry
+            return entry
+
+        path = self.getPath(key)
+        if not os.path.isfile(path):
+            return 0
+        try:
+            with np.load(path) as f:
+                entry = dict((k,f[k]) for k in f.files)
+            #mark as recently used
+            os.utime(path,None)
+        except (IOError,OSError,ValueError):
+            #entry is corrupted or was evicted by another process while being read
+            return 0
+        self.keep(key,entry)
+        return entry
+
+    def save(self,key,entry):
+        """
+        * Description: stores the entry in the cache under the key, and evicts old entries if the
+                       cache has grown past its maximum size
+        * Inputs:
+        *     key: the cache key as returned by getKey
+        *     entry: a dictionary of the arrays to store
+        """
+        path = self.getPath(key)
+        #write to a temporary file first so that other processes never read a partial entry
+        tmppath = '.'.join([path,str(os.getpid()),'tmp'])
+        with open(tmppath,'wb') as f:
+            np.savez_compressed(f,**entry)
+        os.rename(tmppath,path)
+        self.evict()
+        self.keep(key,entry)
+
+    def keep(self,key,entry):
+        """
+        * Description: keeps the entry in memory, and drops the least recently used entries kept in
+                       memory past the maximum size
+        * Inputs:
+        *     key: the cache key as returned by getKey
+        *     entry: a dictionary of the arrays of the entry
+        """
+        if self.maxMemory <= 0:
+            return
+        size = sum([a.nbytes for a in entry.values()])
+        if size > self.maxMemory:
+            return
+        for a in entry.values():
+            #shared by every mask scored against the reference from here on
+            a.flags.writeable = False
+        old = self.memory.pop(key,None)
+        if old is not None:
+            self.memorySize = self.memorySize - sum([a.nbytes for a in old.values()])
+        self.memory[key] = entry
+        self.memorySize = self.memorySize + size
+        while self.memorySize > self.maxMemory:
+            k,e = self.memory.popitem(last=False)
+            self.memorySize = self.memorySize - sum([a.nbytes for a in e.values()])
+
+    def evict(self):
+        """
+        * Description: removes the least recently used entries until the cache is within its maximum size
+        """
+        entries = []
+        for f in os.listdir(self.cacheDir):
+            if not f.endswith('.npz'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cacheDir,f))
+            except OSError:
+                continue
+            entries.append((st.st_mtime,st.st_size,f))
+        total = sum([e[1] for e in entries])
+        if total <= self.maxSize:
+            return
+        for mtime,size,f in sorted(entries):
+            try:
+                os.remove(os.path.join(self.cacheDir,f))
+            except OSError:
+                pass
+            total = total - size
+            if total <= self.maxSize:
+                break
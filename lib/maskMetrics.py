@@ -35,13 +35,108 @@ import masks
 from decimal import Decimal
 from string import Template
 
+#the number of set bits in each byte value, for counting the pixels in bit-packed masks
+bitCounts = np.array([bin(i).count('1') for i in range(256)],dtype=np.uint8)
+
+class maskCrop(object):
+    """
+    This class holds the part of a reference or system output mask inside a region of interest,
+    for the metrics to be computed over. The matrices are views into those of the full mask.
+    """
+    def __init__(self,m,box):
+        """
+        Constructor
+
+        Attributes:
+        - m: the mask object to crop
+        - box: the rows and columns of the region of interest, as (top,bottom,left,right)
+        """
+        top,bottom,left,right = box
+        self.name = m.name
+        self.box = box
+        self.dims = m.get_dims()
+        #the number of pixels cropped out
+        self.outside = self.dims[0]*self.dims[1] - (bottom - top)*(right - left)
+        self.matrix = m.matrix[top:bottom,left:right]
+        self.bwmat = 0
+        if m.bwmat is not 0:
+            self.bwmat = m.bwmat[top:bottom,left:right]
+        self.constant = m.constant
+        #the thresholds of the crop are recovered as those of the full mask, so the memo is shared
+        self.memo = m.memo
+
+def cropToROI(ref,sys,w,bns,sns,pns):
+    """
+    * Description: crops the masks and weights to the bounding box of the pixels that are in the reference
+                   region, in a no-score zone, or not white in the system output mask. Every pixel outside
+                   the box is scored, negative in the reference, and 255 in the system output, so its
+                   contribution to the metrics is counted from the number of such pixels
+    * Inputs:
+    *     ref: the reference mask object, binarized
+    *     sys: the system output mask object
+    *     w: the weight matrix, combining all the no-score zones
+    *     bns: the boundary no-score weighted matrix
+    *     sns: the selected no-score weighted matrix
+    *     pns: the pixel no-score weighted matrix, or 0
+    * Outputs:
+    *     the cropped ref, sys, w, bns, sns, and pns, and the number of pixels outside the box.
+          The inputs are returned as is, with 0 pixels outside, if the box covers the whole mask
+    """
+    roi = (ref.bwmat != 255) | (w != 1) | (sys.matrix != 255)
+    rows = np.flatnonzero(np.any(roi,axis=1))
+    cols = np.flatnonzero(np.any(roi,axis=0))
+    if len(rows) == 0:
+        return ref,sys,w,bns,sns,pns,0
+    box = (rows[0],rows[-1] + 1,cols[0],cols[-1] + 1)
+    rcrop = maskCrop(ref,box)
+    if rcrop.outside == 0:
+        return ref,sys,w,bns,sns,pns,0
+
+    crop = lambda mat: mat[box[0]:box[1],box[2]:box[3]]
+    if pns is not 0:
+        pns = crop(pns)
+    return rcrop,maskCrop(sys,box),crop(w),crop(bns),crop(sns),pns,rcrop.outside
+
+def packPlanes(ref,w):
+    """
+    * Description: packs the reference and weight planes that the bit-packed confusion measures are computed
+                   on, eight pixels to a byte. The planes depend only on the reference mask and the weights,
+                   so that they can be kept with the reference and reused for every system output mask
+                   scored against it
+    * Inputs:
+    *     ref: the binarized reference mask object
+    *     w: the weight matrix
+    * Output:
+    *     the dictionary of the packed scored pixels 'pw', and of the packed scored reference-positive and
+          reference-negative pixels 'prpos' and 'prneg'
+    """
+    r = ref.bwmat
+    pw = np.packbits(w==1)
+    return {'pw':pw,'prpos':np.packbits(r==0) & pw,'prneg':np.packbits(r==255) & pw}
+
+def encodeRuns(ref,w):
+    """
+    * Description: run-length encodes the reference and weight planes that the run-length encoded confusion
+                   measures are computed on. As with packPlanes, the runs depend only on the reference mask
+                   and the weights, and are kept with the reference for the other system output masks
+    * Inputs:
+    *     ref: the binarized reference mask object
+    *     w: the weight matrix
+    * Output:
+    *     the dictionary of the runs of the scored pixels 'rw', and of the scored reference-positive and
+          reference-negative pixels 'rrpos' and 'rrneg'
+    """
+    r = ref.bwmat
+    rw = masks.rleMask(w==1)
+    return {'rw':rw,'rrpos':masks.rleMask(r==0).intersection(rw),'rrneg':masks.rleMask(r==255).intersection(rw)}
+
 class maskMetrics:
     """
     This class evaluates the metrics for the reference and system output masks.
     The image parameters necessary to evaluate most of the objects are included
     in the initialization.
     """
-    def __init__(self,ref,sys,w,systh=-10):
+    def __init__(self,ref,sys,w,systh=-10,packbits=False,outside=0,rle=False,planes=0):
         """
         Constructor
 
@@ -53,7 +148,15 @@ class maskMetrics:
                  binary mask. Letting systh = -1 will compute the metrics across all
                  distinct thresholds for the system output mask, with the threshold
                  corresponding to the highest MCC chosen
+        - packbits: whether to compute the confusion measures on bit-packed masks
+        - outside: the number of pixels cropped out of the masks by cropToROI. Each is counted
+                   as scored, negative in the reference, and 255 in the system output
+        - rle: whether to compute the confusion measures on run-length encoded masks. Takes
+               precedence over packbits
+        - planes: the reference and weight planes encoded for the confusion measures, as returned
+                  by encodeRuns if rle, or by packPlanes otherwise. 0 to encode them here
         """
+        self.outside = outside
         #get masks for ref and sys
         if ref.bwmat is 0:
             ref.binarize(254) #get the black/white mask first if not already gotten
@@ -67,7 +170,12 @@ class maskMetrics:
 #                sys.bwmat = sys.matrix
 
         #pass threshold as a parameter here
-        self.conf = self.confusion_measures(ref,sys,w,systh)
+        if rle:
+            self.conf = self.confusion_measures_rle(ref,sys,w,systh,planes)
+        elif packbits:
+            self.conf = self.confusion_measures_packed(ref,sys,w,systh,planes)
+        else:
+            self.conf = self.confusion_measures(ref,sys,w,systh)
 
         #record this dictionary of parameters
         self.nmm = self.NimbleMaskMetric(self.conf,ref,w)
@@ -178,11 +286,184 @@ class maskMetrics:
 
         tp = np.float64(np.sum(s & rpos))
         fp = np.float64(np.sum(s & rneg))
+        n,fp = self.addOutside(n,fp,th)
         fn = np.float64(nrpos - tp)
         tn = np.float64(n - nrpos - fp)
 
         return {'TP':tp,'TN':tn,'FP':fp,'FN':fn,'N':n}
 
+    def countBits(self,packed):
+        """
+        * Description: counts the number of set bits in a bit-packed mask
+        * Inputs:
+        *     packed: the bit-packed mask, as returned by np.packbits
+        * Output:
+        *     the number of set bits
+        """
+        return np.sum(bitCounts[packed],dtype=np.int64)
+
+    def confusion_measures_packed(self,ref,sys,w,th,planes=0):
+        """
+        * Metric: confusion_measures_packed
+        * Description: this function calculates the values in the confusion matrix (TP, TN, FP, FN)
+                                     between the reference mask and a black and white system output mask,
+                                     accommodating the no score zone. The masks are packed eight pixels to
+                                     a byte and the areas are counted with a lookup table of set bits,
+                                     so that the intersections run over an eighth of the memory. Given the
+                                     packed reference and weight planes, only the system output mask is
+                                     read in full. The result is identical to confusion_measures.
+        * Inputs:
+        *     ref: the reference mask object
+        *     sys: the system output mask object
+        *     w: the weight matrix
+        *     th: the threshold for binarization
+        *     planes: the packed reference and weight planes, as returned by packPlanes. 0 to pack them here
+        * Output:
+        *     dictionary of the TP, TN, FP, and FN areas, and total score region N
+        """
+        if th == -10:
+            th = 254
+
+        if planes is 0:
+            planes = packPlanes(ref,w)
+        pw = planes['pw']
+        prpos = planes['prpos']
+        prneg = planes['prneg']
+        ps = np.packbits(sys.matrix <= th)
+        n = self.countBits(pw)
+        nrpos = self.countBits(prpos)
+
+        tp = np.float64(self.countBits(ps & prpos))
+        fp = np.float64(self.countBits(ps & prneg))
+        n,fp = self.addOutside(n,fp,th)
+        fn = np.float64(nrpos - tp)
+        tn = np.float64(n - nrpos - fp)
+
+        return {'TP':tp,'TN':tn,'FP':fp,'FN':fn,'N':n}
+
+    def confusion_measures_rle(self,ref,sys,w,th,planes=0):
+        """
+        * Metric: confusion_measures_rle
+        * Description: this function calculates the values in the confusion matrix (TP, TN, FP, FN)
+                                     between the reference mask and a black and white system output mask,
+                                     accommodating the no score zone. The masks are run-length encoded and
+                                     the areas are counted by intersecting their runs. Given the runs of
+                                     the reference and weight planes, only the system output mask is encoded.
+                                     The runs of the thresholded system output mask are kept in its decode
+                                     memo, if any, for other reference masks to be scored against.
+                                     The result is identical to confusion_measures.
+        * Inputs:
+        *     ref: the reference mask object
+        *     sys: the system output mask object
+        *     w: the weight matrix
+        *     th: the threshold for binarization
+        *     planes: the runs of the reference and weight planes, as returned by encodeRuns. 0 to encode them here
+        * Output:
+        *     dictionary of the TP, TN, FP, and FN areas, and total score region N
+        """
+        if th == -10:
+            th = 254
+
+        if planes is 0:
+            planes = encodeRuns(ref,w)
+        rw = planes['rw']
+        rrpos = planes['rrpos']
+        rrneg = planes['rrneg']
+        box = 0
+        if isinstance(sys,maskCrop):
+            box = sys.box
+        if (sys.memo is not 0) and (('runs',th,box) in sys.memo):
+            rs = sys.memo[('runs',th,box)]
+        else:
+            rs = masks.rleMask(sys.matrix <= th)
+            if sys.memo is not 0:
+                sys.memo[('runs',th,box)] = rs
+        n = rw.area()
+        nrpos = rrpos.area()
+
+        tp = np.float64(rs.intersection(rrpos).area())
+        fp = np.float64(rs.intersection(rrneg).area())
+        n,fp = self.addOutside(n,fp,th)
+        fn = np.float64(nrpos - tp)
+        tn = np.float64(n - nrpos - fp)
+
+        return {'TP':tp,'TN':tn,'FP':fp,'FN':fn,'N':n}
+
+    def addOutside(self,n,fp,th):
+        """
+        * Description: adds the pixels cropped out of the masks to the confusion measures. They are all
+                       scored, and false positives at thresholds of 255 and above
+        * Inputs:
+        *     n: the number of scored pixels in the crop
+        *     fp: the false positives in the crop, for the threshold or array of thresholds th
+        *     th: the threshold for binarization, or array of thresholds
+        * Output:
+        *     n and fp including the pixels outside the crop
+        """
+        if self.outside == 0:
+            return n,fp
+        if np.ndim(th) == 0:
+            if th >= 255:
+                fp = fp + self.outside
+            return n + self.outside,fp
+        return n + self.outside,fp + np.where(th >= 255,self.outside,0)
+
+    def confusion_measures_sweep(self,ref,sys,w,thresholds,constant=-1):
+        """
+        * Metric: confusion_measures_sweep
+        * Description: this function calculates the values in the confusion matrix (TP, TN, FP, FN)
+                                     for every threshold in thresholds in a single pass over the masks.
+                                     The system output values are histogrammed separately over the
+                                     reference-positive and reference-negative scored pixels, and the
+                                     counts for each threshold are read off of the cumulative sums.
+                                     The result is identical to calling confusion_measures once per threshold.
+        * Inputs:
+        *     ref: the reference mask object
+        *     sys: the system output mask object
+        *     w: the weight matrix
+        *     thresholds: the list of thresholds for binarization, in increasing order
+        *     constant: the value of the system output mask if it is uniform, -1 otherwise.
+                        The system output mask is not read if it is uniform
+        * Output:
+        *     dictionary of arrays of the TP, TN, FP, and FN areas indexed by threshold, and total score region N
+        """
+        r = ref.bwmat
+        smat = sys.matrix
+        mywts = w==1
+        n = np.sum(mywts)
+        rpos = (r==0) & mywts
+        nrpos = np.sum(rpos)
+        rneg = (r==255) & mywts
+
+        ths = np.array(thresholds,dtype=float)
+        ths[ths == -10] = 254
+        if constant >= 0:
+            #a uniform mask is either entirely at or below the threshold, or entirely above it
+            tp = np.where(ths >= constant,nrpos,0)
+            fp = np.where(ths >= constant,np.sum(rneg),0)
+        elif np.issubdtype(smat.dtype,np.unsignedinteger):
+            spos = smat[rpos]
+            sneg = smat[rneg]
+            #histogram the system output values. The threshold th counts all pixels with value <= floor(th).
+            nbins = int(smat.max()) + 1 if smat.size > 0 else 1
+            cpos = np.append(0,np.cumsum(np.bincount(spos,minlength=nbins)))
+            cneg = np.append(0,np.cumsum(np.bincount(sneg,minlength=nbins)))
+            idx = np.clip(np.floor(ths).astype(int) + 1,0,nbins)
+            tp = cpos[idx]
+            fp = cneg[idx]
+        else:
+            #fall back on sorting for signed or floating point masks
+            tp = np.searchsorted(np.sort(smat[rpos]),ths,side='right')
+            fp = np.searchsorted(np.sort(smat[rneg]),ths,side='right')
+
+        tp = tp.astype(np.float64)
+        fp = fp.astype(np.float64)
+        n,fp = self.addOutside(n,fp,ths)
+        fn = nrpos - tp
+        tn = n - nrpos - fp
+
+        return {'TP':tp,'TN':tn,'FP':fp,'FN':fn,'N':n}
+
     def NimbleMaskMetric(self,conf,ref,w,c=-1):
         """
         * Metric: NMM
@@ -329,6 +610,9 @@ class maskMetrics:
         *     Normalized grayscale WL1 value
         """
         n=np.sum(w) #expect w to be 0 or 1, but otherwise, allow to be a naive sum for the sake of flexibility
+        if isinstance(ref,maskCrop):
+            #the pixels cropped out are scored with no loss
+            n = n + ref.outside
         if n == 0:
             return np.nan
 
@@ -336,6 +620,12 @@ class maskMetrics:
         smat = sys.matrix.astype(int)
 
         wL1=np.multiply(w,abs(rmat-smat)/255.)
+        if isinstance(ref,maskCrop):
+            #sum over the full frame with zeros outside of the crop, for the sum to be rounded as it is uncropped
+            top,bottom,left,right = ref.box
+            fullL1 = np.zeros(ref.dims)
+            fullL1[top:bottom,left:right] = wL1
+            wL1 = fullL1
         wL1=np.sum(wL1)
         #wL1=sum([wt*abs(rmat[j]-mask[j])/255 for j,wt in np.ndenumerate(w)])
         norm_wL1=wL1/n
@@ -369,6 +659,20 @@ class maskMetrics:
         hL1=max(0,wL1-e*rArea/n)
         return hL1
 
+    def getThresholds(self,smat):
+        """
+        * Description: this function finds the distinct pixel values of a grayscale mask, to be used
+                       as the candidate thresholds. For 8- and 16-bit masks the pixel values are counted
+                       with a histogram instead of sorting a floating point copy of the mask.
+        * Inputs:
+        *     smat: the grayscale system output mask matrix
+        * Outputs:
+        *     the sorted array of distinct pixel values, as floats
+        """
+        if np.issubdtype(smat.dtype,np.unsignedinteger) and (smat.dtype.itemsize <= 2):
+            return np.flatnonzero(np.bincount(smat.ravel(),minlength=1)).astype(float)
+        return np.unique(smat).astype(float)
+
     #computes metrics running over the set of thresholds for grayscale mask
     def runningThresholds(self,ref,sys,bns,sns,pns,erodeKernSize,dilateKernSize,distractionKernSize,kern,myprintbuffer):
         """
@@ -392,7 +696,22 @@ class maskMetrics:
         *     tmax: the threshold yielding the maximum MCC 
         """
         smat = sys.matrix
-        uniques=np.unique(smat.astype(float))
+        if sys.constant >= 0:
+            #a mask generated with a constant value need not be scanned for its values
+            uniques=np.array([float(sys.constant)])
+        elif (sys.memo is not 0) and ('thresholds' in sys.memo):
+            #the values of a mask decoded earlier are kept along with its matrix
+            uniques=sys.memo['thresholds']
+        else:
+            uniques=self.getThresholds(smat)
+            if self.outside > 0:
+                #the pixels cropped out are all 255
+                uniques=np.union1d(uniques,[255.])
+            if sys.memo is not 0:
+                sys.memo['thresholds'] = uniques
+        constant = -1
+        if len(uniques) == 1:
+            constant = uniques[0]
 #        if not (self.sys_threshold in uniques) and self.sys_threshold > -10:
         uniques=np.sort(np.append(uniques,-1)) #NOTE: adding the threshold that makes everything white. The threshold that makes everything black is already there.
 
@@ -465,63 +784,67 @@ class maskMetrics:
 #        else:
         #get actual thresholds.
         thresholds=uniques.tolist()
-        thresMets = pd.DataFrame({'Reference Mask':ref.name,
-                                   'System Output Mask':sys.name,
-                                   'Threshold':thresholds,
-                                   'NMM':[-1.]*len(thresholds),
-                                   'MCC':[0.]*len(thresholds),
-                                   'BWL1':[1.]*len(thresholds),
-                                   'TP':[0]*len(thresholds),
-                                   'TN':[0]*len(thresholds),
-                                   'FP':[0]*len(thresholds),
-                                   'FN':[0]*len(thresholds),
-                                   'BNS':btotal,
-                                   'SNS':stotal,
-                                   'PNS':ptotal,
-                                   'N':[0]*len(thresholds)})
-        #for all thresholds
-        rownum=0
-        #sys.binarize(0)
-        for th in thresholds:
-            #sys.bwmat[sys.matrix==th] = 0 #increasing thresholds
-            #thismet = maskMetrics(ref,sys,w,-1)
-            thismet = maskMetrics(ref,sys,w,th)
-            thresMets.set_value(rownum,'Threshold',th)
-            thresMets.set_value(rownum,'NMM',thismet.nmm)
-            thresMets.set_value(rownum,'MCC',thismet.mcc)
-            thresMets.set_value(rownum,'BWL1',thismet.bwL1)
-            thresMets.set_value(rownum,'TP',thismet.conf['TP'])
-            thresMets.set_value(rownum,'TN',thismet.conf['TN'])
-            thresMets.set_value(rownum,'FP',thismet.conf['FP'])
-            thresMets.set_value(rownum,'FN',thismet.conf['FN'])
-            thresMets.set_value(rownum,'N',thismet.conf['N'])
-            rownum=rownum+1
-
-        #generate ROC dataframe for image, preferably from existing library.
-        #TPR = TP/(TP + FN); FPR = FP/(FP + TN)
-        thresMets['TPR'] = 0
-        thresMets['FPR'] = 0
+        nthres = len(thresholds)
+
+        #sweep the confusion measures for all thresholds in one pass over the masks
+        if ref.bwmat is 0:
+            ref.binarize(254)
+        sweep = self.confusion_measures_sweep(ref,sys,w,thresholds,constant)
+        tp = sweep['TP']
+        tn = sweep['TN']
+        fp = sweep['FP']
+        fn = sweep['FN']
+        n = sweep['N']
+
+        #compute the metrics as arrays over all thresholds
+        rgt = tp + fn
+        rneg = fp + tn
+        with np.errstate(divide='ignore',invalid='ignore'):
+            nmm = np.maximum(-1,(tp-fn-fp)/rgt)
+            nmm[rgt == 0] = np.nan
+            #generate ROC values for image. TPR = TP/(TP + FN); FPR = FP/(FP + TN)
+            roc_rows = (rgt > 0) & (rneg > 0)
+            tpr = np.where(roc_rows,tp/rgt,0.)
+            fpr = np.where(roc_rows,fp/rneg,0.)
+        if n == 0:
+            bwL1 = np.nan*np.ones(nthres)
+        else:
+            bwL1 = (fp + fn)/n
+        #MCC is computed at arbitrary precision, so it is taken per threshold
+        mcc = np.array([self.matthews({'TP':tp[i],'TN':tn[i],'FP':fp[i],'FN':fn[i],'N':n}) for i in range(nthres)],dtype=float)
 
         #no need for roc curve if any of the denominator is zero
-        nullRows = thresMets.query("(TP + FN == 0) and (FP + TN == 0)")
-        nonNullRows = thresMets.query("(TP + FN != 0) or (FP + TN != 0)")
+        nonNullRows = (rgt != 0) | (rneg != 0)
 
         #pick max threshold for max MCC
         columns = ['Threshold','NMM','MCC','BWL1','TP','TN','FP','FN','BNS','SNS','PNS','N','TPR','FPR']
-
-        if nonNullRows.shape[0] > 0:
-            tmax = thresMets['Threshold'].iloc[thresMets['MCC'].idxmax()]
-            maxMets = thresMets.query("Threshold=={}".format(tmax))
-            maxNMM = maxMets.iloc[0]['NMM']
-            maxMCC = maxMets.iloc[0]['MCC']
-            maxBWL1 = maxMets.iloc[0]['BWL1']
+        thresMets = pd.DataFrame({'Threshold':thresholds,
+                                  'NMM':nmm,
+                                  'MCC':mcc,
+                                  'BWL1':bwL1,
+                                  'TP':tp,
+                                  'TN':tn,
+                                  'FP':fp,
+                                  'FN':fn,
+                                  'BNS':btotal,
+                                  'SNS':stotal,
+                                  'PNS':ptotal,
+                                  'N':n,
+                                  'TPR':tpr,
+                                  'FPR':fpr},columns=columns)
+
+        if np.any(nonNullRows):
+            imax = np.nanargmax(mcc)
+            tmax = thresholds[imax]
+            maxNMM = nmm[imax]
+            maxMCC = mcc[imax]
+            maxBWL1 = bwL1[imax]
         else:
             tmax = np.nan
             maxNMM = np.nan
             maxMCC = np.nan
             maxBWL1 = np.nan
 
-        thresMets = thresMets[columns]
         myprintbuffer.append("NMM: {}".format(maxNMM))
         myprintbuffer.append("MCC: {}".format(maxMCC))
         myprintbuffer.append("BWL1: {}".format(maxBWL1))
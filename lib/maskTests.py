@@ -32,6 +32,7 @@ import random
 import glymur
 import masks
 import maskMetrics as mm
+from printbuffer import printbuffer
 from decimal import Decimal
 
 class TestImageMethods(ut.TestCase):
@@ -258,6 +259,8 @@ class TestImageMethods(ut.TestCase):
         self.assertTrue(np.array_equal(aggwts,selmask))
         self.assertTrue(np.array_equal(bns,selmask))
         self.assertTrue(np.array_equal(sns,np.ones((100,100))))
+        #bit 9 lies in the second layer
+        self.assertTrue(np.array_equal(rImg.getUniqueValues(),[0,2,256]))
         os.system('rm testrefmask_2ML.jp2')
         
         #2 contained in 1
@@ -410,6 +413,95 @@ class TestImageMethods(ut.TestCase):
         self.assertTrue(np.array_equal(sns,dismask))
         os.system('rm testrefmask_1_2.jp2')
 
+    #large diamond kernels go through the distance transform and should match cv2.erode and cv2.dilate
+    def test_largeKernels(self):
+        print("Testing erosion and dilation by large diamond kernels against cv2...")
+        np.random.seed(2023)
+        for size in [masks.dtKernSize,masks.dtKernSize + 2,41]:
+            kern = masks.getKern('diamond',size)
+            for trial in range(5):
+                img = np.zeros((120,150),dtype=np.uint8)
+                #random rectangles, some of them touching the border
+                for k in range(np.random.randint(1,6)):
+                    y = np.random.randint(-10,110)
+                    x = np.random.randint(-10,140)
+                    img[max(y,0):y+np.random.randint(5,40),max(x,0):x+np.random.randint(5,40)] = 255
+                self.assertTrue(np.array_equal(masks.erodeMask(img,'diamond',size),cv2.erode(img,kern,iterations=1)))
+                self.assertTrue(np.array_equal(masks.dilateMask(img,'diamond',size),cv2.dilate(img,kern,iterations=1)))
+
+            #empty and full masks
+            for value in [0,1,255]:
+                img = value*np.ones((60,70),dtype=np.uint8)
+                self.assertTrue(np.array_equal(masks.erodeMask(img,'diamond',size),cv2.erode(img,kern,iterations=1)))
+                self.assertTrue(np.array_equal(masks.dilateMask(img,'diamond',size),cv2.dilate(img,kern,iterations=1)))
+
+    #the one-pass bit plane lookups should match the per-bit loops on randomized masks
+    def test_bitPlanes(self):
+        print("Testing one-pass bit plane lookups against the per-bit loops...")
+        random.seed(2021)
+        np.random.seed(2021)
+        for trial in range(12):
+            n_layers = [1,2,3][trial % 3]
+            n_bits = 8*n_layers
+            dims = (60,80)
+            if n_layers > 1:
+                dims = (60,80,n_layers)
+            #sparse regions of random bits, with the regions overlapping
+            maskBits = np.zeros(dims,dtype=np.uint8)
+            for k in range(random.randint(1,8)):
+                b = random.randint(0,n_bits-1)
+                y = random.randint(0,50)
+                x = random.randint(0,70)
+                if n_layers > 1:
+                    maskBits[y:y+10,x:x+12,b//8] |= 1 << (b % 8)
+                else:
+                    maskBits[y:y+10,x:x+12] |= 1 << b
+
+            #the journal holds most of the bits, and the last trials select none of them
+            bitplanes = sorted(random.sample(range(1,n_bits+1),n_bits - random.randint(0,2)))
+            evaluated = [random.choice(['Y','N']) for b in bitplanes]
+            if trial >= 9:
+                evaluated = ['N' for b in bitplanes]
+            journal_df = pd.DataFrame({'JournalName':'Foo','Operation':'PasteSplice','BitPlane':bitplanes,'Sequence':range(len(bitplanes)),'Evaluated':evaluated})
+
+            glymur.Jp2k('testrefmask_bits.jp2',maskBits)
+            rImg = masks.refmask('testrefmask_bits.jp2',jData=journal_df)
+            os.system('rm testrefmask_bits.jp2')
+
+            #the selected and unselected pixels, one bit at a time
+            selected = np.zeros(dims[:2],dtype=bool)
+            unselected = np.zeros(dims[:2],dtype=bool)
+            for p in range(n_bits):
+                b = 1 << p
+                if n_layers > 1:
+                    layer = int(math.log(b,2)//8)
+                    pixels = (rImg.matrix[:,:,layer] & (b >> layer*8)) > 0
+                else:
+                    pixels = (rImg.matrix & b) > 0
+                if b in rImg.bitlist:
+                    selected = selected | pixels
+                else:
+                    unselected = unselected | pixels
+
+            if trial >= 9:
+                self.assertEqual(rImg.bitlist,[])
+            self.assertTrue(np.array_equal(rImg.getBitPixels(rImg.selectedBits),selected))
+            self.assertTrue(np.array_equal(rImg.getBitPixels(~rImg.selectedBits),unselected))
+            self.assertEqual(rImg.regionIsPresent(),np.any(selected))
+
+            bns = rImg.boundaryNoScoreRegion(3,5,'box')['wimg']
+            self.assertTrue(np.array_equal(rImg.bwmat,255*(1-selected.astype(np.uint8))))
+            bwmat = rImg.bwmat
+            bnscompare = 1 - (255 - masks.erodeMask(255 - bwmat,'box',3) - (255 - masks.dilateMask(255 - bwmat,'box',5)))/255
+            self.assertTrue(np.array_equal(bns,bnscompare))
+
+            sns = rImg.unselectedNoScoreRegion(3,5,'box')
+            snscompare = np.ones(dims[:2],dtype=np.uint8)
+            if np.any(rImg.matrix) and np.any(unselected):
+                snscompare = (1 - masks.dilateMask(unselected.astype(np.uint8),'box',5)) | masks.erodeMask(selected.astype(np.uint8),'box',3)
+            self.assertTrue(np.array_equal(sns,snscompare))
+            self.assertEqual(sns.dtype,np.uint8)
+
     def test_metrics(self):
         random.seed(1998)
         eps=10**-10 #account for floating point errors
@@ -712,5 +804,116 @@ class TestImageMethods(ut.TestCase):
 
         print("CASE 5 testing complete.")
 
+    def sweepMasks(self):
+        """
+        * Description: builds the reference, randomized system output, and weight masks shared by the threshold sweep tests
+        * Outputs:
+        *     the reference mask, system output mask, and weight matrix
+        """
+        np.random.seed(1998)
+        refImg = 255*np.ones((100,100),dtype=np.uint8)
+        refImg[61:81,31:46] = 0
+        params = [cv.CV_IMWRITE_PNG_COMPRESSION,0]
+        cv2.imwrite('testImg.png',refImg,params)
+        rImg = masks.refmask_color('testImg.png',readopt=0)
+        rImg.binarize(254)
+        sImg = masks.mask('testImg.png')
+        sImg.matrix = np.random.randint(0,256,rImg.get_dims()).astype(np.uint8)
+        wts = (np.random.uniform(0,1,rImg.get_dims()) > 0.2).astype(np.uint8)
+        return rImg,sImg,wts
+
+    def test_sweep(self):
+        print("Testing single-pass threshold sweep against thresholded confusion measures...")
+        rImg,sImg,wts = self.sweepMasks()
+        thresholds = [-1] + np.unique(sImg.matrix).tolist()
+        m = mm.maskMetrics(rImg,sImg,wts)
+        sweep = m.confusion_measures_sweep(rImg,sImg,wts,thresholds)
+        for i,th in enumerate(thresholds):
+            conf = m.confusion_measures(rImg,sImg,wts,th)
+            for c in ['TP','TN','FP','FN']:
+                self.assertEqual(sweep[c][i],conf[c])
+            self.assertEqual(sweep['N'],conf['N'])
+
+    def test_packed(self):
+        print("Testing bit-packed confusion measures against thresholded confusion measures...")
+        rImg,sImg,wts = self.sweepMasks()
+        m = mm.maskMetrics(rImg,sImg,wts)
+        for th in [-1] + np.unique(sImg.matrix).tolist():
+            self.assertEqual(m.confusion_measures_packed(rImg,sImg,wts,th),m.confusion_measures(rImg,sImg,wts,th))
+
+    def test_rle(self):
+        print("Testing run-length encoded confusion measures against thresholded confusion measures...")
+        rImg,sImg,wts = self.sweepMasks()
+        m = mm.maskMetrics(rImg,sImg,wts)
+        refRuns = mm.encodeRuns(rImg,wts)
+        for th in [-1] + np.unique(sImg.matrix).tolist():
+            conf = m.confusion_measures(rImg,sImg,wts,th)
+            self.assertEqual(m.confusion_measures_rle(rImg,sImg,wts,th),conf)
+            self.assertEqual(m.confusion_measures_rle(rImg,sImg,wts,th,refRuns),conf)
+
+        runs = masks.rleMask(sImg.matrix <= 128)
+        self.assertTrue(np.array_equal(runs.toDense(),sImg.matrix <= 128))
+        self.assertEqual(runs.intersection(masks.rleMask(wts)).area(),np.sum((sImg.matrix <= 128) & (wts == 1)))
+
+    #the histogrammed thresholds should match the sorted distinct values for any mask type
+    def test_thresholds(self):
+        print("Testing histogrammed thresholds for each mask type...")
+        rImg,sImg,wts = self.sweepMasks()
+        m = mm.maskMetrics(rImg,sImg,wts)
+        for dtype in [np.uint8,np.uint16,np.float64]:
+            smat = sImg.matrix.astype(dtype)
+            self.assertTrue(np.array_equal(m.getThresholds(smat),np.unique(smat.astype(float))))
+        self.assertTrue(np.array_equal(m.getThresholds(np.array([[3,65535],[3,7]],dtype=np.uint16)),[3.,7.,65535.]))
+
+    #a uniform mask swept analytically should match the generic sweep
+    def test_constantSweep(self):
+        print("Testing the threshold sweep of a constant mask against the generic sweep...")
+        rImg,sImg,wts = self.sweepMasks()
+        m = mm.maskMetrics(rImg,sImg,wts)
+        vImg = masks.mask(masks.virtualMask('whitemask.png',rImg.get_dims(),255))
+        self.assertEqual(vImg.constant,255)
+        self.assertEqual(vImg.matrix.shape,tuple(rImg.get_dims()))
+        thresholds = [-1,255]
+        sweep = m.confusion_measures_sweep(rImg,vImg,wts,thresholds,constant=255)
+        vImg.constant = -1
+        generic = m.confusion_measures_sweep(rImg,vImg,wts,thresholds)
+        for c in ['TP','TN','FP','FN']:
+            self.assertTrue(np.array_equal(sweep[c],generic[c]))
+
+    #scoring within the region of interest should match scoring the full masks
+    def test_cropROI(self):
+        print("Testing scoring within the region of interest against scoring the full masks...")
+        rImg,sImg,wts = self.sweepMasks()
+        sImg.matrix[:] = 255
+        sImg.matrix[50:70,25:40] = np.random.randint(0,256,(20,15))
+        bns = np.ones(rImg.get_dims(),dtype=np.uint8)
+        bns[60:82,30:47] = 0
+        bns[61:81,31:46] = 1
+        sns = np.ones(rImg.get_dims(),dtype=np.uint8)
+        wts = cv2.bitwise_and(bns,sns)
+        full,fullth = mm.maskMetrics(rImg,sImg,wts,128).runningThresholds(rImg,sImg,bns,sns,0,0,0,0,'box',printbuffer(0))
+        cref,csys,cwts,cbns,csns,cpns,outside = mm.cropToROI(rImg,sImg,wts,bns,sns,0)
+        self.assertEqual(cwts.shape,(32,22))
+        cm = mm.maskMetrics(cref,csys,cwts,128,outside=outside)
+        self.assertEqual(cm.conf,mm.maskMetrics(rImg,sImg,wts,128).conf)
+        crop,cropth = cm.runningThresholds(cref,csys,cbns,csns,cpns,0,0,0,'box',printbuffer(0))
+        self.assertEqual(cropth,fullth)
+        self.assertTrue(full.equals(crop))
+        self.assertEqual(mm.maskMetrics.grayscaleWeightedL1(cref,csys,cwts),mm.maskMetrics.grayscaleWeightedL1(rImg,sImg,wts))
+
+    #masks read while the decode memo is enabled share a single decode of the file
+    def test_decodeMemo(self):
+        print("Testing shared decodes of masks read with the decode memo enabled...")
+        self.sweepMasks()
+        masks.decodeMemo = {}
+        try:
+            mImg1 = masks.mask('testImg.png')
+            mImg1.matrix[0,0] = 1
+            mImg2 = masks.mask('testImg.png')
+            self.assertTrue(mImg2.memo is mImg1.memo)
+            self.assertEqual(mImg2.matrix[0,0],255)
+        finally:
+            masks.decodeMemo = 0
+
 #if __name__ == '__main__':
 #    ut.main()
@@ -36,15 +36,28 @@ from scipy import misc
 from decimal import Decimal
 
 debug_mode=False
+
+#decoded mask files kept for reuse while the same masks are scored several times over, keyed by
+#the file name and read option. 0 when disabled
+decodeMemo = 0
 printq = lambda *a:None
 if debug_mode:
     def printq(string):
         print(string)
 
 #returns a kernel matrix
+#the kernels built so far, keyed by shape and size
+kernCache = {}
+#the size from which diamond kernels are applied to binary masks through the distance transform.
+#Past this size it is faster than cv2.erode and cv2.dilate, whose cost grows with the kernel area
+dtKernSize = 31
+#the city block distance type of cv2.distanceTransform, which OpenCV 2.4 only names in cv2.cv
+distL1 = getattr(cv2,'DIST_L1',None) or cv2.cv.CV_DIST_L1
+
 def getKern(kernopt,size):
     """
-    * Description: gets the kernel to perform erosion and/or dilation
+    * Description: gets the kernel to perform erosion and/or dilation. Each kernel is built once and
+                   shared across calls, so it must not be modified
     * Input:
     *     kernopt: the shape of the kernel to be generated. Can be one of the following:
                    'box','disc','diamond','gaussian','line'
@@ -59,34 +72,129 @@ def getKern(kernopt,size):
         raise Exception('ERROR: One of your kernel sizes is not an odd integer.')
     kern = 0
     kernopt=kernopt.lower()
+    if (kernopt,size) in kernCache:
+        return kernCache[(kernopt,size)]
     if kernopt=='box':
         kern=cv2.getStructuringElement(cv2.MORPH_RECT,(size,size))
     elif kernopt=='disc':
         kern=cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(size,size))
     elif kernopt=='diamond':
-        #build own kernel out of numpy ndarray
-        kern=np.ones((size,size),dtype=np.uint8)
+        #build own kernel out of numpy ndarray. Keep the pixels within the center's city block distance
         center=(size-1)/2
-        for idx,x in np.ndenumerate(kern):
-            if abs(idx[0]-center) + abs(idx[1]-center) > center:
-                kern[idx]=0
+        dist=np.abs(np.arange(size) - center)
+        kern=(dist[:,np.newaxis] + dist[np.newaxis,:] <= center).astype(np.uint8)
     elif kernopt=='gaussian':
         sigma=0.3 #as used in the R implementation
         center=(size-1)/2
-        x=np.asmatrix(np.linspace(-center,center,size))
-        x=np.dot(x.transpose(),np.asmatrix(np.ones(size)))
-        xsq=np.square(x)
-        z=np.exp(-(xsq+xsq.transpose())/(2*sigma**2))
+        xsq=np.square(np.linspace(-center,center,size))
+        z=np.exp(-(xsq[:,np.newaxis] + xsq[np.newaxis,:])/(2*sigma**2))
         kern=z/np.sum(z) #final normalization
-        kern[kern > 0] = 1
-        kern = np.uint8(kern)
+        kern = (kern > 0).astype(np.uint8)
     elif kernopt=='line':
         #45 degree line, or identity matrix
-        kern=np.eye(erodeKernSize,dtype=np.uint8)
+        kern=np.eye(size,dtype=np.uint8)
     else:
         print("The kernel '{}' is not recognized. Please enter a valid kernel from the following: ['box','disc','diamond','gaussian','line'].".format(kernopt))
+        return kern
+    kernCache[(kernopt,size)] = kern
     return kern
 
+def binaryValue(img,kernopt,size):
+    """
+    * Description: checks whether the image can be eroded or dilated through the distance transform
+    * Input:
+    *     img: the image to be eroded or dilated
+    *     kernopt: the shape of the kernel
+    *     size: the length of the kernel
+    * Output:
+    *     the nonzero value of the image if it is a binary uint8 image and the kernel is a large diamond,
+          0 if the image is all zero, and -1 if cv2 must be used
+    """
+    if (kernopt.lower() != 'diamond') or (size < dtKernSize) or (img.dtype != np.uint8) or (len(img.shape) != 2):
+        return -1
+    value = img.max()
+    if np.any((img != 0) & (img != value)):
+        return -1
+    return value
+
+def erodeMask(img,kernopt,size):
+    """
+    * Description: erodes the image with the kernel from getKern. Binary images are eroded by large diamond
+                   kernels through the distance transform, with results identical to cv2.erode
+    * Input:
+    *     img: the single-channel image to be eroded
+    *     kernopt: the shape of the kernel. See getKern
+    *     size: the length of the kernel
+    * Output:
+    *     the eroded image
+    """
+    value = binaryValue(img,kernopt,size)
+    if value == -1:
+        return cv2.erode(img,getKern(kernopt,size),iterations=1)
+    if value == 0:
+        return img.copy()
+    #keep the pixels further from the background than the radius of the kernel, in city block distance.
+    #As with cv2.erode, the area outside of the image does not count as background
+    dist = cv2.distanceTransform(img,distL1,3)
+    return np.where(dist > (size-1)/2,img,np.uint8(0))
+
+def dilateMask(img,kernopt,size):
+    """
+    * Description: dilates the image with the kernel from getKern. Binary images are dilated by large diamond
+                   kernels through the distance transform, with results identical to cv2.dilate
+    * Input:
+    *     img: the single-channel image to be dilated
+    *     kernopt: the shape of the kernel. See getKern
+    *     size: the length of the kernel
+    * Output:
+    *     the dilated image
+    """
+    value = binaryValue(img,kernopt,size)
+    if value == -1:
+        return cv2.dilate(img,getKern(kernopt,size),iterations=1)
+    if value == 0:
+        return img.copy()
+    #set the pixels within the radius of the kernel from the foreground, in city block distance
+    dist = cv2.distanceTransform((img == 0).astype(np.uint8),distL1,3)
+    return np.where(dist <= (size-1)/2,value,np.uint8(0))
+
+def packLayers(mat):
+    """
+    * Description: views the layers of a 3-dimensional uint8 matrix as one integer per pixel, with
+                   layer l in bits 8*l through 8*l+7. A 4-layer contiguous matrix is viewed without copying;
+                   other matrices are padded to 4 or 8 layers first
+    * Input:
+    *     mat: the HxWxC uint8 matrix to pack, with at most 8 layers
+    * Output:
+    *     the HxW uint32 (or uint64 past 4 layers) matrix of packed layers
+    """
+    n_layers = mat.shape[2]
+    if n_layers > 8:
+        raise ValueError("Cannot pack {} layers into one integer per pixel.".format(n_layers))
+    width = 4
+    if n_layers > 4:
+        width = 8
+    if n_layers == width:
+        padded = np.ascontiguousarray(mat,dtype=np.uint8)
+    else:
+        padded = np.zeros((mat.shape[0],mat.shape[1],width),dtype=np.uint8)
+        padded[:,:,:n_layers] = mat
+    #little-endian, so that the first layer holds the lowest bits
+    return padded.view('<u{}'.format(width))[:,:,0]
+
+def distinctValues(mat):
+    """
+    * Description: gets the distinct values of an integer matrix in time linear in its size, by counting the
+                   values of a uint8 matrix and hashing those of wider matrices, rather than by sorting the matrix
+    * Input:
+    *     mat: the integer matrix
+    * Output:
+    *     the sorted distinct values, of the same dtype as the matrix
+    """
+    if mat.dtype == np.uint8:
+        return np.flatnonzero(np.bincount(mat.ravel(),minlength=256)).astype(np.uint8)
+    return np.sort(pd.unique(mat.ravel())).astype(mat.dtype)
+
 def count_bits(n):
     """
     * Description: counts the number of bits in an unsigned integer.
@@ -111,6 +219,51 @@ def count_bits(n):
             c = c + 1
     return c
 
+class virtualMask(object):
+    """
+    This class describes a mask of a single constant value that is held in memory only. It can be
+    passed to the mask constructors in place of a mask file name.
+    """
+    def __init__(self,n,dims,value):
+        """
+        Constructor
+
+        Attributes:
+        - n: the name of the mask file, were it to be written
+        - dims: the height and width of the mask
+        - value: the constant pixel value of the mask
+        """
+        self.name = n
+        self.dims = dims
+        self.value = value
+
+    def __str__(self):
+        return self.name
+
+    def read(self,readopt=0):
+        """
+        * Description: generates the matrix of the mask as it would be read from file
+        * Inputs:
+        *     readopt: the option to read in the mask as in the mask constructor. JPEG2000 masks
+                       are always read as they are stored
+        * Output:
+        *     the matrix of the mask
+        """
+        shape = (self.dims[0],self.dims[1])
+        if (readopt == 1) and (self.name.split('.')[-1].lower() != 'jp2'):
+            shape = (self.dims[0],self.dims[1],3)
+        return np.full(shape,self.value,dtype=np.uint8)
+
+    def write(self):
+        """
+        * Description: writes the mask to file under its name, for reports that link to it
+        """
+        mymat = self.read()
+        if self.name.split('.')[-1].lower() == 'jp2':
+            glymur.Jp2k(self.name,mymat)
+        else:
+            cv2.imwrite(self.name,mymat)
+
 class mask(object):
     """
     This class is used to read in and hold the system mask and its relevant parameters.
@@ -120,12 +273,29 @@ class mask(object):
         Constructor
 
         Attributes:
-        - n: the name of the mask file
+        - n: the name of the mask file, or a virtualMask to be generated in memory
         - readopt: the option to read in the reference mask file. Choose 1 to read in
                    as a 3-channel BGR (RGB with reverse indexing) image, 0 to read as a
                    single-channel grayscale
         """
+        #the constant value of the mask if generated, -1 otherwise
+        self.constant = -1
+        #the decodeMemo entry of the mask, shared with other mask objects over the same file
+        self.memo = 0
+        if isinstance(n,virtualMask):
+            self.name = n.name
+            self.matrix = n.read(readopt)
+            self.constant = n.value
+            self.bwmat = 0
+            return
+
         self.name=n
+        if (decodeMemo is not 0) and ((n,readopt) in decodeMemo):
+            self.memo = decodeMemo[(n,readopt)]
+            self.matrix = self.memo['matrix'].copy()
+            self.bwmat = 0
+            return
+
         ext = self.name.split('.')[-1].lower()
         if (ext == 'arw') or (ext == 'nef'):
             self.matrix=rawpy.imread(n).postprocess()
@@ -147,6 +317,9 @@ class mask(object):
             if isinstance(self,refmask) or isinstance(self,refmask_color):
                 masktype = 'Reference'
             print("{} mask file {} is unreadable.".format(masktype,n))
+        elif decodeMemo is not 0:
+            self.memo = {'matrix':self.matrix.copy()}
+            decodeMemo[(n,readopt)] = self.memo
         self.bwmat = 0 #initialize bw matrix to zero. Substitute as necessary.
 
     def get_dims(self):
@@ -211,13 +384,14 @@ class mask(object):
 
         if len(img.shape) == 3:
 #            colors = list(set(tuple(p) for m2d in img for p in m2d))
-            img1L = img[:,:,0]*65536+img[:,:,1]*256+img[:,:,2]
-            colors = np.unique(img1L)
-            colors = [(c//65536,(c % 65536)//256,c % 256) for c in colors]
+            #pack the channels in reverse so that the colors sort by the first channel, then the second and third
+            img1L = packLayers(img[:,:,2::-1])
+            colors = distinctValues(img1L)
+            colors = [(c >> 16,(c >> 8) % 256,c % 256) for c in colors]
             if (255,255,255) in colors:
                 colors.remove((255,255,255))
         elif len(img.shape) == 2:
-            colors = np.unique(img)
+            colors = distinctValues(img).tolist()
             if 255 in colors:
                 colors.remove(255) 
 
@@ -373,6 +547,9 @@ class refmask(mask):
         #rework the init and other functions to support bit masking
         #default to all regions if it is 0
         self.bitlist=0
+        self.selectedBits=0
+        #the bit planes packed into one integer per pixel, computed on first use
+        self.packed=0
         self.is_multi_layer = len(self.matrix.shape) == 3
 
         if jData is not 0:
@@ -418,6 +595,7 @@ class refmask(mask):
             if 'None' in bitlist:
                 bitlist.remove('None')
             self.bitlist = [ 1 << (int(b)-1) for b in bitlist ]
+            self.selectedBits = reduce(lambda x,y: x | y,self.bitlist,0)
 
 #            purposes = list(jData['Purpose'])
 #            purposes_unique = []
@@ -431,35 +609,39 @@ class refmask(mask):
         """
         * Description: return unique values in the matrix
         """
-        if self.is_multi_layer:
-            singlematrix = np.zeros(self.get_dims(),dtype=np.uint8)
-            const_factor = 1
-            for i in range(self.matrix.shape[2]):
-                const_factor = 1 << 8*i
-                singlematrix = singlematrix + const_factor*self.matrix[:,:,i]
-            unique_px = np.unique(singlematrix)
-        else:
-            unique_px = np.unique(self.matrix)
-        return unique_px
+        return distinctValues(self.getPackedMatrix())
+
+    def getPackedMatrix(self):
+        """
+        * Description: return the bit planes of the matrix as one integer per pixel, with the bits of
+                       layer l shifted up by 8*l. Packed once and kept for the other bit plane lookups
+        """
+        if self.packed is 0:
+            if self.is_multi_layer:
+                self.packed = packLayers(self.matrix)
+            else:
+                self.packed = self.matrix
+        return self.packed
+
+    def getBitPixels(self,bits):
+        """
+        * Description: return the boolean matrix of the pixels with any of the bits set, in one pass
+                       over the packed matrix
+        * Inputs:
+        *     bits: the bits to look for, OR'd into one integer
+        """
+        packed = self.getPackedMatrix()
+        #drop the bits past those held in the matrix
+        bits = bits & ((1 << 8*packed.dtype.itemsize) - 1)
+        return (packed & packed.dtype.type(bits)) > 0
 
     def regionIsPresent(self):
         """
         * Description: return True if a scoreable region is present. Does not account for no-score zones yet. False if otherwise.
         """
-        presence = 0
-        rmat = self.matrix
-        bits = self.bitlist
-        for b in bits:
-            if len(rmat.shape) == 3:
-                #modify to account for multi-channel
-                bpos = int(math.log(b,2))
-                layer = bpos//8
-                presence = presence + np.sum(rmat[:,:,layer] & (b >> 8*layer))
-            else:
-                presence = presence + np.sum(rmat & b)
-            if presence > 0:
-                return True
-        return False
+        if self.bitlist is 0:
+            return bool(np.any(self.getPackedMatrix()))
+        return bool(np.any(self.getBitPixels(self.selectedBits)))
 
     def getColor(self,b):
         if count_bits(b) != 1:
@@ -587,42 +769,23 @@ class refmask(mask):
 
         mymat = 0
 #        if (len(self.matrix.shape) == 3) and (self.purposes is not 'all'):
-        selfmat = self.matrix
-        is_multi_layer = len(self.matrix.shape) == 3
-
         if self.bitlist is not 0:
-            #thorough computation for individual bits 
-            mymat = np.zeros(self.get_dims(),dtype=np.uint8)
-            for b in self.bitlist:
-#                mymat = mymat & (~((selfmat[:,:,0]==c[0]) & (selfmat[:,:,1]==c[1]) & (selfmat[:,:,2]==c[2]))).astype(np.uint8)
-                if is_multi_layer:
-                    layer = int(math.log(b,2)//8)
-                    pixels = (self.matrix[:,:,layer] & (b >> layer*8)) > 0
-                else:
-                    pixels = (selfmat & b) > 0
-
-                mymat = mymat | pixels
-            mymat = 255*(1-mymat).astype(np.uint8)
+            #all the selected bits in one pass
+            mymat = self.getBitPixels(self.selectedBits).astype(np.uint8)
+            mymat = 255*(1-mymat)
         else:
-            if is_multi_layer:
-                for l in range(self.matrix.shape[2]):
-                    mymat = mymat | (self.matrix[:,:,l] > 0)
-                mymat = 255*(1-(mymat > 0))
-            else:
-                mymat = 255*(1-(selfmat > 0))
+            mymat = 255*(1-(self.getPackedMatrix() > 0))
         self.bwmat = mymat
 
         #note: erodes relative to 0. We have to invert it twice to get the actual effects we want relative to 255.
         kern = kern.lower()
         if erodeKernSize > 0:
-            eKern=getKern(kern,erodeKernSize)
-            eImg=255-cv2.erode(255-mymat,eKern,iterations=1)
+            eImg=255-erodeMask(255-mymat,kern,erodeKernSize)
         else:
             eImg=mymat
 
         if dilateKernSize > 0:
-            dKern=getKern(kern,dilateKernSize)
-            dImg=255-cv2.dilate(255-mymat,dKern,iterations=1)
+            dImg=255-dilateMask(255-mymat,kern,dilateKernSize)
         else:
             dImg=mymat
 
@@ -647,10 +810,8 @@ class refmask(mask):
         *     weights: the weighted matrix computed from the distraction zones
         """
 
-        mymat = self.matrix
         dims = self.get_dims()
         
-        is_multi_layer = len(self.matrix.shape) == 3
         #take all distinct 3-channel colors in mymat, subtract the colors that are reported, and then iterate
 #        notcolors = mask.getColors(mymat)
 #        if is_multi_layer:
@@ -663,71 +824,29 @@ class refmask(mask):
 #        else:
 #            notcolors = np.unique(mymat)
 
-        notcolors = self.getUniqueValues()
-        printq("Colors to consider: {}".format(notcolors))
-        top_px = max(notcolors)
-
         printq(self.journalData)
-        if (np.array_equal(mymat,np.zeros(dims))) or (self.bitlist is 0):
+        if (self.bitlist is 0) or not np.any(self.getPackedMatrix()):
             weights = np.ones(dims,dtype=np.uint8)
             return weights
 
-        #decompose into individual bit channels.
-        #but this won't represent all colors, so max with the max bit in self.bitlist
-        top_bit = max([int(math.floor(math.log(top_px,2))),int(math.floor(math.log(max(self.bitlist),2)))]) + 1
-#        top_bit = int(math.floor(math.log(max(self.bitlist),2))) + 1
-        notcolors = range(0,top_bit)
-        notcolors = [ 1 << b for b in notcolors ]
-        printq("Colors to consider: {}".format(notcolors))
-
-#        for c in self.colors:
-        scored = np.zeros((dims[0],dims[1]),dtype=np.uint8)
-
-        for c in self.bitlist:
-#            if tuple(c) in notcolors:
-            if is_multi_layer:
-                layer = int(math.log(c,2)//8)
-                printq("Multi-layered. Accessing layer {} to get bit {}".format(layer,c))
-                pixels = (mymat[:,:,layer] & (c >> layer*8)) > 0
-            else:
-                printq("Single-layered. Accessing bit {}".format(c))
-                pixels = (mymat & c) > 0
-
-            scored = scored | pixels
-            if c in notcolors:
-                notcolors.remove(c)
-            #skip the colors that aren't present, in case they haven't made it to the mask in question
-
-        printq("Excluded colors: {}".format(notcolors))
-        if len(notcolors)==0:
+        #the selected and unselected bits each in one pass. The unselected bits are all the bits present
+        #in the mask but not selected, so any bit past those selected is unselected
+        scored = self.getBitPixels(self.selectedBits).astype(np.uint8)
+        mybin = self.getBitPixels(~self.selectedBits).astype(np.uint8)
+        if not np.any(mybin):
             weights = np.ones(dims,dtype=np.uint8)
             return weights
 
-        #edit for bit masks
-        mybin = np.zeros((dims[0],dims[1]),dtype=np.uint8)
-        for c in notcolors:
-            #set equal to cs
-#            tbin = ~((mymat[:,:,0]==c[0]) & (mymat[:,:,1]==c[1]) & (mymat[:,:,2]==c[2]))
-            if is_multi_layer:
-                layer = int(math.log(c,2)//8)
-                pixels = (mymat[:,:,layer] & (c >> layer*8)) > 0
-            else:
-                pixels = (mymat & c) > 0
-            mybin = mybin | pixels
-
-        mybin = mybin.astype(np.uint8)
         #note: erodes relative to 0. We have to invert it twice to get the actual effects we want relative to 255.
         #eroded region must be set to 1 and must not be overrideen by the unselected NSR
         kern = kern.lower()
         if erodeKernSize > 0:
-            eKern=getKern(kern,erodeKernSize)
-            eImg = cv2.erode(scored,eKern,iterations=1)
+            eImg = erodeMask(scored,kern,erodeKernSize)
         else:
             eImg = scored
 
         if dilateKernSize > 0:
-            dKern=getKern(kern,dilateKernSize)
-            dImg = 1 - cv2.dilate(mybin,dKern,iterations=1)
+            dImg = 1 - dilateMask(mybin,kern,dilateKernSize)
         else:
             dImg = 1-mybin
 
@@ -837,13 +956,11 @@ class refmask_color(mask):
         #note: erodes relative to 0. We have to invert it twice to get the actual effects we want relative to 255.
         kern = kern.lower()
         if erodeKernSize > 0:
-            eKern=getKern(kern,erodeKernSize)
-            eImg=255-cv2.erode(255-mymat,eKern,iterations=1)
+            eImg=255-erodeMask(255-mymat,kern,erodeKernSize)
         else:
             eImg = mymat
         if dilateKernSize > 0:
-            dKern=getKern(kern,dilateKernSize)
-            dImg=255-cv2.dilate(255-mymat,dKern,iterations=1)
+            dImg=255-dilateMask(255-mymat,kern,dilateKernSize)
         else:
             dImg = mymat
 
@@ -897,17 +1014,126 @@ class refmask_color(mask):
         kern = kern.lower()
         printq(erodeKernSize)
         if erodeKernSize > 0:
-            eKern=getKern(kern,erodeKernSize)
-            eImg=cv2.erode(scoredregion,eKern,iterations=1)
+            eImg=erodeMask(scoredregion,kern,erodeKernSize)
         else:
             eImg = scoredregion
         printq(dilateKernSize)
         if dilateKernSize > 0:
-            dKern=getKern(kern,dilateKernSize)
-            dImg=1-cv2.dilate(1-mybin,dKern,iterations=1)
+            dImg=1-dilateMask(1-mybin,kern,dilateKernSize)
         else:
             dImg = mybin
         dImg=dImg | eImg
         weights=dImg.astype(np.uint8)
 
         return weights
+
+class refmask_cached(mask):
+    """
+    This class holds a reference mask restored from the reference mask cache. Only the binarized
+    reference mask is kept; the no-score zones are restored alongside it by the caller.
+    It inherits from the (system output) mask above.
+    """
+    def __init__(self,n,bwmat):
+        """
+        Constructor
+
+        Attributes:
+        - n: the name of the reference mask file
+        - bwmat: the cached binarized reference mask
+        """
+        self.name=n
+        self.matrix=bwmat
+        self.bwmat=bwmat
+        self.constant=-1
+        self.memo=0
+
+    def regionIsPresent(self):
+        #only masks with a scoreable region are restored from the cache
+        return True
+
+class rleMask(object):
+    """
+    This class holds a binary mask as the runs of set pixels in each of its rows. The runs are kept in
+    two arrays of start and (exclusive) end positions, numbered as in the flattened mask, so that a run
+    never spans two rows. Masks made mostly of long runs take a small fraction of the dense memory.
+    """
+    def __init__(self,mat):
+        """
+        Constructor
+
+        Attributes:
+        - mat: the 2-dimensional matrix to encode. Nonzero pixels are set
+        """
+        self.dims = mat.shape
+        height,width = mat.shape
+        dtype = np.int32
+        if height*(width + 1) >= 2**31:
+            dtype = np.int64
+        #mark the changes in each row, with the rows padded with unset pixels on both sides
+        padded = np.zeros((height,width + 2),dtype=np.int8)
+        padded[:,1:-1] = mat != 0
+        changes = np.diff(padded,axis=1)
+        starts = np.flatnonzero(changes == 1).astype(dtype)
+        ends = np.flatnonzero(changes == -1).astype(dtype)
+        #renumber from the width + 1 changes in each row to the width pixels in each row. An end past the
+        #last column takes the position of the first pixel of the next row
+        self.starts = starts - starts//(width + 1)
+        self.ends = ends - ends//(width + 1)
+
+    @staticmethod
+    def fromRuns(dims,starts,ends):
+        """
+        * Description: builds the encoded mask from its runs
+        * Inputs:
+        *     dims: the dimensions of the mask
+        *     starts: the array of start positions of the runs
+        *     ends: the array of end positions of the runs
+        * Output:
+        *     the encoded mask
+        """
+        m = rleMask.__new__(rleMask)
+        m.dims = dims
+        m.starts = starts
+        m.ends = ends
+        return m
+
+    def toDense(self):
+        """
+        * Description: decodes the mask
+        * Output:
+        *     the dense boolean matrix of the mask
+        """
+        npx = self.dims[0]*self.dims[1]
+        edges = np.bincount(self.starts,minlength=npx + 1) - np.bincount(self.ends,minlength=npx + 1)
+        return (np.cumsum(edges[:npx]) > 0).reshape(self.dims)
+
+    def area(self):
+        """
+        * Description: counts the set pixels of the mask
+        * Output:
+        *     the number of set pixels
+        """
+        return np.sum(self.ends - self.starts,dtype=np.int64)
+
+    def intersection(self,other):
+        """
+        * Description: intersects the mask with another of the same dimensions by merging their runs,
+                       without decoding either mask
+        * Inputs:
+        *     other: the other encoded mask
+        * Output:
+        *     the encoded mask of the pixels set in both masks
+        """
+        pos = np.concatenate([self.starts,other.starts,self.ends,other.ends])
+        delta = np.concatenate([np.ones(len(self.starts) + len(other.starts),dtype=np.int8),
+                                -np.ones(len(self.ends) + len(other.ends),dtype=np.int8)])
+        #at the same position, runs end before others start
+        order = np.lexsort((delta,pos))
+        pos = pos[order]
+        depth = np.cumsum(delta[order])
+        #the pixels are set in both masks wherever both runs are open
+        both = np.flatnonzero(depth[:-1] == 2)
+        starts = pos[both]
+        ends = pos[both + 1]
+        keep = ends > starts
+        return rleMask.fromRuns(self.dims,starts[keep],ends[keep])
@@ -31,6 +31,9 @@ import pandas as pd
 import os
 import sys
 import random
+import pickle
+import shutil
+import tempfile
 import multiprocessing
 from decimal import Decimal
 from numpngw import write_apng
@@ -41,8 +44,11 @@ import masks
 import Render as p
 from collections import OrderedDict
 from printbuffer import printbuffer
+from stageTrace import stageTrace
+from svgPlot import svgPlot,niceTicks,autoLimits
 from detMetrics import Metrics as dmets
 from maskMetrics import maskMetrics as maskMetrics1
+from maskMetrics import cropToROI,packPlanes,encodeRuns
 from maskMetrics_old import maskMetrics as maskMetrics2
 #from conn2db import *
 
@@ -50,8 +56,210 @@ debug_mode = True
 
 print_lock = multiprocessing.Lock() #for printout to std_out
 
-def scoreMask(args):
-    return maskMetricRunner.scoreMoreMasks(*args)
+#the worker processes shared by all the scoring passes of the run, and the directory of the runner files handed to them
+workerPool = 0
+workerDir = ''
+
+def startPool(processors):
+    """
+    * Description: starts the worker processes shared by all the scoring passes of the run, if not started already.
+                   The workers are started before any runner exists, and each pass hands its runner over with shareRunner
+    * Inputs:
+    *     processors: the number of worker processes to start. Capped at the number of processors available
+    * Outputs:
+    *     the pool of worker processes, or 0 if there are too few processors to start one
+    """
+    global workerPool,workerDir
+    processors = min(processors,max(multiprocessing.cpu_count() - 2,1))
+    if (workerPool is 0) and (processors > 1):
+        workerDir = tempfile.mkdtemp(prefix='MaskScorer-runners-')
+        workerPool = multiprocessing.Pool(processes=processors)
+    return workerPool
+
+def stopPool(finish=True):
+    """
+    * Description: stops the shared worker processes and removes the runner files handed to them
+    * Inputs:
+    *     finish: whether to wait for the tasks already sent to the workers. Otherwise the workers are terminated
+    """
+    global workerPool,workerDir
+    if workerPool is not 0:
+        if finish:
+            workerPool.close()
+        else:
+            workerPool.terminate()
+        workerPool.join()
+        workerPool = 0
+    if workerDir != '':
+        shutil.rmtree(workerDir,ignore_errors=True)
+        workerDir = ''
+
+def shareRunner(runner):
+    """
+    * Description: hands the runner over to the worker processes by writing it once to a file that the tasks name.
+                   Only the read-only configuration of the runner is written, as set out by its __getstate__
+    * Inputs:
+    *     runner: the runner, or the list of runners, to hand over
+    * Outputs:
+    *     the name of the runner file
+    """
+    fd,runnerFile = tempfile.mkstemp(suffix='.pkl',dir=workerDir)
+    with os.fdopen(fd,'wb') as f:
+        pickle.dump(runner,f,pickle.HIGHEST_PROTOCOL)
+    return runnerFile
+
+#the runners loaded in this worker process by their runner file, and the reference caches they share
+workerRunners = OrderedDict()
+workerCaches = {}
+
+def loadRunner(runnerFile):
+    """
+    * Description: fetches the runner handed over in the runner file, reading it once per worker process
+    * Inputs:
+    *     runnerFile: the name of the runner file, as returned by shareRunner
+    * Outputs:
+    *     the runner, or the list of runners
+    """
+    runner = workerRunners.pop(runnerFile,None)
+    if runner is None:
+        with open(runnerFile,'rb') as f:
+            runner = pickle.load(f)
+        #the references kept in memory by this process carry over to the runners of later passes
+        runners = runner if isinstance(runner,list) else [runner]
+        for r in runners:
+            if r.refCache is not 0:
+                r.refCache = workerCaches.setdefault(r.refCache.cacheDir,r.refCache)
+        if len(workerRunners) >= 4:
+            workerRunners.popitem(last=False)
+    workerRunners[runnerFile] = runner
+    return runner
+
+def scoreMask(task):
+    runnerFile,maskData = task
+    return loadRunner(runnerFile).scoreMoreMasks(maskData)
+
+def writeReport(task):
+    runnerFile,report = task
+    return loadRunner(runnerFile).writeOneReport(report)
+
+def scoreQueryMasks(task):
+    runnerFile,groups = task
+    return scoreQueryGroups(loadRunner(runnerFile),groups)
+
+def writeQueryReport(task):
+    runnerFile,k,report = task
+    return loadRunner(runnerFile)[k].writeOneReport(report)
+
+def scoreQueryGroups(runners,groups):
+    """
+    * Description: scores the masks of each probe for all of the runners selecting it, decoding each
+                   mask file once for the probe
+    * Inputs:
+    *     runners: the list of runners
+    *     groups: the list of probes to score, each a list of pairs of the runner number and the
+                  dataframe of rows to score with that runner
+    * Outputs:
+    *     the list of the runner number, scored rows, threshold tables, and reports of each pair
+    """
+    results = []
+    for group in groups:
+        masks.decodeMemo = {}
+        try:
+            for k,maskData in group:
+                scores = runners[k].scoreMoreMasks(maskData)
+                results.append((k,scores[0],scores[1],scores[2]))
+        finally:
+            masks.decodeMemo = 0
+    return results
+
+def scoreQueries(runners,dfs,processors):
+    """
+    * Description: scores the masks for several runners set up over the same data, such as one runner
+                   for each query of a query-manipulation run, in a single pass over the probes. The
+                   mask files of each probe are decoded once for all of the runners, and the distinct
+                   values of each system output mask are found once
+    * Inputs:
+    *     runners: the list of runners, each set up with initMetricList
+    *     dfs: the list of dataframes of the masks to score with each runner, as returned by initMetricList
+    *     processors: the number of processors to use
+    * Outputs:
+    *     the list of dataframes of the scored masks of each runner, as returned by scoreMasks
+    """
+    dfs = [r.selectMasks(df) for r,df in zip(runners,dfs)]
+
+    #group the rows of all the runners by probe, noting the size of each probe
+    groups = OrderedDict()
+    sizes = OrderedDict()
+    for k,(r,df) in enumerate(zip(runners,dfs)):
+        idcol = ''.join([r.mymode,'FileID'])
+        for probeID,rows in df.groupby(idcol,sort=False):
+            groups.setdefault(probeID,[]).append((k,rows))
+            index_row = r.indexLookup.get(probeID,{})
+            sizes[probeID] = index_row.get(''.join([r.mymode,'Width']),0)*index_row.get(''.join([r.mymode,'Height']),0)
+    groups = list(groups.values())
+    ngroups = len(groups)
+    processors = max(min(processors,max(multiprocessing.cpu_count() - 2,1),ngroups),1)
+
+    frames = [[] for r in runners]
+    thresscores = [dict(r.thresscores) for r in runners]
+    p = 0
+    if processors > 1:
+        p = startPool(processors)
+    for r in runners:
+        r.inlineReports = p is 0
+    if p is 0:
+        results = (scoreQueryGroups(runners,[g]) for g in groups)
+    else:
+        #dispatch in small batches of probes, largest first, as in scoreMasks
+        order = np.argsort(-np.array(list(sizes.values())),kind='mergesort')
+        batchsize = max(1,ngroups//(8*processors))
+        batches = [[groups[j] for j in order[i:(i+batchsize)]] for i in range(0,ngroups,batchsize)]
+        finishReports(wait=False)
+        runnerFile = shareRunner(runners)
+        results = p.imap_unordered(scoreQueryMasks,[(runnerFile,b) for b in batches])
+        written = []
+
+    for result in results:
+        writes = []
+        for k,rows,thres,reps in result:
+            runners[k].recordScores(rows,thres)
+            frames[k].append(rows)
+            thresscores[k].update(thres)
+            if p is not 0:
+                writes.extend([(runnerFile,k,r) for r in reps])
+        if len(writes) > 0:
+            #the reports of the batch are written by the workers after the batches queued ahead of them
+            written.append(p.map_async(writeQueryReport,writes,chunksize=1))
+    if p is not 0:
+        pendingReports.append((runnerFile,written))
+
+    scored = []
+    for k,r in enumerate(runners):
+        r.thresscores = thresscores[k]
+        df = dfs[k]
+        if len(frames[k]) > 0:
+            df = pd.concat(frames[k]).loc[df.index]
+        scored.append(r.collectMasks(df))
+    return scored
+
+#HTML reports still being written by the worker processes, as (runner file, reports) entries
+pendingReports = []
+
+def finishReports(wait=True):
+    """
+    * Description: waits for the HTML reports being written by the worker processes to be finished, and removes
+                   the runner files handed over for them
+    * Inputs:
+    *     wait: whether to wait for the reports. Otherwise only the reports the workers have finished are collected
+    """
+    for entry in list(pendingReports):
+        runnerFile,reports = entry
+        if not (wait or all([r.ready() for r in reports])):
+            continue
+        for r in reports:
+            r.get() #raises any exception encountered by the writers
+        os.remove(runnerFile)
+        pendingReports.remove(entry)
 
 #for use with detection metrics plotter
 class detPackage:
@@ -111,6 +319,27 @@ def plotROC(mydets,plotname,plot_title,outdir):
 
     return myroc
 
+def plotProbeROC(mydets,plot_title,outdir):
+    """
+    * Description: draws the ROC curve of a single mask to roc.pdf in the output directory.
+                   The layout follows plotROC, which remains in use for the average ROC curves
+    * Inputs:
+    *     mydets: the detPackage of the ROC values
+    *     plot_title: the title of the plot
+    *     outdir: the directory in which to save the plot
+    """
+    ticks = np.linspace(0,1,11)
+    ticklabels = [str(int(x*100)) for x in ticks]
+    fpr = np.asarray(mydets.fpr,dtype=float)
+    tpr = np.asarray(mydets.tpr,dtype=float)
+
+    myplot = svgPlot([0,1],[0,1],ticks,ticks,ticklabels,ticklabels)
+    myplot.line([0,1],[0,1],color='#1f77b4',width=0.5,dash='4,2') #bisector
+    myplot.line(fpr,tpr,color='red')
+    myplot.markers(fpr,tpr,color='red',size=2)
+    myplot.annotate(0.7,0.2,["AUC=%.2f" % (mydets.auc),"(T#: %d, NT#: %d)" % (mydets.t_num,mydets.nt_num)])
+    myplot.save(os.path.join(outdir,'roc.pdf'),title=plot_title,xlabel="False Alarm Rate [%]",ylabel="Correct Detection Rate [%]")
+
 class maskMetricRunner:
     """
     This class computes the metrics given a list of reference and system output mask names.
@@ -127,6 +356,13 @@ class maskMetricRunner:
                  index,
                  speedup=False,
                  color=False,
+                 refcache=0,
+                 packbits=False,
+                 croproi=False,
+                 rle=False,
+                 checkpoint=0,
+                 manifest=0,
+                 trace=0,
                  colordict={'red':[0,0,255],'blue':[255,51,51],'yellow':[0,255,255],'green':[0,207,0],'pink':[193,182,255],'purple':[211,0,148],'white':[255,255,255],'gray':[127,127,127]}):
         """
         Constructor
@@ -150,6 +386,21 @@ class maskMetricRunner:
                      to be used as reference
         - speedup: determines the mask metric computation method to be used
         - color: whether to use 3-channel color assessment (dated to the NC17 evaluation)
+        - refcache: the maskCache object in which to store the binarized reference masks and their
+                    no-score zones across runs. 0 to disable caching
+        - packbits: whether to compute the metrics for a single threshold on bit-packed masks.
+                    Applies only with speedup
+        - croproi: whether to compute the metrics only within the bounding box of the reference region,
+                   the no-score zones, and the non-white system output pixels, counting the pixels outside
+                   of it directly. Applies only with speedup
+        - rle: whether to compute the metrics for a single threshold on run-length encoded masks.
+               Applies only with speedup
+        - checkpoint: the scoreCheckpoint object in which to record each batch of scored masks as it
+                      finishes. Masks already recorded there are not scored again. 0 to disable
+        - manifest: the scoreManifest object in which to store the scores of each mask keyed by its
+                    inputs. Masks whose inputs are unchanged reuse the stored scores. 0 to disable
+        - trace: the name of the file to which to append the time and peak memory growth of each stage
+                 of scoring each mask. 0 to disable
         """
         self.maskData = mergedf
         self.refDir = refD
@@ -162,8 +413,36 @@ class maskMetricRunner:
         self.speedup=speedup
         self.usejpeg2000=color
         self.colordict=colordict
+        self.refCache=refcache
+        self.packbits=packbits
+        self.croproi=croproi
+        self.rle=rle
+        self.checkpoint=checkpoint
+        self.manifest=manifest
+        self.traceFile=trace
        
-    def getSubOutRoot(self,outputRoot,task,mymode,row):
+    def __getstate__(self):
+        #the runner handed over to the worker processes carries its read-only configuration alone. The checkpoint
+        #and manifest stay with the parent process, as do the scores and reports collected by it
+        state = self.__dict__.copy()
+        state.update({'checkpoint':0,'manifest':0,'thresscores':{},'reports':[],'reusedData':0,'manifestKeys':{}})
+        return state
+
+    def makeDirs(self,path):
+        """
+        * Description: creates the directory and its parents if they do not exist already
+        * Inputs:
+        *     path: the directory to create
+        """
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                #may have been made by another process in the meantime
+                if not os.path.isdir(path):
+                    raise
+
+    def getSubOutRoot(self,outputRoot,task,mymode,row,makedirs=True):
         """
         * Description: generates subdirectories in the output root where relevant
         * Inputs:
@@ -171,6 +450,7 @@ class maskMetricRunner:
         *     task: the task in question, "manipulation" or "splice"
         *     mymode: the kind of masks being evaluated as "probe" or "donor"
         *     row: the row of data from which the dataframe is iterated over
+        *     makedirs: whether to create the directory
         * Outputs:
         *     subOutRoot: the directory for files to be saved on this iteration of getting the metrics
         """
@@ -184,40 +464,56 @@ class maskMetricRunner:
             subdir_name = "_".join([row['ProbeFileID'],row['DonorFileID']])
         #save in subdirectory
         subOutRoot = os.path.join(outputRoot,subdir_name)
-        if not os.path.isdir(subOutRoot):
-            os.system(' '.join(['mkdir',subOutRoot]))
         #further subdirectories for the splice task
         if self.mode == 1:
             subOutRoot = os.path.join(subOutRoot,'probe')
         elif self.mode == 2:
             subOutRoot = os.path.join(subOutRoot,'donor')
-        if not os.path.isdir(subOutRoot):
-            os.system(' '.join(['mkdir',subOutRoot]))
+        if makedirs:
+            self.makeDirs(subOutRoot)
         return subOutRoot
 
-    def readMasks(self,refMaskFName,sysMaskFName,probeID,outRoot,myprintbuffer):
+    def readMasks(self,refMaskFName,sysMaskFName,probeID,outRoot,myprintbuffer,cacheKey=0,cacheEntry=0,trace=0):
         """
         * Description: reads both the reference and system output masks and caches the binarized image
                        into the reference mask. If the journal dataframe is provided, the color and purpose
                        of select mask regions will also be added to the reference mask
         * Inputs:
-        *     refMaskFName: the name of the reference mask to be parsed
-        *     sysMaskFName: the name of the system output mask to be parsed
+        *     refMaskFName: the name of the reference mask to be parsed, or a masks.virtualMask
+        *     sysMaskFName: the name of the system output mask to be parsed, or a masks.virtualMask
         *     probeID: the ProbeFileID corresponding to the reference mask
-        *     outRoot: the directory where files are saved. Only relevant where sysMaskFName is blank
+        *     outRoot: the directory where files are saved
         *     myprintbuffer: buffer to append printout for atomic printout
+        *     cacheKey: the key of the reference mask in the reference mask cache. 0 if not caching
+        *     cacheEntry: the cached entry for the reference mask, if any. The reference mask is not decoded
+                          if it is cached and no HTML report is generated
+        *     trace: the stageTrace object in which to record the reading and binarizing of the masks. 0 if not tracing
         * Outputs:
         *     rImg: the reference mask object
         *     sImg: the system output mask object
         """
 
         myprintbuffer.append("Reference Mask: {}, System Mask: {}".format(refMaskFName,sysMaskFName))
-
-        refMaskName = os.path.join(self.refDir,refMaskFName)
-        if sysMaskFName in [None,'',np.nan]:
-            sysMaskName = os.path.join(outRoot,'whitemask.png')
-        else:
+        if trace is 0:
+            trace = stageTrace(0,0,0)
+
+        refMaskName = refMaskFName
+        if not isinstance(refMaskFName,masks.virtualMask):
+            refMaskName = os.path.join(self.refDir,refMaskFName)
+        sysMaskName = sysMaskFName
+        if not isinstance(sysMaskFName,masks.virtualMask):
             sysMaskName = os.path.join(self.sysDir,sysMaskFName)
+
+        if cacheEntry is not 0:
+            if not cacheEntry['present']:
+                myprintbuffer.append("The region you are looking for is not in reference mask {}. Scoring neglected.".format(refMaskFName))
+                return 0,0
+            if not self.html:
+                myprintbuffer.append("Fetching reference mask {} from the cache.".format(refMaskName))
+                rImg = masks.refmask_cached(refMaskName,cacheEntry['bwmat'])
+                sImg = masks.mask(sysMaskName)
+                trace.lap('read')
+                return rImg,sImg
  
         color_purpose = 0 
         if (self.journalData is 0) and (self.rbin == -1): #no journal saved and rbin not set
@@ -234,7 +530,9 @@ class maskMetricRunner:
         rImg = 0
         if self.rbin >= 0:
             rImg = masks.refmask_color(refMaskName)
+            trace.lap('read')
             rImg.binarize(self.rbin)
+            trace.lap('binarize')
         elif self.rbin == -1:
             #only need colors if selectively scoring
             myprintbuffer.append("Fetching {}FileID {} from mask data...".format(mymode,probeID))
@@ -248,7 +546,7 @@ class maskMetricRunner:
 #                joins = self.joinData.query("{}FileID=='{}'".format(mymode,probeID))#[['JournalName','StartNodeID','EndNodeID']]
 #                color_purpose = pd.merge(joins,self.journalData.query("{}=='Y'".format(evalcol)),how='left',on=['JournalName','StartNodeID','EndNodeID'])#[['Color','Purpose']].drop_duplicates()
 #		color_purpose = self.journalData.query("{}FileID=='{}' & {}=='Y'".format(mymode,probeID,evalcol))
-		color_purpose = self.journalData.query("{}FileID=='{}'".format(mymode,probeID))
+		color_purpose = self.getJournalRows(probeID)
                 
 
 #            rImg = masks.refmask(refMaskName,cs=colorlist,purposes=purposes_unique)
@@ -261,7 +559,9 @@ class maskMetricRunner:
                 rImg = masks.refmask(refMaskName,jData=color_purpose,mode=self.mode)
 #                myprintbuffer.append("Initializing reference mask {} with colors {}.".format(refMaskName,rImg.colors))
             myprintbuffer.append("Initializing reference mask {}.".format(refMaskName))
+            trace.lap('read')
             rImg.binarize(254)
+            trace.lap('binarize')
 
             #check to see if the color in question is even present
 #            presence = 0
@@ -274,12 +574,131 @@ class maskMetricRunner:
 
         if not rImg.regionIsPresent():
             myprintbuffer.append("The region you are looking for is not in reference mask {}. Scoring neglected.".format(refMaskFName))
+            if cacheKey is not 0:
+                self.refCache.save(cacheKey,{'present':np.array(False)})
             return 0,0
 
         sImg = masks.mask(sysMaskName)
+        trace.lap('read')
         return rImg,sImg 
 
+    def getJournalRows(self,probeID):
+        """
+        * Description: fetches the journal rows for the probe (or donor) from the prebuilt journal lookup
+        * Inputs:
+        *     probeID: the ProbeFileID (or DonorFileID) to fetch the journal rows for
+        * Outputs:
+        *     the dataframe of journal rows corresponding to probeID. This is empty if the ID is not in the journal
+        """
+        jrows = self.journalLookup.get(probeID)
+        if jrows is None:
+            jrows = self.journalData.iloc[0:0]
+        return jrows
+
+    def getRefCacheKey(self,refMaskFName,probeID):
+        """
+        * Description: computes the key of the reference mask in the reference mask cache. The key
+                       covers the contents of the reference mask and everything the binarized mask and
+                       the no-score zones depend on, including the regions selected through the journal
+        * Inputs:
+        *     refMaskFName: the name of the reference mask
+        *     probeID: the ProbeFileID (or DonorFileID) corresponding to the reference mask
+        * Outputs:
+        *     the cache key
+        """
+        selection = []
+        if (self.journalData is not 0) and (self.rbin == -1):
+            jrows = self.getJournalRows(probeID)
+            jcols = [c for c in ['Sequence','BitPlane','Color','Purpose','Evaluated','ProbeEvaluated','DonorEvaluated'] if c in list(jrows)]
+            selection = sorted([tuple(str(x) for x in r) for r in jrows[jcols].values.tolist()])
+        rbin = self.rbin
+        if (self.journalData is 0) and (rbin == -1):
+            rbin = 254 #as set in readMasks
+        params = [self.usejpeg2000,self.mode,rbin,self.erodeKernSize,self.dilateKernSize,self.distractionKernSize,self.kern.lower(),selection]
+        return self.refCache.getKey(os.path.join(self.refDir,refMaskFName),params)
+
+    def encodePlanes(self,rImg,wts,cacheKey=0,cacheEntry=0):
+        """
+        * Description: encodes the reference and weight planes that the confusion measures at a single
+                       threshold are computed on when the masks are run-length encoded or bit-packed. The
+                       planes kept in the cached entry of the reference are reused. If they are missing
+                       from it, the entry is saved with them added
+        * Inputs:
+        *     rImg: the binarized reference mask object
+        *     wts: the weight matrix of the reference
+        *     cacheKey: the key of the reference mask in the reference mask cache. 0 if not caching
+        *     cacheEntry: the cached entry for the reference mask, if any
+        * Outputs:
+        *     the dictionary of the encoded planes, or 0 if the masks are not encoded
+        """
+        if not self.speedup or not (self.rle or self.packbits):
+            return 0
+        if self.rle:
+            #the runs are cached as the arrays of their start and end positions
+            names = ['rw','rrpos','rrneg']
+            if (cacheEntry is not 0) and ('rwstarts' in cacheEntry):
+                dims = rImg.get_dims()
+                return dict([(k,masks.rleMask.fromRuns(dims,cacheEntry[k + 'starts'],cacheEntry[k + 'ends'])) for k in names])
+            planes = encodeRuns(rImg,wts)
+            arrays = {}
+            for k in names:
+                arrays[k + 'starts'] = planes[k].starts
+                arrays[k + 'ends'] = planes[k].ends
+        else:
+            if (cacheEntry is not 0) and ('pw' in cacheEntry):
+                return dict([(k,cacheEntry[k]) for k in ['pw','prpos','prneg']])
+            planes = packPlanes(rImg,wts)
+            arrays = planes
+        if cacheKey is not 0:
+            entry = dict(cacheEntry)
+            entry.update(arrays)
+            self.refCache.save(cacheKey,entry)
+        return planes
+
     #for apply
+    def getManifestKey(self,maskRow):
+        """
+        * Description: computes the key of the mask in the manifest. The key covers the contents of
+                       the reference and system output masks, the row of data and the index row of
+                       the mask, the journal rows of the mask, and the scoring parameters
+        * Inputs:
+        *     maskRow: the row of data of the mask
+        * Outputs:
+        *     the manifest key
+        """
+        mymode = self.mymode
+        if not self.usejpeg2000:
+            refMaskName = maskRow['{}{}MaskFileName'.format(self.binpfx,mymode)]
+        else:
+            refMaskName = maskRow['{}BitPlaneMaskFileName'.format(mymode)]
+        sysMaskName = maskRow['Output{}MaskFileName'.format(mymode)]
+        fnames = []
+        if refMaskName not in [None,'',np.nan]:
+            fnames.append(os.path.join(self.refDir,refMaskName))
+        if sysMaskName not in [None,'',np.nan]:
+            fnames.append(os.path.join(self.sysDir,sysMaskName))
+
+        probeID = maskRow[''.join([mymode,'FileID'])]
+        journal = ''
+        if self.journalData is not 0:
+            journal = self.getJournalRows(probeID).to_csv(sep='|',index=False)
+        index_row = self.indexLookup.get(probeID,{})
+        params = [self.manifestParams,sorted(maskRow.to_dict().items()),sorted(index_row.items()),journal]
+        return self.manifest.getKey(fnames,params)
+
+    def recordScores(self,rows,thresscores):
+        """
+        * Description: records a batch of scored masks in the checkpoint and the manifest, where enabled
+        * Inputs:
+        *     rows: the dataframe of the scored rows, under their original row labels
+        *     thresscores: the dictionary of threshold tables of the scored masks, keyed by file ID
+        """
+        if self.checkpoint is not 0:
+            self.checkpoint.add(self.checkpointScope,rows,thresscores)
+        if self.manifest is not 0:
+            idcol = ''.join([self.mymode,'FileID'])
+            self.manifest.add([(self.manifestKeys[i],rows.loc[[i]],thresscores.get(rows.at[i,idcol])) for i in rows.index])
+
     def scoreOneMask(self,maskRow):
         #parameter control
         binpfx = self.binpfx
@@ -295,6 +714,8 @@ class maskMetricRunner:
         distractionKernSize = self.distractionKernSize
         noScorePixel = self.noScorePixel
         kern = self.kern
+        #write the binarized masks and per-probe plots unless only the metrics are asked for
+        writeMasks = self.outputLevel != 'metrics'
         
         manipFileID = maskRow[''.join([mymode,'FileID'])]
         refMaskName = 0
@@ -307,30 +728,30 @@ class maskMetricRunner:
 
         #use atomic print buffer with atomic printout at end
         myprintbuffer = printbuffer(verbose)
+        trace = stageTrace(self.traceFile,mymode,manipFileID)
 
         try:
             maskMetrics = maskMetrics2
             if self.speedup:
                 maskMetrics = maskMetrics1
-            subOutRoot = self.getSubOutRoot(outputRoot,task,mymode,maskRow)
-            index_row = self.index.query("{}FileID=='{}'".format(mymode,manipFileID))
-            if len(index_row) == 0:
+            subOutRoot = self.getSubOutRoot(outputRoot,task,mymode,maskRow,makedirs=writeMasks)
+            index_row = self.indexLookup.get(manipFileID)
+            if index_row is None:
                 myprintbuffer.append("The probe '{}' is not in the index file. Skipping.".format(manipFileID))
                 myprintbuffer.atomprint(print_lock)
                 return maskRow
-            index_row = index_row.iloc[0]
 
             if refMaskName in [None,'',np.nan]:
                 myprintbuffer.append("Empty reference {} mask file.".format(mymode.lower()))
-                #save white matrix as mask in question. Dependent on index file dimensions?
+                #use a white matrix in memory as the mask in question, with the index file dimensions
+                whitedims = (index_row[''.join([mymode,'Height'])],index_row[''.join([mymode,'Width'])])
                 if not self.usejpeg2000:
-                    refMaskName = os.path.abspath(os.path.join(subOutRoot,'whitemask_ref.png'))
-                    whitemask = 255*np.ones((index_row[''.join([mymode,'Height'])],index_row[''.join([mymode,'Width'])]),dtype=np.uint8)
-                    cv2.imwrite(refMaskName,whitemask)
+                    refMaskName = masks.virtualMask(os.path.abspath(os.path.join(subOutRoot,'whitemask_ref.png')),whitedims,255)
                 else:
-                    refMaskName = os.path.abspath(os.path.join(subOutRoot,'whitemask_ref.jp2'))
-                    whitemask = np.zeros((index_row[''.join([mymode,'Height'])],index_row[''.join([mymode,'Width'])]),dtype=np.uint8)
-                    glymur.Jp2k(refMaskName,whitemask)
+                    refMaskName = masks.virtualMask(os.path.abspath(os.path.join(subOutRoot,'whitemask_ref.jp2')),whitedims,0)
+                if html:
+                    #the report links to the mask file
+                    refMaskName.write()
 #                continue
 
             if sysMaskName in [None,'',np.nan]:
@@ -338,12 +759,22 @@ class maskMetricRunner:
                 #self.journalData.set_value(i,evalcol,'N')
 #                df.set_value(i,'Scored','N')
                 myprintbuffer.append("Empty system {} mask file.".format(mymode.lower()))
-                #save white matrix as mask in question. Dependent on index file dimensions?
-                whitemask = 255*np.ones((index_row[''.join([mymode,'Height'])],index_row[''.join([mymode,'Width'])]),dtype=np.uint8)
-                cv2.imwrite(os.path.join(subOutRoot,'whitemask.png'),whitemask)
+                #use a white matrix in memory as the mask in question, with the index file dimensions
+                whitedims = (index_row[''.join([mymode,'Height'])],index_row[''.join([mymode,'Width'])])
+                sysMaskName = masks.virtualMask(os.path.join(subOutRoot,'whitemask.png'),whitedims,255)
+                if html:
+                    #the report links to the mask file
+                    sysMaskName.write()
 #                continue
 
-            rImg,sImg = self.readMasks(refMaskName,sysMaskName,manipFileID,subOutRoot,myprintbuffer)
+            trace.lap('index')
+
+            refCacheKey = 0
+            refCacheEntry = 0
+            if (self.refCache is not 0) and not isinstance(refMaskName,masks.virtualMask):
+                refCacheKey = self.getRefCacheKey(refMaskName,manipFileID)
+                refCacheEntry = self.refCache.load(refCacheKey)
+            rImg,sImg = self.readMasks(refMaskName,sysMaskName,manipFileID,subOutRoot,myprintbuffer,refCacheKey,refCacheEntry,trace)
             if (rImg is 0) and (sImg is 0):
                 #no masks detected with score-able regions, so set to not scored. Use first if need to modify here.
                 #self.journalData.loc[self.journalData.query("{}FileID=='{}'".format(mymode,manipFileID)).index,evalcol] = 'N'
@@ -380,39 +811,68 @@ class maskMetricRunner:
             sbin_name = ''
             if self.sbin >= -1:
                 sbin_name = os.path.join(subOutRoot,sImg.name.split('/')[-1][:-4] + '-actual_bin.png')
-                sImg.save(sbin_name,th=self.sbin)
+                if writeMasks:
+                    sImg.save(sbin_name,th=self.sbin)
+                trace.lap('artifacts')
 
             #save the image separately for html and further review. Use that in the html report
-            myprintbuffer.append("Generating no-score zones...")
-            wts,bns,sns = rImg.aggregateNoScore(erodeKernSize,dilateKernSize,distractionKernSize,kern,self.mode)
+            if refCacheEntry is not 0:
+                myprintbuffer.append("Fetching no-score zones from the cache...")
+                rImg.bwmat = refCacheEntry['bwmat']
+                wts = refCacheEntry['wts']
+                bns = refCacheEntry['bns']
+                sns = refCacheEntry['sns']
+                planes = self.encodePlanes(rImg,wts,refCacheKey,refCacheEntry)
+            else:
+                myprintbuffer.append("Generating no-score zones...")
+                wts,bns,sns = rImg.aggregateNoScore(erodeKernSize,dilateKernSize,distractionKernSize,kern,self.mode)
+                planes = 0
+                if refCacheKey is not 0:
+                    #the encoded planes are kept with the reference for the other system outputs
+                    entry = {'present':np.array(True),'bwmat':rImg.bwmat,'wts':wts,'bns':bns,'sns':sns}
+                    planes = self.encodePlanes(rImg,wts,refCacheKey,entry)
+                    if planes is 0:
+                        self.refCache.save(refCacheKey,entry)
+            trace.lap('noscore')
 
-            myprintbuffer.append("Generating reference mask with no-score zones...")
-            #do a 3-channel combine with bns and sns for their colors before saving
-            #TODO: store this as a separate function, save_color_ns(rImg,sImg,bns,sns,noScorePixel)
-            rImgbin = rImg.get_copy()
             rbin_name = os.path.join(subOutRoot,'-'.join([rImg.name.split('/')[-1][:-4],'bin.png']))
-            rbinmat = np.copy(rImgbin.bwmat)
-            rImgbin.matrix = np.stack((rbinmat,rbinmat,rbinmat),axis=2)
-            rImgbin.matrix[bns==0] = self.colordict['yellow']
-            rImgbin.matrix[sns==0] = self.colordict['pink']
+            if writeMasks:
+                myprintbuffer.append("Generating reference mask with no-score zones...")
+                #do a 3-channel combine with bns and sns for their colors before saving
+                #TODO: store this as a separate function, save_color_ns(rImg,sImg,bns,sns,noScorePixel)
+                rImgbin = rImg.get_copy()
+                rbinmat = np.copy(rImgbin.bwmat)
+                rImgbin.matrix = np.stack((rbinmat,rbinmat,rbinmat),axis=2)
+                rImgbin.matrix[bns==0] = self.colordict['yellow']
+                rImgbin.matrix[sns==0] = self.colordict['pink']
+                trace.lap('artifacts')
 
             #noScorePixel here
             pns=0
+            pnsPixels = []
             if noScorePixel >= 0:
                 myprintbuffer.append("Setting system optOut no-score zone...")
                 pns=sImg.pixelNoScore(noScorePixel)
-                rImgbin.matrix[pns==0] = self.colordict['purple'] #NOTE: temporary measure until different color is picked. Probably keep it?
+                pnsPixels.append(noScorePixel)
+                if writeMasks:
+                    rImgbin.matrix[pns==0] = self.colordict['purple'] #NOTE: temporary measure until different color is picked. Probably keep it?
                 wts = cv2.bitwise_and(wts,pns)
             if self.perProbePixelNoScore:
                 pppnspx = maskRow[''.join([mymode,'OptOutPixelValue'])]
                 pns=sImg.pixelNoScore(pppnspx)
-                rImgbin.matrix[pns==0] = self.colordict['purple'] #NOTE: temporary measure until different color is picked. Probably keep it?
+                pnsPixels.append(pppnspx)
+                if writeMasks:
+                    rImgbin.matrix[pns==0] = self.colordict['purple'] #NOTE: temporary measure until different color is picked. Probably keep it?
                 wts = cv2.bitwise_and(wts,pns)
 
-            myprintbuffer.append("Saving binarized reference mask...")
-            rImgbin.save(rbin_name)
+            trace.lap('noscore')
+
+            if writeMasks:
+                myprintbuffer.append("Saving binarized reference mask...")
+                rImgbin.save(rbin_name)
+                trace.lap('artifacts')
             #if wts allows for nothing to be scored, (i.e. no GT pos), print warning message, but score as usual
-            if np.sum(cv2.bitwise_and(wts,rImgbin.bwmat)) == 0:
+            if np.sum(cv2.bitwise_and(wts,rImg.bwmat)) == 0:
                 myprintbuffer.append("Warning: No region in the mask {} is score-able.".format(rImg.name))
 
             #if wts covers entire mask, skip it
@@ -429,28 +889,34 @@ class maskMetricRunner:
             mymeas = 0
             threshold = 0
             myprintbuffer.append("Generating metrics...")
-            metricRunner = maskMetrics(rImg,sImg,wts,self.sbin)
+            #the masks and weights to compute the metrics over, cropped to the region of interest if asked
+            mref,msys,mwts,mbns,msns,mpns,outside = rImg,sImg,wts,bns,sns,pns,0
+            if self.speedup:
+                if self.croproi:
+                    mref,msys,mwts,mbns,msns,mpns,outside = cropToROI(rImg,sImg,wts,bns,sns,pns)
+                    if outside > 0:
+                        myprintbuffer.append("Cropped the masks to a region of interest of {} pixels.".format(mwts.size))
+                if (pns is not 0) or (outside > 0):
+                    #the encoded planes are those of the weights of the reference alone, over the whole mask
+                    planes = 0
+                metricRunner = maskMetrics(mref,msys,mwts,self.sbin,packbits=self.packbits,outside=outside,rle=self.rle,planes=planes)
+            else:
+                metricRunner = maskMetrics(rImg,sImg,wts,self.sbin)
             #not something that needs to be calculated for every iteration of threshold; only needs to be calculated once
             myprintbuffer.append("Metrics generated. Getting metrics...")
 
-            thresMets,threshold = metricRunner.runningThresholds(rImg,sImg,bns,sns,pns,erodeKernSize,dilateKernSize,distractionKernSize,kern,myprintbuffer)
+            thresMets,threshold = metricRunner.runningThresholds(mref,msys,mbns,msns,mpns,erodeKernSize,dilateKernSize,distractionKernSize,kern,myprintbuffer)
             #thresMets.to_csv(os.path.join(path_or_buf=outputRoot,'{}-thresholds.csv'.format(sImg.name)),index=False) #save to a CSV for reference
             maskRow['OptimumThreshold'] = threshold
+            trace.lap('sweep')
 
             genROC = True
-            nullRocQuery = "(TP + FN == 0) or (FP + TN == 0)"
-            nonNullRocQuery = "(TP + FN > 0) and (FP + TN > 0)"
-            nullRocRows = thresMets.query(nullRocQuery)
-            nonNullRocRows = thresMets.query(nonNullRocQuery)
-
-            #compute TPR and FPR here for rows that have it.
-            if nullRocRows.shape[0] < thresMets.shape[0]:
-                thresMets.set_value(nonNullRocRows.index,'TPR',nonNullRocRows['TP']/(nonNullRocRows['TP'] + nonNullRocRows['FN']))
-                thresMets.set_value(nonNullRocRows.index,'FPR',nonNullRocRows['FP']/(nonNullRocRows['FP'] + nonNullRocRows['TN']))
-
-            #if no rows have it, don't gen the ROC.
-            if nullRocRows.shape[0] == 0:
-                genRoc = False
+            if not self.speedup:
+                #compute TPR and FPR here for rows that have it. The speedup metrics compute these directly.
+                nonNullRocRows = thresMets.query("(TP + FN > 0) and (FP + TN > 0)")
+                if nonNullRocRows.shape[0] > 0:
+                    thresMets.set_value(nonNullRocRows.index,'TPR',nonNullRocRows['TP']/(nonNullRocRows['TP'] + nonNullRocRows['FN']))
+                    thresMets.set_value(nonNullRocRows.index,'FPR',nonNullRocRows['FP']/(nonNullRocRows['FP'] + nonNullRocRows['TN']))
 
             #set aside for numeric threshold. If threshold is nan, set everything to 0 or nan as appropriate, make the binarized system mask a whitemask2.png,
             #and pass to HTML accordingly
@@ -459,7 +925,9 @@ class maskMetricRunner:
             if np.isnan(threshold):
                 sImg.bwmat = 255*np.ones(sImg.get_dims(),dtype=np.uint8)
                 optbin_name = os.path.join(subOutRoot,'whitemask2.png')
-                sImg.save(optbin_name)
+                if writeMasks:
+                    sImg.save(optbin_name)
+                    trace.lap('artifacts')
                 metrics = thresMets.iloc[0]
                 mets = metrics[['NMM','MCC','BWL1']].to_dict()
                 mets['GWL1'] = np.nan
@@ -487,16 +955,17 @@ class maskMetricRunner:
             else:
                 sImg.binarize(threshold) 
                 optbin_name = os.path.join(subOutRoot,sImg.name.split('/')[-1][:-4] + '-bin.png')
-                sImg.save(optbin_name,th=threshold)
+                if writeMasks:
+                    sImg.save(optbin_name,th=threshold)
+                    trace.lap('artifacts')
     
-                metrics = thresMets.query('Threshold=={}'.format(threshold)).iloc[0]
+                metrics = thresMets[thresMets['Threshold']==threshold].iloc[0]
                 mets = metrics[['NMM','MCC','BWL1']].to_dict()
                 mymeas = metrics[['TP','TN','FP','FN','N','BNS','SNS','PNS']].to_dict()
                 rocvalues = thresMets[['TPR','FPR']]
     
-                #insert the ProbeFileID into the manager dict
-                self.thresholds.extend(thresMets['Threshold'].tolist())
-                self.thresscores[maskRow[''.join([mymode,'FileID'])]] = thresMets
+                #record the threshold table as a compact record array, to be returned with the scored rows
+                self.thresscores[maskRow[''.join([mymode,'FileID'])]] = thresMets[['Threshold','NMM','MCC','BWL1','TP','TN','FP','FN','N']].to_records(index=False)
     
                 #lowercase rocvalues' keys
     #            rocvalues['tpr'] = rocvalues.pop('TPR')
@@ -527,7 +996,10 @@ class maskMetricRunner:
                                         mymeas['TP'] + mymeas['FN'],
                                         mymeas['FP'] + mymeas['TN'])
                 
-                    myroc = plotROC(mydets,'roc',' '.join(['ROC of',maskRow['ProbeFileID']]),subOutRoot)
+                    trace.lap('roc')
+                    if writeMasks:
+                        plotProbeROC(mydets,' '.join(['ROC of',maskRow['ProbeFileID']]),subOutRoot)
+                        trace.lap('plot')
     
     #            if len(thresMets) == 1:
     #                thresMets='' #to minimize redundancy
@@ -551,6 +1023,7 @@ class maskMetricRunner:
     #                else:
     #                    mymeas['PNS'] = 0
                     maskRow['ActualThreshold'] = self.sbin
+                    trace.lap('actual')
     #                thresMets = ''
     #            elif self.sbin == -1:
     
@@ -559,7 +1032,8 @@ class maskMetricRunner:
     #                sbin_name = os.path.join(subOutRoot,sImg.name.split('/')[-1][:-4] + '-bin.png')
     #                sImg.save(sbin_name,th=threshold)
      
-                mets['GWL1'] = maskMetrics.grayscaleWeightedL1(rImg,sImg,wts) 
+                mets['GWL1'] = maskMetrics.grayscaleWeightedL1(mref,msys,mwts) 
+                trace.lap('gwl1')
                 maskRow['GWL1'] = round(mets['GWL1'],precision)
                 for met in ['NMM','MCC','BWL1']:
                     myprintbuffer.append("Setting value for {}...".format(met))
@@ -577,17 +1051,14 @@ class maskMetricRunner:
 
             myprintbuffer.append("Metrics computed.")
 
-            #generate the HTML report
+            #describe the HTML report, to be written after scoring
             if html:
                 manipFileName = maskRow[''.join([mymode,'FileName'])]
                 baseFileName = maskRow['BaseFileName']
                 maniImgName = os.path.join(self.refDir,manipFileName)
-                myprintbuffer.append("Generating aggregate color mask for HTML report...")
-                colordirs = self.aggregateColorMask(rImg,sImg,bns,sns,pns,kern,erodeKernSize,maniImgName,subOutRoot,self.colordict)
-                colMaskName=colordirs['mask']
-                aggImgName=colordirs['agg']
-                maskRow['ColMaskFileName'] = colMaskName
-                maskRow['AggMaskFileName'] = aggImgName
+                colordirs = self.getColorMaskNames(sImg,subOutRoot)
+                maskRow['ColMaskFileName'] = colordirs['mask']
+                maskRow['AggMaskFileName'] = colordirs['agg']
 
                 #display Actual mask if it shows up. Else display Optimum
                 sbinmaskname = optbin_name
@@ -603,10 +1074,37 @@ class maskMetricRunner:
                 mymeas['PixelBNS'] = mymeas.pop('BNS')
                 mymeas['PixelSNS'] = mymeas.pop('SNS')
                 mymeas['PixelPNS'] = mymeas.pop('PNS')
+
+                #the threshold of the binarized system output mask displayed in the report. A white mask if none
+                sysBinThreshold = np.nan
+                if not np.isnan(threshold):
+                    sysBinThreshold = smask_threshold
     
-                myprintbuffer.append("Generating HTML report...")
-                #TODO: trim the arguments here? Just use threshold and thresMets, at min len 1? Remove mets and mymeas since we have threshold to index.
-                self.manipReport(task,subOutRoot,manipFileID,manipFileName,baseFileName,rImg,sImg,rbin_name,sbinmaskname,smask_threshold,thresMets,bns,sns,pns,mets,mymeas,colMaskName,aggImgName,myprintbuffer)
+                report = {'task':task,
+                          'outputRoot':subOutRoot,
+                          'probeFileID':manipFileID,
+                          'maniImageFName':manipFileName,
+                          'baseImageFName':baseFileName,
+                          'maniImgName':maniImgName,
+                          'refMaskName':refMaskName,
+                          'sysMaskName':sysMaskName,
+                          'sysBinThreshold':sysBinThreshold,
+                          'pnsPixels':pnsPixels,
+                          'rbin_name':rbin_name,
+                          'sbin_name':sbinmaskname,
+                          'sys_threshold':smask_threshold,
+                          'thresMets':thresMets,
+                          'kern':kern,
+                          'erodeKernSize':erodeKernSize,
+                          'metrics':mets,
+                          'confmeasures':mymeas,
+                          'colMaskName':colordirs['mask'],
+                          'aggImgName':colordirs['agg']}
+                if self.inlineReports:
+                    self.writeOneReport(report,(rImg,sImg,bns,sns,pns),trace)
+                else:
+                    #the report is written by a worker process, which reads the masks again from the names in the report
+                    self.reports.append(report)
             myprintbuffer.atomprint(print_lock)
             return maskRow
         except:
@@ -616,11 +1114,192 @@ class maskMetricRunner:
             if debug_mode == True:
                 raise  #TODO: debug assistant
 #            myprintbuffer.atomprint(print_lock)
+        finally:
+            trace.write(print_lock)
+
+    def scoreRows(self,maskData):
+        """
+        * Description: scores each row of the mask data once. DataFrame.apply calls the function on the first
+                       row twice on some versions of pandas, which would score the first mask twice
+        * Inputs:
+        *     maskData: the dataframe of the masks to score
+        * Outputs:
+        *     the dataframe of the scored rows, with the columns added by scoreOneMask after those of maskData
+        """
+        rows = []
+        columns = list(maskData.columns)
+        seen = set(columns)
+        for i,row in maskData.iterrows():
+            row = self.scoreOneMask(row)
+            if row is None:
+                #the mask encountered an exception, which is recorded in errlist
+                row = pd.Series([],name=i)
+            for c in row.index:
+                if c not in seen:
+                    seen.add(c)
+                    columns.append(c)
+            rows.append(row)
+        return pd.DataFrame(rows,index=maskData.index,columns=columns)
 
     def scoreMoreMasks(self,maskData):
-        return maskData.apply(self.scoreOneMask,axis=1,reduce=False)
+        #return the threshold tables and reports scored in this process along with the rows
+        self.thresscores = {}
+        self.reports = []
+        maskData = self.scoreRows(maskData)
+        return maskData,self.thresscores,self.reports
+
+    def writeOneReport(self,report,reportMasks=0,trace=0):
+        """
+        * Description: renders and writes the colored masks and the HTML report for one probe
+        * Inputs:
+        *     report: the dictionary describing the report, as generated by scoreOneMask
+        *     reportMasks: the reference mask, system output mask, and the boundary, selected, and pixel no-score
+                           zones the probe was scored with. 0 to read the masks again from the names in the report
+        *     trace: the stageTrace object of the scoring of the probe. 0 to trace the report on its own
+        """
+        myprintbuffer = printbuffer(self.verbose)
+        ownTrace = trace is 0
+        if ownTrace:
+            trace = stageTrace(self.traceFile,self.mymode,report['probeFileID'])
+        try:
+            if reportMasks is 0:
+                reportMasks = self.readReportMasks(report,myprintbuffer)
+                trace.lap('read')
+            rImg,sImg,bns,sns,pns = reportMasks
+
+            myprintbuffer.append("Generating aggregate color mask for HTML report...")
+            self.aggregateColorMask(rImg,sImg,bns,sns,pns,report['kern'],report['erodeKernSize'],report['maniImgName'],report['outputRoot'],self.colordict)
+            trace.lap('colormask')
+
+            myprintbuffer.append("Generating HTML report...")
+            self.manipReport(report['task'],report['outputRoot'],report['probeFileID'],report['maniImageFName'],report['baseImageFName'],rImg,sImg,report['rbin_name'],report['sbin_name'],report['sys_threshold'],report['thresMets'],bns,sns,pns,report['metrics'],report['confmeasures'],report['colMaskName'],report['aggImgName'],myprintbuffer)
+            trace.lap('html')
+            myprintbuffer.atomprint(print_lock)
+        except:
+            exc_type,exc_obj,exc_tb = sys.exc_info()
+            print("The HTML report for {}FileID {} encountered exception {} at line {}.".format(self.mymode,report['probeFileID'],exc_type,exc_tb.tb_lineno))
+            raise
+        finally:
+            if ownTrace:
+                trace.write(print_lock)
+
+    def readReportMasks(self,report,myprintbuffer):
+        """
+        * Description: reads the masks of a probe again for its report, with the same binarization and no-score
+                       zones as when the probe was scored
+        * Inputs:
+        *     report: the dictionary describing the report, as generated by scoreOneMask
+        *     myprintbuffer: buffer to append printout for atomic printout
+        * Outputs:
+        *     the reference mask, system output mask, and the boundary, selected, and pixel no-score zones
+        """
+        refMaskName = report['refMaskName']
+        probeID = report['probeFileID']
+        refCacheKey = 0
+        refCacheEntry = 0
+        if (self.refCache is not 0) and not isinstance(refMaskName,masks.virtualMask):
+            refCacheKey = self.getRefCacheKey(refMaskName,probeID)
+            refCacheEntry = self.refCache.load(refCacheKey)
+        rImg,sImg = self.readMasks(refMaskName,report['sysMaskName'],probeID,report['outputRoot'],myprintbuffer,refCacheKey,refCacheEntry)
+
+        if (refCacheEntry is not 0) and ('bns' in refCacheEntry):
+            rImg.bwmat = refCacheEntry['bwmat']
+            bns = refCacheEntry['bns']
+            sns = refCacheEntry['sns']
+        else:
+            wts,bns,sns = rImg.aggregateNoScore(self.erodeKernSize,self.dilateKernSize,self.distractionKernSize,self.kern,self.mode)
+
+        pns = 0
+        for px in report['pnsPixels']:
+            pns = sImg.pixelNoScore(px)
+
+        if np.isnan(report['sysBinThreshold']):
+            sImg.bwmat = 255*np.ones(sImg.get_dims(),dtype=np.uint8)
+        else:
+            sImg.binarize(report['sysBinThreshold'])
+        return rImg,sImg,bns,sns,pns
+
+    def selectMasks(self,maskData):
+        """
+        * Description: picks out the masks still to be scored, skipping those recorded in the checkpoint
+                       and reusing those stored in the manifest. The rest of the masks are picked up by
+                       collectMasks
+        * Inputs:
+        *     maskData: the dataframe of the masks
+        * Outputs:
+        *     the dataframe of the masks to score
+        """
+        allindex = maskData.index
+        self.allIndex = allindex
+        self.reusedData = 0
+        if self.checkpoint is not 0:
+            #skip the masks recorded in the checkpoint by an earlier run
+            frames,thresscores = self.checkpoint.load(self.checkpointScope)
+            if len(frames) > 0:
+                done = pd.concat(frames).index
+                maskData = maskData.loc[~allindex.isin(done)]
+                print("Resuming from checkpoint with {} of {} {} masks already scored.".format(len(allindex) - maskData.shape[0],len(allindex),self.mymode.lower()))
+
+        if self.manifest is not 0:
+            #reuse the scores of the masks whose inputs are unchanged since they were stored in the manifest
+            idcol = ''.join([self.mymode,'FileID'])
+            self.manifestKeys = dict([(i,self.getManifestKey(row)) for i,row in maskData.iterrows()])
+            stored = self.manifest.load(self.manifestKeys.values())
+            frames = []
+            thresscores = {}
+            for i in maskData.index:
+                entry = stored.get(self.manifestKeys[i])
+                if entry is None:
+                    continue
+                if (self.outputLevel != 'metrics') and not os.path.isdir(self.getSubOutRoot(self.outputRoot,self.task,self.mymode,maskData.loc[i],makedirs=False)):
+                    #the files written for the mask are gone, so it must be scored again to write them
+                    continue
+                row = entry[0].copy()
+                row.index = [i]
+                frames.append(row)
+                if entry[1] is not None:
+                    thresscores[row.at[i,idcol]] = entry[1]
+            if len(frames) > 0:
+                self.reusedData = pd.concat(frames)
+                self.thresscores.update(thresscores)
+                if self.checkpoint is not 0:
+                    self.checkpoint.add(self.checkpointScope,self.reusedData,thresscores)
+                maskData = maskData.drop(self.reusedData.index)
+                print("Reusing the stored scores of {} of {} {} masks with unchanged inputs.".format(self.reusedData.shape[0],self.reusedData.shape[0] + maskData.shape[0],self.mymode.lower()))
+        return maskData
+
+    def collectMasks(self,maskData):
+        """
+        * Description: puts the scored masks back together with the masks skipped by selectMasks
+        * Inputs:
+        *     maskData: the dataframe of the masks scored
+        * Outputs:
+        *     the dataframe of all the masks, in their original order
+        """
+        if self.checkpoint is not 0:
+            #the scores are taken in full from the checkpoint, including those of earlier runs
+            frames,thresscores = self.checkpoint.load(self.checkpointScope)
+            if len(frames) > 0:
+                self.thresscores = thresscores
+                maskData = pd.concat(frames).loc[self.allIndex]
+        elif self.reusedData is not 0:
+            if maskData.shape[0] > 0:
+                maskData = pd.concat([self.reusedData,maskData])
+            else:
+                maskData = self.reusedData
+            maskData = maskData.loc[self.allIndex]
+
+        if isinstance(maskData,pd.Series):
+            maskData = maskData.to_frame().transpose()
+
+        if maskData.query("OptimumMCC==-2").shape[0] > 0:
+            self.journalData.loc[self.journalData.query("{}FileID=={}".format(self.mymode,maskData.query("OptimumMCC==-2")[''.join([self.mymode,'FileID'])].tolist())).index,self.evalcol] = 'N'
+
+        return maskData
 
     def scoreMasks(self,maskData,processors):
+        maskData = self.selectMasks(maskData)
+
         maxprocs = max(multiprocessing.cpu_count() - 2,1)
         #if more, print warning message and use max processors
         nrow = maskData.shape[0]
@@ -631,28 +1310,64 @@ class maskMetricRunner:
             print("Warning: the machine does not have that many processors available. Defaulting to max ({}).".format(max(maxprocs,1)))
             processors = max(maxprocs,1)
 
-        if processors == 1:
+        #the reports are written as the masks are scored in this process, or handed to the worker processes
+        self.inlineReports = processors == 1
+        if nrow == 0:
+            pass
+        elif (processors == 1) and (self.checkpoint is 0) and (self.manifest is 0):
             #case for one processor for efficient debugging and to eliminate overhead when running
-            maskData = maskData.apply(self.scoreOneMask,axis=1,reduce=False)
+            maskData = self.scoreRows(maskData)
+        elif processors == 1:
+            #record each mask as soon as it is scored
+            frames = []
+            thresscores = self.thresscores
+            for i in range(nrow):
+                scores = self.scoreMoreMasks(maskData.iloc[[i]])
+                self.recordScores(scores[0],scores[1])
+                frames.append(scores[0])
+                thresscores.update(scores[1])
+            maskData = pd.concat(frames)
+            self.thresscores = thresscores
         else:
-            #split maskData into array of dataframes based on number of processors (and rows in the file)
-            chunksize = nrow//processors
-            maskDataS = [[self,maskData[i:(i+chunksize)]] for i in range(0,nrow,chunksize)]
+            #order the masks largest first by image size so that the largest masks do not hold up the tail of the run
+            mymode = self.mymode
+            idcol = ''.join([mymode,'FileID'])
+            dims = self.index[[idcol,''.join([mymode,'Width']),''.join([mymode,'Height'])]].drop_duplicates(idcol)
+            sizes = maskData[[idcol]].merge(dims,how='left',on=idcol)
+            sizes = (sizes[''.join([mymode,'Width'])]*sizes[''.join([mymode,'Height'])]).fillna(0).values
+            order = np.argsort(-sizes,kind='mergesort')
+
+            #dispatch in small batches of similarly-sized masks as workers free up
+            origindex = maskData.index
+            maskData = maskData.reset_index(drop=True)
+            batchsize = max(1,nrow//(8*processors))
+            maskDataS = [maskData.iloc[order[i:(i+batchsize)]] for i in range(0,nrow,batchsize)]
     
-            p = multiprocessing.Pool(processes=processors)
-            maskDataS = p.map(scoreMask,maskDataS)
-            p.close()
+            #the runner is handed over once for the pass, so that tasks only carry the rows to score.
+            #The runner files of earlier passes are removed once their reports are written
+            p = startPool(processors)
+            finishReports(wait=False)
+            runnerFile = shareRunner(self)
+            scored = []
+            written = []
+            for m in p.imap_unordered(scoreMask,[(runnerFile,b) for b in maskDataS]):
+                if (self.checkpoint is not 0) or (self.manifest is not 0):
+                    #record each batch as soon as it is returned, under the original row labels
+                    self.recordScores(m[0].set_index(origindex[m[0].index]),m[1])
+                if len(m[2]) > 0:
+                    #the reports of the batch are written by the workers after the batches queued ahead of them
+                    written.append(p.map_async(writeReport,[(runnerFile,r) for r in m[2]],chunksize=1))
+                scored.append(m)
+            maskDataS = scored
+            pendingReports.append((runnerFile,written))
     
-            #re-merge in the order found and return
-            maskData = pd.concat(maskDataS)
-
-        if isinstance(maskData,pd.Series):
-            maskData = maskData.to_frame().transpose()
+            #re-merge in the original order and return
+            for m in maskDataS:
+                self.thresscores.update(m[1])
+            maskData = pd.concat([m[0] for m in maskDataS]).sort_index()
+            maskData.index = origindex
 
-        if maskData.query("OptimumMCC==-2").shape[0] > 0:
-            self.journalData.loc[self.journalData.query("{}FileID=={}".format(self.mymode,maskData.query("OptimumMCC==-2")[''.join([self.mymode,'FileID'])].tolist())).index,self.evalcol] = 'N'
-
-        return maskData
+        return self.collectMasks(maskData)
 
     def getMetricList(self,
                       outputRoot,
@@ -676,9 +1391,27 @@ class maskMetricRunner:
         *         html: whether or not to generate an HTML report
         *         precision: the number of digits to round the computed metrics to.
         *         processors: the number of processors to use to score the maskss.
+        *         outputLevel: the per-probe files to write. 'metrics' writes none, 'masks' writes the
+                               binarized masks and the ROC curve, and 'html' also writes the HTML report
         * Output:
         *     df: a dataframe of the computed metrics
         """
+        df = self.initMetricList(outputRoot,params)
+        #************ Scoring begins here ************
+        df = self.scoreMasks(df,params.processors)
+        return self.finishMetricList(df)
+
+    def initMetricList(self,
+                       outputRoot,
+                       params):
+        """
+        * Description: sets up the runner to score the masks with the parameters of getMetricList
+        * Inputs:
+        *     outputRoot: the directory for outputs to be written
+        *     params: an object containing additional parameters for scoring, as for getMetricList
+        * Output:
+        *     df: the dataframe of the masks to score, initialized to minimum scores
+        """
         #saving parameters from param object
         self.mode = params.mode
         erodeKernSize = params.eks
@@ -691,6 +1424,9 @@ class maskMetricRunner:
         html = params.html
         precision = params.precision
         processors = params.processors
+        self.outputLevel = params.outputLevel
+        #each scoring pass is recorded separately in the checkpoint
+        self.checkpointScope = '{}:{}'.format(self.mode,outputRoot)
 
         #reflist and syslist should come from the same dataframe, so length checking is not required
         mymode='Probe'
@@ -761,7 +1497,7 @@ class maskMetricRunner:
         df['AggMaskFileName'] = ['']*nrow
 
         task = self.maskData['TaskID'].iloc[0] #should all be the same for one file
-        ilog = open('index_log.txt','w+')
+        self.ilog = open('index_log.txt','w+')
         self.errlist = []
 
         #parameter control
@@ -778,126 +1514,56 @@ class maskMetricRunner:
         self.precision = precision
         self.outputRoot = outputRoot
 
-        #shared object with multiprocessing manager
-        manager = multiprocessing.Manager()
-        self.thresscores = manager.dict()
-        self.thresholds = manager.list()
+        #the scoring parameters the scores of each mask depend on, for the manifest. The output root is
+        #included wherever files are written for each mask, since those files are not rewritten on reuse
+        self.manifestParams = [self.mode,self.rbin,self.sbin,erodeKernSize,dilateKernSize,distractionKernSize,noScorePixel,self.perProbePixelNoScore,
+                               kern.lower(),precision,self.speedup,self.usejpeg2000,self.packbits]
+        if self.outputLevel != 'metrics':
+            self.manifestParams.extend([self.outputLevel,outputRoot])
 
-        #************ Scoring begins here ************
-        df = self.scoreMasks(df,processors)
+        #per-probe threshold tables and report descriptions, returned by the workers and merged here
+        self.thresscores = {}
+        self.reports = []
+        self.inlineReports = True
+
+        #lookups keyed by file ID, built once so that each mask need not scan the index and journal tables
+        idcol = ''.join([mymode,'FileID'])
+        self.indexLookup = self.index.drop_duplicates(idcol).set_index(idcol,drop=False).to_dict('index')
+        self.journalLookup = {}
+        if (self.journalData is not 0) and (idcol in list(self.journalData)):
+            self.journalLookup = dict(list(self.journalData.groupby(idcol,sort=False)))
+
+        return df
+
+    def finishMetricList(self,df):
+        """
+        * Description: aggregates the metrics of the scored masks and writes the average ROC curves
+        * Inputs:
+        *     df: the dataframe of the scored masks
+        * Output:
+        *     df: a dataframe of the computed metrics
+        """
 #        for i,row in self.maskData.iterrows():
 #            if verbose: print("Scoring {} mask {} out of {}...".format(mymode.lower(),i+1,nrow))
 #            scoreMask(row)
+        task = self.task
+        mymode = self.mymode
+        outputRoot = self.outputRoot
+        nrow = df.shape[0]
 
         #print all error output at very end and exit (1) if failed at any iteration of loop
         if len(self.errlist) > 1:
             exit(1)
-        ilog.close()
+        self.ilog.close()
 
-        templist = self.thresholds
-        self.thresholds = list(set(templist))
         probelist = self.thresscores.keys()
+        templist = []
+        for probeID in probelist:
+            templist.extend(self.thresscores[probeID]['Threshold'].tolist())
+        self.thresholds = list(set(templist))
 
-        #TODO: drop into separate function in maskMetrics and maskMetrics_old
         #compute maximum metrics here
-        maxmets = {}
-        maxavgMCC = -1
-        maxThreshold = -1
-
-        roc_values = pd.DataFrame({'PixelTPR':0.,
-                                   'PixelFPR':0.,
-                                   'ProbeTPR':0.,
-                                   'ProbeFPR':0.},index=self.thresholds)
-
-        for t in self.thresholds:
-            pixel_tpr = 0
-            pixel_fpr = 0
-            probe_tpr = 0
-            probe_fpr = 0
-
-            maxmet_threshold = pd.DataFrame({''.join([mymode,'FileID']):probelist,
-                                    'Threshold':t,
-                                    'NMM':-1.,
-                                    'MCC':0.,
-                                    'BWL1':1.,
-                                    'TP':0,
-                                    'TN':0,
-                                    'FP':0,
-                                    'FN':0,
-                                    'TPR':0.,
-                                    'FPR':0.})
-            for pix,probeID in enumerate(probelist):
-                probedf = self.thresscores[probeID]
-                mets = 0
-                if t in probedf['Threshold'].tolist():
-                    # if threshold is in the dataframe list of thresholds, get the corresponding metrics.
-                    mets = probedf.query("Threshold=={}".format(t)).iloc[0]
-                    maxmet_threshold.set_value(pix,'TP',mets['TP'])
-                    maxmet_threshold.set_value(pix,'TN',mets['TN'])
-                    maxmet_threshold.set_value(pix,'FP',mets['FP'])
-                    maxmet_threshold.set_value(pix,'FN',mets['FN'])
-                    maxmet_threshold.set_value(pix,'NMM',mets['NMM'])
-                    maxmet_threshold.set_value(pix,'MCC',mets['MCC'])
-                    maxmet_threshold.set_value(pix,'BWL1',mets['BWL1'])
-                else:
-                    # attempt to get the metric from the threshold right below it
-                    t_list = [s for s in probedf['Threshold'].tolist() if s <= t]
-                    if len(t_list) == 0:
-                        # if nothing is right below it, treat everything as black and recompute NMM and BWL1.
-                        mets = probedf.iloc[0]
-                        maxmet_threshold.set_value(pix,'TP',mets['TP'] + mets['FN'])
-                        maxmet_threshold.set_value(pix,'FP',mets['FP'] + mets['TN'])
-                        if mets['N'] > 0:
-                            maxmet_threshold.set_value(pix,'NMM',max([(mets['TP'] + mets['FN'] - mets['FP'] - mets['TN'])/mets['N'],-1]))
-                            maxmet_threshold.set_value(pix,'BWL1',(mets['FP'] + mets['TN'])/mets['N'])
-                        else:
-                            maxmet_threshold.set_value(pix,'NMM',np.nan)
-                            maxmet_threshold.set_value(pix,'BWL1',np.nan)
-                    else:
-                        myt = max(t_list)
-                        mets = probedf.query("Threshold=={}".format(myt)).iloc[0]
-                        maxmet_threshold.set_value(pix,'TP',mets['TP'])
-                        maxmet_threshold.set_value(pix,'TN',mets['TN'])
-                        maxmet_threshold.set_value(pix,'FP',mets['FP'])
-                        maxmet_threshold.set_value(pix,'FN',mets['FN'])
-                        maxmet_threshold.set_value(pix,'NMM',mets['NMM'])
-                        maxmet_threshold.set_value(pix,'MCC',mets['MCC'])
-                        maxmet_threshold.set_value(pix,'BWL1',mets['BWL1'])
-                if (mets['TP'] + mets['FN']) > 0:
-                    maxmet_threshold.set_value(pix,'TPR',float(mets['TP'])/(mets['TP'] + mets['FN']))
-                else:
-                    maxmet_threshold.set_value(pix,'TPR',np.nan)
-                if (mets['FP'] + mets['TN']) > 0:
-                    maxmet_threshold.set_value(pix,'FPR',float(mets['FP'])/(mets['FP'] + mets['TN']))
-                else:
-                    maxmet_threshold.set_value(pix,'FPR',np.nan)
-
-            # probe- and pixel-weighted ROC curves 
-            metsum = maxmet_threshold[['TP','TN','FP','FN','TPR','FPR']].sum(axis=0)
-            if (metsum['TP'] + metsum['FN']) > 0:
-                roc_values.set_value(t,'PixelTPR',float(metsum['TP'])/(metsum['TP'] + metsum['FN']))
-            else:
-                roc_values.set_value(t,'PixelTPR',np.nan)
-            if (metsum['FP'] + metsum['TN']) > 0:
-                roc_values.set_value(t,'PixelFPR',float(metsum['FP'])/(metsum['FP'] + metsum['TN']))
-            else:
-                roc_values.set_value(t,'PixelFPR',np.nan)
-
-            if ~np.isnan(metsum['TPR']):
-                roc_values.set_value(t,'ProbeTPR',metsum['TPR']/maxmet_threshold.shape[0])
-            else:
-                roc_values.set_value(t,'ProbeTPR',np.nan)
-            if ~np.isnan(metsum['FPR']):
-                roc_values.set_value(t,'ProbeFPR',metsum['FPR']/maxmet_threshold.shape[0])
-            else:
-                roc_values.set_value(t,'ProbeFPR',np.nan)
-            
-            maxmets[t] = maxmet_threshold
-            #compute biggest average MCC fixing threshold
-            avgMCC = maxmet_threshold['MCC'].mean()
-            if avgMCC > maxavgMCC:
-                maxavgMCC = avgMCC
-                maxThreshold = t
+        roc_values,maxThreshold,maxMCCdf = self.aggregateThresholdMetrics(probelist,self.thresholds)
 
         #generate pixel and probe average ROC's.
         #only plot if there are any scores to be plot at all
@@ -969,7 +1635,6 @@ class maskMetricRunner:
         if (self.sbin >= -1) and (maxThreshold > -1):
             #with the maxThreshold, set MaximumMCC for everything. Join that dataframe with this one
             df['MaximumThreshold'] = maxThreshold
-            maxMCCdf = maxmets[maxThreshold]
             maxMCCdf.rename(columns={'NMM':'MaximumNMM',
                                      'MCC':'MaximumMCC',
                                      'BWL1':'MaximumBWL1',
@@ -1052,6 +1717,114 @@ class maskMetricRunner:
                'ColMaskFileName','AggMaskFileName']]
         return df.drop(''.join([mymode,'FileName']),1)
 
+    def aggregateThresholdMetrics(self,probelist,thresholds):
+        """
+        * Description: computes the pixel and probe average ROC values and the threshold
+                       yielding the maximum average MCC across all probes. Each probe's
+                       threshold table is treated as a step function, so that the metrics
+                       at every global threshold are looked up for the probe at once
+        * Inputs:
+        *     probelist: the list of probe (or donor) file ID's scored
+        *     thresholds: the list of global thresholds to evaluate
+        * Outputs:
+        *     roc_values: a dataframe of the pixel and probe average TPR and FPR for each threshold
+        *     maxThreshold: the threshold yielding the maximum average MCC
+        *     maxMCCdf: a dataframe of the metrics for each probe at maxThreshold
+        """
+        mymode = self.mymode
+        nthres = len(thresholds)
+        nprobe = len(probelist)
+        t_arr = np.array(thresholds,dtype=float)
+
+        #stacked metrics, thresholds x probes
+        TP = np.zeros((nthres,nprobe))
+        TN = np.zeros((nthres,nprobe))
+        FP = np.zeros((nthres,nprobe))
+        FN = np.zeros((nthres,nprobe))
+        NMM = np.zeros((nthres,nprobe))
+        MCC = np.zeros((nthres,nprobe))
+        BWL1 = np.zeros((nthres,nprobe))
+        TPR = np.zeros((nthres,nprobe))
+        FPR = np.zeros((nthres,nprobe))
+
+        for pix,probeID in enumerate(probelist):
+            probedf = self.thresscores[probeID]
+            probedf = probedf[np.argsort(probedf['Threshold'],kind='mergesort')]
+            p_tp = probedf['TP'].astype(float)
+            p_tn = probedf['TN'].astype(float)
+            p_fp = probedf['FP'].astype(float)
+            p_fn = probedf['FN'].astype(float)
+
+            #get the metrics from the threshold at or right below each global threshold
+            idx = np.searchsorted(probedf['Threshold'],t_arr,side='right') - 1
+            below = idx < 0
+            idx[below] = 0
+            m_tp = p_tp[idx]
+            m_tn = p_tn[idx]
+            m_fp = p_fp[idx]
+            m_fn = p_fn[idx]
+
+            TP[:,pix] = m_tp
+            TN[:,pix] = m_tn
+            FP[:,pix] = m_fp
+            FN[:,pix] = m_fn
+            NMM[:,pix] = probedf['NMM'][idx]
+            MCC[:,pix] = probedf['MCC'][idx]
+            BWL1[:,pix] = probedf['BWL1'][idx]
+
+            # if nothing is right below it, treat everything as black and recompute NMM and BWL1.
+            if np.any(below):
+                n0 = probedf['N'][0]
+                TP[below,pix] = p_tp[0] + p_fn[0]
+                FP[below,pix] = p_fp[0] + p_tn[0]
+                TN[below,pix] = 0
+                FN[below,pix] = 0
+                MCC[below,pix] = 0.
+                if n0 > 0:
+                    NMM[below,pix] = max([(p_tp[0] + p_fn[0] - p_fp[0] - p_tn[0])/n0,-1])
+                    BWL1[below,pix] = (p_fp[0] + p_tn[0])/n0
+                else:
+                    NMM[below,pix] = np.nan
+                    BWL1[below,pix] = np.nan
+
+            with np.errstate(divide='ignore',invalid='ignore'):
+                TPR[:,pix] = np.where(m_tp + m_fn > 0,m_tp/(m_tp + m_fn),np.nan)
+                FPR[:,pix] = np.where(m_fp + m_tn > 0,m_fp/(m_fp + m_tn),np.nan)
+
+        # probe- and pixel-weighted ROC curves 
+        tpsum = np.nansum(TP,axis=1)
+        tnsum = np.nansum(TN,axis=1)
+        fpsum = np.nansum(FP,axis=1)
+        fnsum = np.nansum(FN,axis=1)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            roc_values = pd.DataFrame({'PixelTPR':np.where(tpsum + fnsum > 0,tpsum/(tpsum + fnsum),np.nan),
+                                       'PixelFPR':np.where(fpsum + tnsum > 0,fpsum/(fpsum + tnsum),np.nan),
+                                       'ProbeTPR':np.nansum(TPR,axis=1)/nprobe,
+                                       'ProbeFPR':np.nansum(FPR,axis=1)/nprobe},index=thresholds)
+
+            #compute biggest average MCC fixing threshold
+            avgMCC = np.nansum(MCC,axis=1)/np.sum(~np.isnan(MCC),axis=1)
+
+        maxThreshold = -1
+        maxMCCdf = 0
+        valid = ~np.isnan(avgMCC) & (avgMCC > -1)
+        if np.any(valid):
+            tix = np.nanargmax(np.where(valid,avgMCC,np.nan))
+            maxThreshold = thresholds[tix]
+            maxMCCdf = pd.DataFrame({''.join([mymode,'FileID']):probelist,
+                                     'Threshold':maxThreshold,
+                                     'NMM':NMM[tix],
+                                     'MCC':MCC[tix],
+                                     'BWL1':BWL1[tix],
+                                     'TP':TP[tix],
+                                     'TN':TN[tix],
+                                     'FP':FP[tix],
+                                     'FN':FN[tix],
+                                     'TPR':TPR[tix],
+                                     'FPR':FPR[tix]})
+
+        return roc_values,maxThreshold,maxMCCdf
+
     #TODO: drop this into a maskMetricsRender.py object later with renderParams object. Ideally would like to generate reports in a separate loop at the end of computations.
     def num2hex(self,color):
         """
@@ -1113,8 +1886,7 @@ class maskMetricRunner:
         *     aggImgName: the above colored mask superimposed on a grayscale of the reference image
         *     myprintbuffer: buffer to append printout for atomic printout
         """
-        if not os.path.isdir(outputRoot):
-            os.system('mkdir ' + outputRoot)
+        self.makeDirs(outputRoot)
 
         #compute the weights
         bwts = np.uint8(b_weights)
@@ -1179,7 +1951,8 @@ class maskMetricRunner:
             if toSequence:
                 journalkeys = ['Sequence'] + journalkeys
 
-            jdata = self.journalData.query("ProbeFileID=='{}' & Color!=''".format(probeFileID))[journalkeys] #("JournalName=='{}'".format(journalID))[['Operation','Purpose','Color',evalcol]] #NOTE: as long as Purpose is in there. It is otherwise dispensible.
+            jdata = self.getJournalRows(probeFileID)
+            jdata = jdata[jdata['Color'] != ''][journalkeys] #("JournalName=='{}'".format(journalID))[['Operation','Purpose','Color',evalcol]] #NOTE: as long as Purpose is in there. It is otherwise dispensible.
             if toSequence:
                 jdata = jdata.sort_values("Sequence",ascending=False)
             #jdata.loc[pd.isnull(jdata['Purpose']),'Purpose'] = '' #make NaN Purposes empty string
@@ -1258,17 +2031,14 @@ class maskMetricRunner:
             myprintbuffer.append("Generating MCC per threshold graph...")
             #plot MCC
             try:
-                import matplotlib
-                matplotlib.use('Agg')
-                import matplotlib.pyplot as plt
-                plt.plot(thresMets['Threshold'],thresMets['MCC'],'bo',thresMets['Threshold'],thresMets['MCC'],'k')
+                thresholds = thresMets['Threshold'].values.astype(float)
+                mccs = thresMets['MCC'].values.astype(float)
                 #plot cyan point for supremum, red point for actual if sbin >= 0, and legend with two or three as appropriate
                 optidx = thresMets['MCC'].idxmax()
                 optT = thresMets.loc[optidx]['Threshold']
                 optMCC = thresMets.loc[optidx]['MCC']
-                optpt, = plt.plot([optT],[optMCC],'co',markersize=12)
-                handles = [optpt]
-                labels = ['Optimal MCC']
+                ptsT = [optT]
+                ptsMCC = [optMCC]
                 if self.sbin >= -1:
                     tlist = thresMets['Threshold'].tolist()
                     actT = sys_threshold
@@ -1278,17 +2048,19 @@ class maskMetricRunner:
                         #get max threshold less than or equal to threshold
                         actT = max([t for t in tlist if t <= sys_threshold])
                         actMCC = thresMets.query("Threshold=={}".format(actT)).iloc[0]['MCC']
-                    actpt, = plt.plot([actT],[actMCC],'ro',markersize=8)
-                    handles.append(actpt)
-                    labels.append('Actual MCC')
-                plt.legend(handles,labels,loc='upper right', borderaxespad=0, prop={'size':8}, shadow=True, fontsize='small',numpoints=1)
-                plt.suptitle('MCC per Threshold',fontsize=14)
-                plt.xlabel("Binarization threshold value")
-                plt.ylabel("Matthews Correlation Coefficient (MCC)")
-                thresString = os.path.join(outputRoot,'thresMets.png')
-                plt.savefig(thresString,bbox_inches='tight') #save the graph
-                plt.close()
-                thresString = "<img src=\"{}\" alt=\"thresholds graph\" style=\"width:{}px;\">".format('thresMets.png',plt_width)
+                    ptsT.append(actT)
+                    ptsMCC.append(actMCC)
+
+                xlim = autoLimits(np.append(thresholds,ptsT))
+                ylim = autoLimits(np.append(mccs,ptsMCC))
+                myplot = svgPlot(xlim,ylim,niceTicks(xlim[0],xlim[1]),niceTicks(ylim[0],ylim[1]))
+                myplot.line(thresholds,mccs,color='black')
+                myplot.markers(thresholds,mccs,color='blue',size=3)
+                myplot.markers([optT],[optMCC],color='cyan',size=6,label='Optimal MCC')
+                if self.sbin >= -1:
+                    myplot.markers([actT],[actMCC],color='red',size=4,label='Actual MCC')
+                myplot.save(os.path.join(outputRoot,'thresMets.svg'),title='MCC per Threshold',xlabel="Binarization threshold value",ylabel="Matthews Correlation Coefficient (MCC)")
+                thresString = "<img src=\"{}\" alt=\"thresholds graph\" style=\"width:{}px;\">".format('thresMets.svg',plt_width)
             except:
                 raise
                 e = sys.exc_info()[0]
@@ -1525,6 +2297,26 @@ class maskMetricRunner:
         return tablestring
 
     #prints out the aggregate mask, reference and other data
+    def getColorMaskNames(self,sys,outputMaskPath):
+        """
+        *Description: this function generates the paths of the images produced by aggregateColorMask
+
+        * Inputs:
+        *     sys: the system output mask file to be evaluated
+        *     outputMaskPath: the directory in which to output the composite images
+
+        * Output
+        *     a dictionary containing the colored mask path and the aggregate mask path
+        """
+        outputMaskName = sys.name.split('/')[-1]
+        outputMaskBase = outputMaskName.split('.')[0]
+        path = os.path.join(outputMaskPath,"_".join([outputMaskBase,"colored.jpg"]))
+        if not self.usejpeg2000:
+            compositePath = os.path.join(outputMaskPath,"_".join([outputMaskBase,"composite.jpg"]))
+        else:
+            compositePath = os.path.join(outputMaskPath,"_".join([outputMaskBase,"composite.png"]))
+        return {'mask':path,'agg':compositePath}
+
     def aggregateColorMask(self,ref,sys,bns,sns,pns,kern,erodeKernSize,maniImgName,outputMaskPath,colordict):
         """
         *Description: this function produces the aggregate mask image of the ground truth, system output,
@@ -1546,35 +2338,21 @@ class maskMetricRunner:
         *     a dictionary containing the colored mask path and the aggregate mask path
         """
 
-        #set new image as some RGB
-        mydims = ref.get_dims()
-        mycolor = 255*np.ones((mydims[0],mydims[1],3),dtype=np.uint8)
-
         if erodeKernSize > 0:
-            eKern = masks.getKern(kern,erodeKernSize)
-            eData = 255 - cv2.erode(255 - ref.bwmat,eKern,iterations=1)
+            eData = 255 - masks.erodeMask(255 - ref.bwmat,kern,erodeKernSize)
         else:
             eData = ref.bwmat
 
-        #flip all because black is 0 by default. Use the regions to determine where to color.
-        b_sImg = 1-sys.bwmat/255
-        b_eImg = 1-eData/255 #erosion of black/white reference mask
-        b_bnsImg = 1-bns
-        b_snsImg = 1-sns
-        b_pnsImg = 1-pns
-
-        b_sImg[b_sImg != 0] = 1
-        b_eImg[b_eImg != 0] = 2
-        b_bnsImg[b_bnsImg != 0] = 4
-        b_snsImg[b_snsImg != 0] = 8
-        if b_pnsImg is not 1:
-            b_pnsImg[b_pnsImg != 0] = 16
-        else:
-            b_pnsImg = 0
-
-        mImg = b_sImg + b_eImg + b_bnsImg + b_snsImg + b_pnsImg
+        #encode the state of each pixel as bits of a single code image. Black is 0 by default,
+        #and the weights are 0 in their no-score zones.
+        mImg = (sys.bwmat != 255).view(np.uint8).copy() #system mask
+        mImg |= (eData != 255).view(np.uint8) << 1 #erosion of black/white reference mask
+        mImg |= (bns != 1).view(np.uint8) << 2
+        mImg |= (sns != 1).view(np.uint8) << 3
+        if pns is not 0:
+            mImg |= (pns != 1).view(np.uint8) << 4
 
-        #set pixels equal to some value:
+        #map codes to colors:
         #red to false accept and false reject
         #blue to no-score zone
         #pink to no-score zone that intersects with system mask
@@ -1582,18 +2360,19 @@ class maskMetricRunner:
         #black to true negatives
 
         #get colors through colordict
-        mycolor[mImg==1] = colordict['red'] #only system (FP)
-        mycolor[mImg==2] = colordict['blue'] #only erode image (FN) (the part that is scored)
-        mycolor[mImg==3] = colordict['green'] #system and erode image coincide (TP)
-        mycolor[(mImg>=4) & (mImg <=7)] = colordict['yellow'] #boundary no-score zone
-        mycolor[(mImg>=8) & (mImg <=15)] = colordict['pink'] #selection no-score zone
-        mycolor[mImg>=16] = colordict['purple'] #system opt out
+        palette = 255*np.ones((32,3),dtype=np.uint8)
+        palette[1] = colordict['red'] #only system (FP)
+        palette[2] = colordict['blue'] #only erode image (FN) (the part that is scored)
+        palette[3] = colordict['green'] #system and erode image coincide (TP)
+        palette[4:8] = colordict['yellow'] #boundary no-score zone
+        palette[8:16] = colordict['pink'] #selection no-score zone
+        palette[16:32] = colordict['purple'] #system opt out
+        mycolor = np.take(palette,mImg,axis=0)
 
         #return path to mask
-        outputMaskName = sys.name.split('/')[-1]
-        outputMaskBase = outputMaskName.split('.')[0]
-        finalMaskName = "_".join([outputMaskBase,"colored.jpg"])
-        path=os.path.join(outputMaskPath,finalMaskName)
+        names = self.getColorMaskNames(sys,outputMaskPath)
+        path = names['mask']
+        compositePath = names['agg']
         #write the aggregate mask to file
         cv2.imwrite(path,mycolor)
 
@@ -1617,8 +2396,6 @@ class maskMetricRunner:
             modified = cv2.addWeighted(ref.matrix,alpha,m3chan,1-alpha,0)
             myagg[refbw==0] = modified[refbw==0]
     
-            compositeMaskName = "_".join([outputMaskBase,"composite.jpg"])
-            compositePath = os.path.join(outputMaskPath,compositeMaskName)
             cv2.imwrite(compositePath,myagg)
         else:
             aseq = ref.getAnimatedMask('partial')
@@ -1631,8 +2408,6 @@ class maskMetricRunner:
                 #overlay colors with particular manipulated regions
                 aggfr[layermask != 0] = modified[layermask != 0]
                 seq.append(aggfr)
-            compositeMaskName = "_".join([outputMaskBase,"composite.png"])
-            compositePath = os.path.join(outputMaskPath,compositeMaskName)
             write_apng(compositePath,seq,delay=600,use_palette=False)
 
         return {'mask':path,'agg':compositePath}
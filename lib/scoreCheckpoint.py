@@ -0,0 +1,97 @@
+#!/usr/bin/python
+
+"""
+ *File: scoreCheckpoint.py
+ *Date: 10/18/2026
+ *Original Author: Daniel Zhou
+ *Co-Author: Yooyoung Lee
+ *Status: Complete
+
+ *Description: this code contains a durable record of the masks scored so far in a run, so that
+               a run that is interrupted can be resumed without rescoring the masks it already
+               finished.
+
+
+ *Disclaimer:
+ This software was developed at the National Institute of Standards
+ and Technology (NIST) by employees of the Federal Government in the
+ course of their official duties. Pursuant to Title 17 Section 105
+ of the United States Code, this software is not subject to copyright
+ protection and is in the public domain. NIST assumes no responsibility
+ whatsoever for use by other parties of its source code or open source
+ server, and makes no guarantees, expressed or implied, about its quality,
+ reliability, or any other characteristic."
+"""
+import sqlite3
+import pickle
+
+class scoreCheckpoint:
+    """
+    This class appends the scored rows and threshold tables to an SQLite database as each batch of
+    masks finishes. Each batch is committed on its own, so that the batches recorded before a crash
+    are kept. Batches are grouped under a scope naming the scoring pass they belong to.
+    """
+    def __init__(self,path,params):
+        """
+        Constructor
+
+        Attributes:
+        - path: the name of the database file. It is created if it does not exist
+        - params: a string describing the parameters the scores depend on. Must match the string
+                  recorded in an existing database
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS batches (scope TEXT, rows BLOB, thresscores BLOB)")
+        self.db.commit()
+
+        row = self.db.execute("SELECT value FROM meta WHERE key='params'").fetchone()
+        if row is None:
+            self.db.execute("INSERT INTO meta VALUES ('params',?)",(params,))
+            self.db.commit()
+            self.params = params
+        else:
+            self.params = row[0]
+
+    def matches(self,params):
+        """
+        * Description: checks whether the checkpoint was recorded with the same parameters
+        * Inputs:
+        *     params: the string describing the parameters of the current run
+        * Outputs:
+        *     True if the parameters match, False otherwise
+        """
+        return self.params == params
+
+    def add(self,scope,rows,thresscores):
+        """
+        * Description: records a batch of scored masks
+        * Inputs:
+        *     scope: the name of the scoring pass the batch belongs to
+        *     rows: the dataframe of the scored rows
+        *     thresscores: the dictionary of threshold tables of the scored masks, keyed by file ID
+        """
+        self.db.execute("INSERT INTO batches VALUES (?,?,?)",(scope,
+                                                               sqlite3.Binary(pickle.dumps(rows,pickle.HIGHEST_PROTOCOL)),
+                                                               sqlite3.Binary(pickle.dumps(thresscores,pickle.HIGHEST_PROTOCOL))))
+        self.db.commit()
+
+    def load(self,scope):
+        """
+        * Description: fetches the batches recorded for the scope
+        * Inputs:
+        *     scope: the name of the scoring pass
+        * Outputs:
+        *     the list of dataframes of the scored rows, and the dictionary of threshold tables
+              merged across the batches
+        """
+        frames = []
+        thresscores = {}
+        for rows,thres in self.db.execute("SELECT rows,thresscores FROM batches WHERE scope=? ORDER BY rowid",(scope,)):
+            frames.append(pickle.loads(str(rows)))
+            thresscores.update(pickle.loads(str(thres)))
+        return frames,thresscores
+
+    def close(self):
+        self.db.close()
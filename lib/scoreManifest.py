@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+"""
+ *File: scoreManifest.py
+ *Date: 10/18/2026
+ *Original Author: Daniel Zhou
+ *Co-Author: Yooyoung Lee
+ *Status: Complete
+
+ *Description: this code contains a store of the scores of each mask keyed by a hash of everything
+               the scores depend on, so that rescoring a resubmission only recomputes the masks
+               whose inputs have changed.
+
+
+ *Disclaimer:
+ This software was developed at the National Institute of Standards
+ and Technology (NIST) by employees of the Federal Government in the
+ course of their official duties. Pursuant to Title 17 Section 105
+ of the United States Code, this software is not subject to copyright
+ protection and is in the public domain. NIST assumes no responsibility
+ whatsoever for use by other parties of its source code or open source
+ server, and makes no guarantees, expressed or implied, about its quality,
+ reliability, or any other characteristic."
+"""
+import os
+import hashlib
+import sqlite3
+import pickle
+
+class scoreManifest:
+    """
+    This class stores the scored row and the threshold table of each mask in an SQLite database,
+    keyed by a hash of the contents of the reference and system output masks and the parameters
+    the scores depend on.
+    """
+    def __init__(self,path):
+        """
+        Constructor
+
+        Attributes:
+        - path: the name of the database file. It is created if it does not exist
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS masks (key TEXT PRIMARY KEY, row BLOB, thresscores BLOB)")
+        self.db.commit()
+
+    def getKey(self,fnames,params):
+        """
+        * Description: computes the manifest key for a mask
+        * Inputs:
+        *     fnames: the list of names of the files the scores depend on. Files that do not exist are
+                      hashed by name
+        *     params: a list of the other inputs the scores depend on. Must have a stable repr
+        * Outputs:
+        *     the hex digest of the hash of the file contents and parameters
+        """
+        h = hashlib.md5()
+        for fname in fnames:
+            if not os.path.isfile(fname):
+                h.update(repr(fname).encode('utf-8'))
+                continue
+            with open(fname,'rb') as f:
+                for block in iter(lambda: f.read(1 << 20),b''):
+                    h.update(block)
+        h.update(repr(params).encode('utf-8'))
+        return h.hexdigest()
+
+    def load(self,keys):
+        """
+        * Description: fetches the stored entries for the keys
+        * Inputs:
+        *     keys: the list of manifest keys as returned by getKey
+        * Outputs:
+        *     a dictionary of the scored row and threshold table of each key found in the manifest
+        """
+        entries = {}
+        keys = list(keys)
+        #query in chunks to stay within the limit on the number of SQL variables
+        for i in range(0,len(keys),500):
+            chunk = keys[i:(i+500)]
+            query = "SELECT key,row,thresscores FROM masks WHERE key IN ({})".format(','.join(['?']*len(chunk)))
+            for key,row,thres in self.db.execute(query,chunk):
+                entries[key] = (pickle.loads(str(row)),pickle.loads(str(thres)))
+        return entries
+
+    def add(self,entries):
+        """
+        * Description: stores the scored masks
+        * Inputs:
+        *     entries: a list of the manifest key, the dataframe of the scored row, and the threshold
+                       table of each mask
+        """
+        self.db.executemany("INSERT OR REPLACE INTO masks VALUES (?,?,?)",[(key,
+                                                                            sqlite3.Binary(pickle.dumps(row,pickle.HIGHEST_PROTOCOL)),
+                                                                            sqlite3.Binary(pickle.dumps(thres,pickle.HIGHEST_PROTOCOL))) for key,row,thres in entries])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
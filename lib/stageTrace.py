@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+"""
+ *File: stageTrace.py
+ *Date: 10/18/2026
+ *Original Author: Daniel Zhou
+ *Co-Author: Yooyoung Lee
+ *Status: Complete
+
+ *Description: this code contains the trace of the time and memory taken by each stage of scoring
+               a mask, and the summary of the slowest stages and masks in a trace.
+
+
+ *Disclaimer:
+ This software was developed at the National Institute of Standards
+ and Technology (NIST) by employees of the Federal Government in the
+ course of their official duties. Pursuant to Title 17 Section 105
+ of the United States Code, this software is not subject to copyright
+ protection and is in the public domain. NIST assumes no responsibility
+ whatsoever for use by other parties of its source code or open source
+ server, and makes no guarantees, expressed or implied, about its quality,
+ reliability, or any other characteristic."
+"""
+import time
+import pandas as pd
+from collections import OrderedDict
+try:
+    import resource
+except ImportError:
+    #peak memory is not available on this platform. Only the time is traced
+    resource = None
+
+traceColumns = ['Mode','FileID','Stage','Seconds','PeakRSSDeltaKB']
+
+def peakRSS():
+    """
+    * Description: gets the peak resident set size of the process so far
+    * Outputs:
+    *     the peak resident set size, in kilobytes on Linux. 0 if not available
+    """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def startTrace(fileName,append=False):
+    """
+    * Description: starts the trace file with its header, unless it is appended to
+    * Inputs:
+    *     fileName: the name of the trace file
+    *     append: whether to keep the rows already in the file
+    """
+    if append:
+        try:
+            with open(fileName,'r') as f:
+                if f.readline() != '':
+                    return
+        except IOError:
+            pass
+    with open(fileName,'w') as f:
+        f.write('|'.join(traceColumns) + '\n')
+
+class stageTrace:
+    """
+    This class records the wall time and the growth in peak memory of each stage of scoring one mask.
+    The stages are timed from one call of lap to the next, and a stage timed more than once is summed.
+    Nothing is recorded if no trace file is given.
+    """
+    def __init__(self,fileName,mode,fileID):
+        """
+        Constructor
+
+        Attributes:
+        - fileName: the name of the trace file to append to. 0 to disable tracing
+        - mode: the kind of mask being scored, 'Probe' or 'Donor'
+        - fileID: the file ID of the mask being scored
+        """
+        self.fileName = fileName
+        if fileName is 0:
+            return
+        self.mode = mode
+        self.fileID = fileID
+        self.stages = OrderedDict()
+        self.lastTime = time.time()
+        self.lastRSS = peakRSS()
+
+    def lap(self,stage):
+        """
+        * Description: records the time and peak memory growth since the last lap under the stage
+        * Inputs:
+        *     stage: the name of the stage that just finished
+        """
+        if self.fileName is 0:
+            return
+        now = time.time()
+        rss = peakRSS()
+        seconds,kb = self.stages.get(stage,(0,0))
+        self.stages[stage] = (seconds + now - self.lastTime,kb + rss - self.lastRSS)
+        self.lastTime = now
+        self.lastRSS = rss
+
+    def write(self,lock):
+        """
+        * Description: appends the recorded stages to the trace file
+        * Inputs:
+        *     lock: the lock shared by the processes writing to the trace file
+        """
+        if (self.fileName is 0) or (len(self.stages) == 0):
+            return
+        lines = ''.join(['|'.join([self.mode,str(self.fileID),stage,'{:.6f}'.format(seconds),str(kb)]) + '\n' for stage,(seconds,kb) in self.stages.items()])
+        lock.acquire()
+        try:
+            with open(self.fileName,'a') as f:
+                f.write(lines)
+        finally:
+            lock.release()
+        self.stages = OrderedDict()
+
+def summarizeTrace(fileName,n=5):
+    """
+    * Description: summarizes the stages and masks taking the most time in a trace file
+    * Inputs:
+    *     fileName: the name of the trace file
+    *     n: the number of masks to list
+    * Outputs:
+    *     a printable summary of the total time and peak memory growth of each stage, and of the
+          slowest masks with their slowest stage
+    """
+    trace = pd.read_csv(fileName,sep="|",header=0,dtype={'FileID':str},na_filter=False)
+    if trace.shape[0] == 0:
+        return "The stage trace {} is empty.".format(fileName)
+
+    stages = trace.groupby('Stage').agg({'Seconds':['sum','max'],'PeakRSSDeltaKB':'max'})
+    stages.columns = ['TotalSeconds','MaxSeconds','MaxPeakRSSDeltaKB']
+    stages = stages.sort_values(by='TotalSeconds',ascending=False)
+
+    perMask = trace.groupby(['Mode','FileID'])
+    masks = perMask['Seconds'].sum().to_frame('TotalSeconds')
+    masks['SlowestStage'] = trace.loc[perMask['Seconds'].idxmax(),['Mode','FileID','Stage']].set_index(['Mode','FileID'])['Stage']
+    masks = masks.sort_values(by='TotalSeconds',ascending=False).head(n)
+
+    return '\n'.join(["Time per stage in {}:".format(fileName),
+                      stages.to_string(),
+                      "Slowest {} masks:".format(masks.shape[0]),
+                      masks.to_string()])
@@ -0,0 +1,345 @@
+#!/usr/bin/python
+
+"""
+ *File: svgPlot.py
+ *Date: 10/18/2026
+ *Original Author: Daniel Zhou
+ *Co-Author: Yooyoung Lee
+ *Status: Complete
+
+ *Description: this code contains a lightweight plotter that writes fixed-layout line plots directly
+               as SVG images or single-page PDF documents. It is used for the plots drawn for every
+               probe, where setting up and saving a matplotlib figure would otherwise dominate the
+               time spent on the report.
+
+
+ *Disclaimer:
+ This software was developed at the National Institute of Standards
+ and Technology (NIST) by employees of the Federal Government in the
+ course of their official duties. Pursuant to Title 17 Section 105
+ of the United States Code, this software is not subject to copyright
+ protection and is in the public domain. NIST assumes no responsibility
+ whatsoever for use by other parties of its source code or open source
+ server, and makes no guarantees, expressed or implied, about its quality,
+ reliability, or any other characteristic."
+"""
+import math
+import numpy as np
+from xml.sax.saxutils import escape
+
+#RGB values of the named colors used by the plots
+colorValues = {'black':(0,0,0),
+               'white':(255,255,255),
+               'red':(255,0,0),
+               'blue':(0,0,255),
+               'cyan':(0,255,255)}
+
+def niceTicks(lo,hi,n=6):
+    """
+    * Description: picks evenly spaced tick values at round numbers covering the range
+    * Inputs:
+    *     lo: the lower end of the range
+    *     hi: the upper end of the range
+    *     n: the approximate number of ticks
+    * Outputs:
+    *     the list of tick values
+    """
+    if hi <= lo:
+        lo = lo - 1
+        hi = hi + 1
+    raw = (hi - lo)/float(n)
+    mag = 10**math.floor(math.log10(raw))
+    step = 10*mag
+    for m in [1,2,2.5,5]:
+        if m*mag >= raw:
+            step = m*mag
+            break
+    start = math.ceil(lo/step)*step
+    #adding 0 clears negative zeros
+    return [round(t,10) + 0. for t in np.arange(start,hi + step*1e-9,step)]
+
+def autoLimits(values,margin=0.05):
+    """
+    * Description: computes axis limits spanning the finite values with a margin on either side
+    * Inputs:
+    *     values: the data values to be plotted along the axis
+    *     margin: the fraction of the data range to add on either side
+    * Outputs:
+    *     the pair of lower and upper limits
+    """
+    values = np.asarray(values,dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return [0.,1.]
+    lo = values.min()
+    hi = values.max()
+    if hi == lo:
+        return [lo - 1,hi + 1]
+    pad = margin*(hi - lo)
+    return [lo - pad,hi + pad]
+
+class svgPlot:
+    """
+    This class draws lines, markers, and annotations over a single set of axes and writes them
+    as an SVG image or a PDF document.
+    """
+    def __init__(self,xlim,ylim,xticks,yticks,xticklabels=0,yticklabels=0,width=540,height=500):
+        """
+        Constructor
+
+        Attributes:
+        - xlim: the lower and upper limits of the x axis
+        - ylim: the lower and upper limits of the y axis
+        - xticks: the values at which to place ticks on the x axis
+        - yticks: the values at which to place ticks on the y axis
+        - xticklabels: the labels of the ticks on the x axis. 0 to print the tick values
+        - yticklabels: the labels of the ticks on the y axis. 0 to print the tick values
+        - width: the width of the image in pixels
+        - height: the height of the image in pixels
+        """
+        self.xlim = xlim
+        self.ylim = ylim
+        self.xticks = xticks
+        self.yticks = yticks
+        if xticklabels is 0:
+            xticklabels = ['{:g}'.format(t) for t in xticks]
+        if yticklabels is 0:
+            yticklabels = ['{:g}'.format(t) for t in yticks]
+        self.xticklabels = xticklabels
+        self.yticklabels = yticklabels
+        self.width = width
+        self.height = height
+
+        #plot area within the image
+        self.left = 70
+        self.right = width - 20
+        self.top = 45
+        self.bottom = height - 55
+
+        #drawing primitives in image coordinates, rendered when the plot is saved
+        self.elements = []
+        self.legend = []
+
+    def px(self,x):
+        return self.left + (x - self.xlim[0])*(self.right - self.left)/float(self.xlim[1] - self.xlim[0])
+
+    def py(self,y):
+        return self.bottom - (y - self.ylim[0])*(self.bottom - self.top)/float(self.ylim[1] - self.ylim[0])
+
+    def line(self,xs,ys,color='black',width=1,dash=''):
+        """
+        * Description: draws a line through the points. The line is broken at non-finite values
+        * Inputs:
+        *     xs: the x coordinates of the points
+        *     ys: the y coordinates of the points
+        *     color: the color of the line
+        *     width: the width of the line in pixels
+        *     dash: the SVG dash pattern of the line, if dashed
+        """
+        segment = []
+        for x,y in zip(np.asarray(xs,dtype=float),np.asarray(ys,dtype=float)):
+            if np.isfinite(x) and np.isfinite(y):
+                segment.append((self.px(x),self.py(y)))
+                continue
+            if len(segment) > 1:
+                self.elements.append(('polyline',segment,color,width,dash))
+            segment = []
+        if len(segment) > 1:
+            self.elements.append(('polyline',segment,color,width,dash))
+
+    def markers(self,xs,ys,color='black',size=3,label=''):
+        """
+        * Description: draws circular markers at the points, skipping non-finite values
+        * Inputs:
+        *     xs: the x coordinates of the points
+        *     ys: the y coordinates of the points
+        *     color: the fill color of the markers
+        *     size: the radius of the markers in pixels
+        *     label: the label of the markers in the legend. Left out of the legend if empty
+        """
+        for x,y in zip(np.asarray(xs,dtype=float),np.asarray(ys,dtype=float)):
+            if np.isfinite(x) and np.isfinite(y):
+                self.elements.append(('circle',self.px(x),self.py(y),size,color))
+        if label != '':
+            self.legend.append((color,size,label))
+
+    def annotate(self,x,y,lines,size=10):
+        """
+        * Description: writes boxed text centered at the point
+        * Inputs:
+        *     x: the x coordinate of the center of the text
+        *     y: the y coordinate of the center of the text
+        *     lines: the list of lines of text
+        *     size: the font size in pixels
+        """
+        cx = self.px(x)
+        cy = self.py(y)
+        boxw = 0.6*size*max([len(l) for l in lines]) + 12
+        boxh = 1.2*size*len(lines) + 8
+        self.elements.append(('rect',cx - boxw/2,cy - boxh/2,boxw,boxh,'white','black'))
+        for i,l in enumerate(lines):
+            ly = cy - boxh/2 + 4 + 1.2*size*(i + 0.8)
+            self.elements.append(('text',cx,ly,size,'middle',l,0))
+
+    def layout(self,title,xlabel,ylabel):
+        """
+        * Description: lays out the axes, grid, labels, and legend around the drawn elements
+        * Inputs:
+        *     title: the title of the plot
+        *     xlabel: the label of the x axis
+        *     ylabel: the label of the y axis
+        * Outputs:
+        *     the full list of drawing primitives of the plot
+        """
+        prims = [('rect',0,0,self.width,self.height,'white','none')]
+
+        #grid and ticks
+        for t,l in zip(self.xticks,self.xticklabels):
+            x = self.px(t)
+            prims.append(('polyline',[(x,self.top),(x,self.bottom)],'#b0b0b0',0.5,'2,2'))
+            prims.append(('text',x,self.bottom + 15,10,'middle',l,0))
+        for t,l in zip(self.yticks,self.yticklabels):
+            y = self.py(t)
+            prims.append(('polyline',[(self.left,y),(self.right,y)],'#b0b0b0',0.5,'2,2'))
+            prims.append(('text',self.left - 5,y + 3,10,'end',l,0))
+        prims.append(('rect',self.left,self.top,self.right - self.left,self.bottom - self.top,'none','black'))
+
+        prims.extend(self.elements)
+
+        #titles
+        prims.append(('text',self.width/2.,25,14,'middle',title,0))
+        prims.append(('text',(self.left + self.right)/2.,self.height - 15,11,'middle',xlabel,0))
+        prims.append(('text',18,(self.top + self.bottom)/2.,11,'middle',ylabel,-90))
+
+        #legend in the upper right
+        if len(self.legend) > 0:
+            lw = 6*max([len(l[2]) for l in self.legend]) + 40
+            lh = 18*len(self.legend) + 6
+            lx = self.right - lw - 8
+            ly = self.top + 8
+            prims.append(('rect',lx,ly,lw,lh,'white','#808080'))
+            for i,(color,size,label) in enumerate(self.legend):
+                iy = ly + 12 + 18*i
+                prims.append(('circle',lx + 14,iy,size,color))
+                prims.append(('text',lx + 28,iy + 4,10,'start',label,0))
+        return prims
+
+    def renderSVG(self,prims):
+        """
+        * Description: renders the drawing primitives as an SVG image
+        * Inputs:
+        *     prims: the list of drawing primitives
+        * Outputs:
+        *     the text of the SVG image
+        """
+        svg = ['<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" viewBox="0 0 {} {}" font-family="sans-serif">'.format(self.width,self.height,self.width,self.height)]
+        for p in prims:
+            if p[0] == 'polyline':
+                dashattr = ''
+                if p[4] != '':
+                    dashattr = ' stroke-dasharray="{}"'.format(p[4])
+                svg.append('<polyline points="{}" fill="none" stroke="{}" stroke-width="{}"{}/>'.format(' '.join(['{:.2f},{:.2f}'.format(x,y) for x,y in p[1]]),p[2],p[3],dashattr))
+            elif p[0] == 'circle':
+                svg.append('<circle cx="{:.2f}" cy="{:.2f}" r="{}" fill="{}"/>'.format(p[1],p[2],p[3],p[4]))
+            elif p[0] == 'rect':
+                svg.append('<rect x="{:.2f}" y="{:.2f}" width="{:.2f}" height="{:.2f}" fill="{}" stroke="{}"/>'.format(*p[1:]))
+            elif p[0] == 'text':
+                x,y,size,anchor,text,rotate = p[1:]
+                rotattr = ''
+                if rotate != 0:
+                    rotattr = ' transform="rotate({} {:.2f} {:.2f})"'.format(rotate,x,y)
+                svg.append('<text x="{:.2f}" y="{:.2f}" font-size="{}" text-anchor="{}"{}>{}</text>'.format(x,y,size,anchor,rotattr,escape(text)))
+        svg.append('</svg>')
+        return '\n'.join(svg)
+
+    def renderPDF(self,prims):
+        """
+        * Description: renders the drawing primitives as a single-page PDF document, with the
+                       text set in the standard Helvetica font
+        * Inputs:
+        *     prims: the list of drawing primitives
+        * Outputs:
+        *     the bytes of the PDF document
+        """
+        h = self.height
+        def rgb(color):
+            if color.startswith('#'):
+                c = [int(color[i:i+2],16) for i in [1,3,5]]
+            else:
+                c = colorValues[color]
+            return ' '.join(['{:.3f}'.format(v/255.) for v in c])
+
+        ops = []
+        for p in prims:
+            if p[0] == 'polyline':
+                pts,color,width,dash = p[1:]
+                dashop = '[] 0 d'
+                if dash != '':
+                    dashop = '[{}] 0 d'.format(dash.replace(',',' '))
+                path = ['{:.2f} {:.2f} {}'.format(x,h - y,'m' if i == 0 else 'l') for i,(x,y) in enumerate(pts)]
+                ops.append('{} RG {} w {} {} S'.format(rgb(color),width,dashop,' '.join(path)))
+            elif p[0] == 'circle':
+                cx,cy,r,color = p[1:]
+                cy = h - cy
+                #four Bezier arcs approximating the circle
+                k = 0.5523*r
+                ops.append('{} rg {:.2f} {:.2f} m {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} c {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} c {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} c {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} c f'.format(rgb(color),
+                           cx + r,cy,
+                           cx + r,cy + k,cx + k,cy + r,cx,cy + r,
+                           cx - k,cy + r,cx - r,cy + k,cx - r,cy,
+                           cx - r,cy - k,cx - k,cy - r,cx,cy - r,
+                           cx + k,cy - r,cx + r,cy - k,cx + r,cy))
+            elif p[0] == 'rect':
+                x,y,w,rh,fill,stroke = p[1:]
+                box = '{:.2f} {:.2f} {:.2f} {:.2f} re'.format(x,h - y - rh,w,rh)
+                if fill != 'none':
+                    ops.append('{} rg {} f'.format(rgb(fill),box))
+                if stroke != 'none':
+                    ops.append('{} RG 1 w [] 0 d {} S'.format(rgb(stroke),box))
+            elif p[0] == 'text':
+                x,y,size,anchor,text,rotate = p[1:]
+                text = text.encode('latin-1','replace') if isinstance(text,unicode) else str(text)
+                #Helvetica glyphs average about half the font size in width
+                shift = {'start':0,'middle':0.5,'end':1}[anchor]*0.5*size*len(text)
+                text = text.replace('\\','\\\\').replace('(','\\(').replace(')','\\)')
+                if rotate == 0:
+                    tm = '1 0 0 1 {:.2f} {:.2f}'.format(x - shift,h - y)
+                else:
+                    #rotated a quarter turn counterclockwise, reading upwards
+                    tm = '0 1 -1 0 {:.2f} {:.2f}'.format(x,h - y - shift)
+                ops.append('0 0 0 rg BT /F1 {} Tf {} Tm ({}) Tj ET'.format(size,tm,text))
+        content = '\n'.join(ops)
+
+        objects = ['<< /Type /Catalog /Pages 2 0 R >>',
+                   '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+                   '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {} {}] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>'.format(self.width,self.height),
+                   '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+                   '<< /Length {} >>\nstream\n{}\nendstream'.format(len(content) + 1,content)]
+        pdf = '%PDF-1.4\n'
+        offsets = []
+        for i,o in enumerate(objects):
+            offsets.append(len(pdf))
+            pdf += '{} 0 obj\n{}\nendobj\n'.format(i + 1,o)
+        xref = len(pdf)
+        pdf += 'xref\n0 {}\n0000000000 65535 f \n'.format(len(objects) + 1)
+        pdf += ''.join(['{:010d} 00000 n \n'.format(o) for o in offsets])
+        pdf += 'trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n'.format(len(objects) + 1,xref)
+        return pdf
+
+    def save(self,path,title='',xlabel='',ylabel=''):
+        """
+        * Description: writes the plot with its axes, grid, labels, and legend to file
+        * Inputs:
+        *     path: the name of the file to write. Files ending in '.pdf' are written as PDF
+                    documents and all others as SVG images
+        *     title: the title of the plot
+        *     xlabel: the label of the x axis
+        *     ylabel: the label of the y axis
+        """
+        prims = self.layout(title,xlabel,ylabel)
+        if path.lower().endswith('.pdf'):
+            with open(path,'wb') as f:
+                f.write(self.renderPDF(prims))
+        else:
+            with open(path,'w') as f:
+                f.write(self.renderSVG(prims))
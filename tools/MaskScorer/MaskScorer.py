@@ -35,6 +35,9 @@ import cv2
 import pandas as pd
 import argparse
 import numpy as np
+import tempfile
+import shutil
+import atexit
 #import maskreport as mr
 #import pdb #debug purposes
 from abc import ABCMeta, abstractmethod
@@ -43,7 +46,11 @@ from abc import ABCMeta, abstractmethod
 #lib_path = "../../lib"
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../lib")
 sys.path.append(lib_path)
-from metricRunner import maskMetricRunner
+from metricRunner import maskMetricRunner,finishReports,scoreQueries,startPool,stopPool
+from maskCache import maskCache
+from scoreCheckpoint import scoreCheckpoint
+from scoreManifest import scoreManifest
+from stageTrace import startTrace,summarizeTrace
 import Partition_mask as pt
 import Render
 #import masks
@@ -80,6 +87,8 @@ parser.add_argument('-x','--inIndex',type=str,default=indexFname,
 help='Task Index csv file name: [e.g., indexes/NC2016-manipulation-index.csv]',metavar='character')
 parser.add_argument('-oR','--outRoot',type=str,
 help="Directory root plus prefix to save outputs.",metavar='character')
+parser.add_argument('-bF','--batchFile',type=str,default=None,
+help="A pipe-separated file listing several system output csv files to score against the same reference in one run, with the system output csv file names under the column 'inSys' and the directory root plus prefix for each one's outputs under the column 'outRoot'. The reference masks and their no-score zones are computed once for the whole batch. Replaces -s and -oR.",metavar='character')
 parser.add_argument('--outMeta',action='store_true',help='Save the CSV file with the system scores with minimal metadata')
 parser.add_argument('--outAllmeta',action='store_true',help='Save the CSV file with the system scores with all metadata')
 
@@ -118,11 +127,24 @@ parser.add_argument('-p','--processors',type=int,default=1,
 help="The number of processors to use in the computation. Choosing too many processors will cause the program to forcibly default to a smaller number. [default=1].",metavar='positive integer')
 parser.add_argument('--precision',type=int,default=16,
 help="The number of digits to round computed scores, [e.g. a score of 0.3333333333333... will round to 0.33333 for a precision of 5], [default=16].",metavar='positive integer')
-parser.add_argument('-html',help="Output data to HTML files.",action="store_true")
+parser.add_argument('-html',help="Output data to HTML files. Same as --outputLevel html.",action="store_true")
+parser.add_argument('--outputLevel',type=str,default='masks',choices=['metrics','masks','html'],
+help="The files to write for each probe: 'metrics' writes no files or directories for the probes, only the score tables; 'masks' also writes the binarized masks and the ROC curve of each probe; 'html' also writes the HTML report of each probe, with its MCC per threshold plot as thresMets.svg. [default=masks]",metavar='character')
 parser.add_argument('--optOut',action='store_true',help="Evaluate algorithm performance on a select number of trials determined by the performer via values in the ProbeStatus column.")
 parser.add_argument('--displayScoredOnly',action='store_true',help="Display only the data for which a localized score could be generated.")
 parser.add_argument('-xF','--indexFilter',action='store_true',help="Filter scoring to only files that are present in the index file. This option permits scoring to select index files for the purpose of testing, and may accept system outputs that have not passed the validator.")
 parser.add_argument('--speedup',action='store_true',help="Run mask evaluation with a sped-up evaluator.")
+parser.add_argument('--packBits',action='store_true',help="Compute the metrics at the actual threshold on masks packed eight pixels to a byte. The packed reference masks are kept in the reference mask cache, if any, for the other system outputs. Applies only with --speedup.")
+parser.add_argument('--cropROI',action='store_true',help="Compute the metrics of each mask only within the bounding box of the reference region, the no-score zones, and the non-white system output pixels, and count the pixels outside of it directly. The scores are unchanged. Applies only with --speedup.")
+parser.add_argument('--rle',action='store_true',help="Compute the metrics at the actual threshold by intersecting the runs of run-length encoded masks. The runs of each thresholded system output mask are shared across the queries, and the runs of the reference masks are kept in the reference mask cache, if any, for the other system outputs. Applies only with --speedup, and takes precedence over --packBits.")
+parser.add_argument('--refCache',type=str,default='',
+help="Directory in which to cache the binarized reference masks and their no-score zones across runs. Scoring another system output against the same reference reuses the cached data. [default=no caching]",metavar='character')
+parser.add_argument('--refCacheSize',type=int,default=2048,
+help="The maximum size of the reference mask cache in megabytes. The least recently used entries are removed past this size. [default=2048]",metavar='positive integer')
+parser.add_argument('--resume',action='store_true',help="Record the scores of each mask in a checkpoint file alongside the outputs as soon as it is scored, and skip the masks already recorded there by an earlier run with the same parameters. Run with this option from the start for an interrupted run to be resumable.")
+parser.add_argument('--manifest',type=str,default='',
+help="File in which to store the scores of each mask, keyed by a hash of its reference and system output masks, its journal data, and the scoring parameters. Masks whose inputs are unchanged since they were stored reuse the stored scores, so that rescoring a resubmission only scores the masks that changed. [default=no manifest]",metavar='character')
+parser.add_argument('--trace',action='store_true',help="Record the wall time and peak memory growth of each stage of scoring each mask in a stage trace file alongside the outputs, and print a summary of the slowest stages and masks at the end of the run.")
 
 args = parser.parse_args()
 
@@ -132,6 +154,10 @@ if len(sys.argv) < 2:
 
 verbose=args.verbose
 
+if args.html:
+    args.outputLevel = 'html'
+args.html = args.outputLevel == 'html'
+
 #wrapper print function for print message suppression
 if verbose:
     def printq(string):
@@ -155,16 +181,17 @@ args.task = args.task.lower()
 
 if args.task not in ['manipulation','splice']:
     printerr("ERROR: Localization task type must be 'manipulation' or 'splice'.")
+if (args.task == 'splice') and args.queryManipulation and (len(args.queryManipulation) > 1):
+    printerr("ERROR: Scoring several queries in one run with -qm is only supported for the manipulation task. Score each splice query in a separate run.")
 if args.refDir is None:
     printerr("ERROR: Test directory path must be supplied.")
 
-mySysDir = os.path.join(args.sysDir,os.path.dirname(args.inSys))
 myRefDir = args.refDir
 
 if args.inRef is None:
     printerr("ERROR: Input file name for reference must be supplied.")
 
-if args.inSys is None:
+if (args.inSys is None) and (args.batchFile is None):
     printerr("ERROR: Input file name for system output must be supplied.")
 
 if args.inIndex is None:
@@ -177,18 +204,21 @@ if args.inIndex is None:
 #detpath = os.path.join(os.path.dirname(os.path.abspath(__file__)),'../DetectionScorer/plotJsonFiles')
 detpath = os.path.join(os.path.dirname(os.path.abspath(__file__)),'plotJsonFiles')
 if not os.path.isdir(detpath):
-    os.system(' '.join(['mkdir',detpath]))
+    os.makedirs(detpath)
 Render.gen_default_plot_options(path=os.path.join(detpath,'plot_options.json'))
 
 #assume outRoot exists
-if args.outRoot in [None,'']:
+if (args.outRoot in [None,'']) and (args.batchFile is None):
     printerr("ERROR: the folder name and prefix for outputs must be supplied.")
 
-outdir=os.path.dirname(args.outRoot)
-outpfx=os.path.basename(args.outRoot)
-
-if not os.path.isdir(outdir):
-    os.system(' '.join(['mkdir',outdir]))
+#list the system outputs to score against the reference along with the output root for each
+if args.batchFile is not None:
+    batch = pd.read_csv(args.batchFile,sep="|",header=0,dtype=str,na_filter=False)
+    if not set(['inSys','outRoot']) <= set(list(batch)):
+        printerr("ERROR: the batch file must have the columns 'inSys' and 'outRoot'.")
+    submissions = zip(batch['inSys'],batch['outRoot'])
+else:
+    submissions = [(args.inSys,args.outRoot)]
 
 if args.task == 'manipulation':
     index_dtype = {'TaskID':str,
@@ -218,9 +248,6 @@ elif args.task == 'splice':
 
 printq("Beginning the mask scoring report...")
 
-mySysFile = os.path.join(args.sysDir,args.inSys)
-mySys = pd.read_csv(mySysFile,sep="|",header=0,dtype=sys_dtype,na_filter=False)
-
 ref_dtype = {}
 myRefFile = os.path.join(myRefDir,args.inRef)
 with open(myRefFile,'r') as ref:
@@ -229,76 +256,13 @@ with open(myRefFile,'r') as ref:
 myRef = pd.read_csv(myRefFile,sep="|",header=0,dtype=ref_dtype,na_filter=False)
 #sub_ref = myRef[myRef['IsTarget']=="Y"].copy()
 sub_ref = myRef
-myIndex = pd.read_csv(os.path.join(myRefDir,args.inIndex),sep="|",header=0,dtype=index_dtype,na_filter=False)
+myIndex0 = pd.read_csv(os.path.join(myRefDir,args.inIndex),sep="|",header=0,dtype=index_dtype,na_filter=False)
 
 param_pfx = ['Probe']
 if args.task == 'splice':
     param_pfx = ['Probe','Donor']
 param_ids = [''.join([e,'FileID']) for e in param_pfx]
 
-m_df = pd.merge(sub_ref, mySys, how='left', on=param_ids)
-# get rid of inf values from the merge and entries for which there is nothing to work with.
-m_df = m_df.replace([np.inf,-np.inf],np.nan).dropna(subset=[''.join([e,'MaskFileName']) for e in param_pfx])
-
-#for all columns unique to mySys except ConfidenceScore, replace np.nan with empty string
-sysCols = list(mySys)
-refCols = list(sub_ref)
-
-if args.optOut and (not (localOptOutColName in sysCols) and not (pastOptOutColName in sysCols)):
-    print("ERROR: No {} or {} column detected. Filtration is meaningless.".format(localOptOutColName,pastOptOutColName))
-    exit(1)
-
-sysCols = [c for c in sysCols if c not in refCols]
-sysCols.remove('ConfidenceScore')
-
-for c in sysCols:
-    m_df.loc[pd.isnull(m_df[c]),c] = ''
-if args.indexFilter:
-    printq("Filtering the reference and system output by index file...")
-    m_df = pd.merge(myIndex[param_ids + ['ProbeWidth']],m_df,how='left',on=param_ids).drop('ProbeWidth',1)
-
-pd.options.mode.chained_assignment = None #NOTE: disable this when debugging
-
-if len(m_df) == 0:
-    print("ERROR: the system output data does not match with the index. Either one may be empty. Please validate again.")
-    exit(1)
-
-#apply to post-index filtering
-totalTrials = len(m_df)
-#NOTE: IsOptOut values can be any one of "Y", "N", "Detection", or "Localization"
-#NOTE: ProbeStatus values can be any one of "Processed", "NonProcessed", "OptOutAll", "OptOutDetection", "OptOutLocalization"
-optOutCol = localOptOutColName
-if localOptOutColName in sysCols:
-    undesirables = str(['OptOutAll','OptOutLocalization'])
-    all_statuses = {'Y','N','Detection','Localization'}
-elif pastOptOutColName in sysCols:
-    optOutCol = pastOptOutColName
-    undesirables = str(['Y','Localization'])
-    all_statuses = {'Processed','NonProcessed','OptOutAll','OptOutDetection','OptOutLocalization'}
-#check to see if there are any values not one of these
-probeStatuses = set(list(m_df[optOutCol].unique()))
-if probeStatuses > all_statuses:
-    print("ERROR: Status {} is not recognized.".format(all_statuses - probeStatuses))
-    exit(1)
-
-optOutQuery = "==".join([optOutCol,undesirables])
-
-totalOptOut = len(m_df.query(optOutQuery))
-totalOptIn = totalTrials - totalOptOut
-TRR = float(totalOptIn)/totalTrials
-m_df = m_df.query("IsTarget=='Y'") #TODO: don't filter anymore, but see Jon first.
-
-if args.perProbePixelNoScore and (('ProbeOptOutPixelValue' not in sysCols) or ((args.task == 'splice') and ('DonorOptOutPixelValue' not in sysCols))):
-    if args.task == 'manipulation':
-        print("ERROR: 'ProbeOptOutPixelValue' is not found in the columns of the system output.")
-    elif args.task == 'splice':
-        print("ERROR: 'ProbeOptOutPixelValue' or 'DonorOptOutPixelValue' is not found in the columns of the system output.")
-    exit(1)
-
-#opting out at the beginning
-if args.optOut:
-    m_df = m_df.query(" ".join(['not',optOutQuery]))
-
 class loc_scoring_params:
     def __init__(self,
                  mode,
@@ -311,7 +275,8 @@ class loc_scoring_params:
                  verbose,
                  html,
                  precision,
-                 processors):
+                 processors,
+                 outputLevel):
         self.mode = mode
         self.eks = eks
         self.dks = dks
@@ -323,20 +288,31 @@ class loc_scoring_params:
         self.html = html
         self.precision = precision
         self.processors = processors
+        self.outputLevel = outputLevel
 
 #define HTML functions here
 df2html = lambda *a:None
 if args.task == 'manipulation':
-    def createReport(m_df, journalData, probeJournalJoin, index, refDir, sysDir, rbin, sbin,erodeKernSize, dilateKernSize,distractionKernSize, kern,outputRoot,html,color,verbose,precision):
+    def initRunner(m_df,journalData,probeJournalJoin,index,outputRoot):
+        #set up the runner and the masks to score, with scoring itself left to the caller
+        metricRunner = maskMetricRunner(m_df,args.refDir,mySysDir,args.rbin,args.sbin,journalData,probeJournalJoin,index,speedup=args.speedup,color=args.jpeg2000,refcache=refCache,packbits=args.packBits,croproi=args.cropROI,rle=args.rle,checkpoint=checkpoint,manifest=manifest,trace=traceName)
+        #revise this to outputRoot and loc_scoring_params
+        params = loc_scoring_params(0,args.eks,args.dks,args.ntdks,args.nspx,args.perProbePixelNoScore,args.kernel,args.verbose,args.html,args.precision,args.processors,args.outputLevel)
+        return metricRunner,metricRunner.initMetricList(outputRoot,params)
+
+    def createReport(m_df, journalData, probeJournalJoin, index, refDir, sysDir, rbin, sbin,erodeKernSize, dilateKernSize,distractionKernSize, kern,outputRoot,html,color,verbose,precision,scored=0):
         # if the confidence score are 'nan', replace the values with the mininum score
         #m_df[pd.isnull(m_df['ConfidenceScore'])] = m_df['ConfidenceScore'].min()
         # convert to the str type to the float type for computations
         #m_df['ConfidenceScore'] = m_df['ConfidenceScore'].astype(np.float)
     
-        metricRunner = maskMetricRunner(m_df,args.refDir,mySysDir,args.rbin,args.sbin,journalData,probeJournalJoin,index,speedup=args.speedup,color=args.jpeg2000)
-        #revise this to outputRoot and loc_scoring_params
-        params = loc_scoring_params(0,args.eks,args.dks,args.ntdks,args.nspx,args.perProbePixelNoScore,args.kernel,args.verbose,args.html,args.precision,args.processors)
-        df = metricRunner.getMetricList(outputRoot,params)
+        if scored is 0:
+            metricRunner,df = initRunner(m_df,journalData,probeJournalJoin,index,outputRoot)
+            df = metricRunner.scoreMasks(df,args.processors)
+        else:
+            #the masks were scored in one pass along with those of the other queries
+            metricRunner,df = scored
+        df = metricRunner.finishMetricList(df)
 #        df = metricRunner.getMetricList(args.eks,args.dks,args.ntdks,args.nspx,args.kernel,outputRoot,args.verbose,args.html,precision=args.precision,processors=args.processors)
         merged_df = pd.merge(m_df.drop('Scored',1),df,how='left',on='ProbeFileID')
 
@@ -587,17 +563,17 @@ elif args.task == 'splice':
         # convert to the str type to the float type for computations
         #m_df['ConfidenceScore'] = m_df['ConfidenceScore'].astype(np.float)
 #        maskMetricRunner = mm.maskMetricList(m_df,refDir,sysDir,rbin,sbin,journalData,probeJournalJoin,index,mode=1)
-        metricRunner = maskMetricRunner(m_df,args.refDir,mySysDir,args.rbin,args.sbin,journalData,probeJournalJoin,index,speedup=args.speedup,color=args.jpeg2000)
+        metricRunner = maskMetricRunner(m_df,args.refDir,mySysDir,args.rbin,args.sbin,journalData,probeJournalJoin,index,speedup=args.speedup,color=args.jpeg2000,refcache=refCache,packbits=args.packBits,croproi=args.cropROI,rle=args.rle,checkpoint=checkpoint,manifest=manifest,trace=traceName)
 #        probe_df = maskMetricRunner.getMetricList(erodeKernSize,dilateKernSize,0,kern,outputRoot,verbose,html,precision=precision)
         #TODO: temporary until we can evaluate color for the splice task
-        params = loc_scoring_params(1,args.eks,args.dks,0,args.nspx,args.perProbePixelNoScore,args.kernel,args.verbose,args.html,args.precision,args.processors)
+        params = loc_scoring_params(1,args.eks,args.dks,0,args.nspx,args.perProbePixelNoScore,args.kernel,args.verbose,args.html,args.precision,args.processors,args.outputLevel)
         probe_df = metricRunner.getMetricList(outputRoot,params)
 #        probe_df = metricRunner.getMetricList(args.eks,args.dks,0,args.nspx,args.kernel,outputRoot,args.verbose,args.html,precision=args.precision,processors=args.processors)
     
 #        maskMetricRunner = mm.maskMetricList(m_df,refDir,sysDir,rbin,sbin,journalData,probeJournalJoin,index,mode=2) #donor images
 #        metricRunner = maskMetricRunner(m_df,args.refDir,mySysDir,args.rbin,args.sbin,journalData,probeJournalJoin,index,mode=2,speedup=args.speedup,color=args.color)
 #        donor_df = maskMetricRunner.getMetricList(erodeKernSize,dilateKernSize,0,kern,outputRoot,verbose,html,precision=precision)
-        params = loc_scoring_params(2,args.eks,args.dks,0,args.nspx,args.perProbePixelNoScore,args.kernel,args.verbose,args.html,args.precision,args.processors)
+        params = loc_scoring_params(2,args.eks,args.dks,0,args.nspx,args.perProbePixelNoScore,args.kernel,args.verbose,args.html,args.precision,args.processors,args.outputLevel)
         donor_df = metricRunner.getMetricList(outputRoot,params)
 #        donor_df = metricRunner.getMetricList(args.eks,args.dks,0,args.nspx,args.kernel,outputRoot,args.verbose,args.html,precision=args.precision,processors=args.processors)
 
@@ -993,9 +969,6 @@ elif args.queryManipulation:
 ## convert to the str type to the float type for computations
 #mySys['ConfidenceScore'] = mySys['ConfidenceScore'].astype(np.float)
 
-outRoot = outdir
-prefix = outpfx#os.path.basename(args.inSys).split('.')[0]
-
 reportq = 0
 if args.verbose:
     reportq = 1
@@ -1021,295 +994,462 @@ except IOError:
     
 #TODO: basic data init-ing ends here
 
-# Merge the reference and system output
-if args.task == 'manipulation':
-    #TODO: basic data cleanup
-    # if the confidence score are 'nan', replace the values with the mininum score
-    m_df.loc[pd.isnull(m_df['ConfidenceScore']),'ConfidenceScore'] = mySys['ConfidenceScore'].min()
-    # convert to the str type to the float type for computations
-    m_df['ConfidenceScore'] = m_df['ConfidenceScore'].astype(np.float)
-    journaljoinfields = ['JournalName','StartNodeID','EndNodeID']
-#    if 'BitPlane' in list(probeJournalJoin):
-#        journaljoinfields.append('BitPlane')
-
-    journalData0 = pd.merge(probeJournalJoin,journalMask,how='left',on=journaljoinfields)
+refCache = 0
+batchCacheDir = ''
+#keep the references decoded in memory across all the submissions in the batch
+refMemory = 0
+if len(submissions) > 1:
+    refMemory = args.refCacheSize*1024**2
+if args.refCache != '':
+    refCache = maskCache(args.refCache,args.refCacheSize*1024**2,refMemory)
+elif len(submissions) > 1:
+    #reuse the reference masks and their no-score zones across all the submissions in the batch
+    batchCacheDir = tempfile.mkdtemp(prefix='MaskScorer-refcache-')
+    refCache = maskCache(batchCacheDir,args.refCacheSize*1024**2,refMemory)
+
+manifest = 0
+if args.manifest != '':
+    manifest = scoreManifest(args.manifest)
+
+traceNames = []
+checkpoint = 0
+
+def cleanUp():
+    """
+    * Description: closes the checkpoint and manifest databases, stops the worker processes, and removes the
+                   batch cache, whether the run finished or not
+    """
+    if checkpoint is not 0:
+        checkpoint.close()
+    if manifest is not 0:
+        manifest.close()
+    stopPool(finish=False)
+    if batchCacheDir != '':
+        shutil.rmtree(batchCacheDir,ignore_errors=True)
+
+atexit.register(cleanUp)
+
+#the worker processes are started once and shared by all the scoring passes of the run
+startPool(args.processors)
+
+for mySysName,myOutRoot in submissions:
+    if len(submissions) > 1:
+        printq("Scoring system output {}...".format(mySysName))
+
+    mySysDir = os.path.join(args.sysDir,os.path.dirname(mySysName))
+    outdir=os.path.dirname(myOutRoot)
+    outpfx=os.path.basename(myOutRoot)
+
+    if (outdir != '') and not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    checkpoint = 0
+    if args.resume:
+        #the arguments that the scores depend on, which must match those of the run being resumed
+        ckparams = dict([(k,v) for k,v in vars(args).items() if k not in ['verbose','processors','html','outputLevel','displayScoredOnly','outMeta','outAllmeta','refCache','refCacheSize','batchFile','outRoot','resume','trace','cropROI','rle']])
+        ckparams['inSys'] = mySysName
+        ckparams = repr(sorted(ckparams.items()))
+        checkpointName = os.path.join(outdir,'_'.join([outpfx,'checkpoint.db']))
+        checkpoint = scoreCheckpoint(checkpointName,ckparams)
+        if not checkpoint.matches(ckparams):
+            print("ERROR: the checkpoint {} was recorded with different scoring options. Remove it or rerun with the same options.".format(checkpointName))
+            exit(1)
+
+    traceName = 0
+    if args.trace:
+        traceName = os.path.join(outdir,'_'.join([outpfx,'stage_trace.csv']))
+        #keep the stages traced before an interruption when resuming
+        startTrace(traceName,append=args.resume)
+        traceNames.append(traceName)
+
+    myIndex = myIndex0.copy()
+    mySysFile = os.path.join(args.sysDir,mySysName)
+    mySys = pd.read_csv(mySysFile,sep="|",header=0,dtype=sys_dtype,na_filter=False)
+
+    m_df = pd.merge(sub_ref, mySys, how='left', on=param_ids)
+    # get rid of inf values from the merge and entries for which there is nothing to work with.
+    m_df = m_df.replace([np.inf,-np.inf],np.nan).dropna(subset=[''.join([e,'MaskFileName']) for e in param_pfx])
+
+    #for all columns unique to mySys except ConfidenceScore, replace np.nan with empty string
+    sysCols = list(mySys)
+    refCols = list(sub_ref)
+
+    if args.optOut and (not (localOptOutColName in sysCols) and not (pastOptOutColName in sysCols)):
+        print("ERROR: No {} or {} column detected. Filtration is meaningless.".format(localOptOutColName,pastOptOutColName))
+        exit(1)
+
+    sysCols = [c for c in sysCols if c not in refCols]
+    sysCols.remove('ConfidenceScore')
+
+    for c in sysCols:
+        m_df.loc[pd.isnull(m_df[c]),c] = ''
     if args.indexFilter:
-        printq("Filtering the journal data by index file...")
-        myIndex = myIndex.query("ProbeFileID == {}".format(probeJournalJoin['ProbeFileID'].unique().tolist())) #filter index first.
-        journalData0 = pd.merge(myIndex[['ProbeFileID','ProbeWidth']],journalData0,how='left',on='ProbeFileID').drop('ProbeWidth',1)
-    n_journals = len(journalData0)
-    journalData0.index = range(n_journals)
-    #TODO: basic data cleanup ends here
-
-    if factor_mode == 'qm':
-        queryM = query
-    else:
-        queryM = ['']
-
-    for qnum,q in enumerate(queryM):
-        #journalData0 = journalMask.copy() #pd.merge(probeJournalJoin,journalMask,how='left',on=['JournalName','StartNodeID','EndNodeID'])
-        journalData_df = pd.merge(probeJournalJoin,journalMask,how='left',on=journaljoinfields)
-
-        m_dfc = m_df.copy()
-        if factor_mode == 'qm':
-            journalData0['Evaluated'] = pd.Series(['N']*n_journals)
-        else:
-            journalData0['Evaluated'] = pd.Series(['Y']*n_journals) #add column for Evaluated: 'Y'/'N'
-
-        #journalData = journalData0.copy()
-        #use big_df to filter from the list as a temporary thing
-        if q is not '':
-            #exit if query does not match
-            printq("Merging main data and journal data and querying the result...")
-            try:
-                big_df = pd.merge(m_df,journalData_df,how='left',on=['ProbeFileID','JournalName']).query(q) #TODO: test on sample with a print?
-            except pd.computation.ops.UndefinedVariableError:
-                print("The query '{}' doesn't seem to refer to a valid key. Please correct the query and try again.".format(q))
-                exit(1)
-
-            m_dfc = m_dfc.query("ProbeFileID=={}".format(np.unique(big_df.ProbeFileID).tolist()))
-            #journalData = journalData.query("ProbeFileID=={}".format(list(big_df.ProbeFileID)))
-            journalData_df = journalData_df.query("ProbeFileID=={}".format(list(big_df.ProbeFileID)))
-#            journalData_df = journalData_df.merge(big_df[['ProbeFileID','JournalName','StartNodeID','EndNodeID']],how='left',on=['ProbeFileID','JournalName','StartNodeID','EndNodeID'])
-            journalData0.loc[journalData0.reset_index().merge(big_df[['ProbeFileID','ProbeMaskFileName'] + journaljoinfields],\
-                             how='left',on=journaljoinfields).set_index('index').dropna().drop('ProbeMaskFileName',1).index,'Evaluated'] = 'Y'
-        m_dfc.index = range(len(m_dfc))
-            #journalData.index = range(0,len(journalData))
-
-        #if get empty journalData or if no ProbeFileID's match between the two, there is nothing to be scored.
-        if (len(journalData_df) == 0) or not (True in journalData_df['ProbeFileID'].isin(m_df['ProbeFileID']).unique()):
-            print("The query '{}' yielded no journal data over which computation may take place.".format(q))
-            continue
-
-        outRootQuery = outRoot
-        if len(queryM) > 1:
-            outRootQuery = os.path.join(outRoot,'index_{}'.format(qnum)) #affix outRoot with qnum suffix for some length
-            if not os.path.isdir(outRootQuery):
-                os.system(' '.join(['mkdir',outRootQuery]))
-        m_dfc['Scored'] = ['Y']*len(m_dfc)
-
-        printq("Beginning mask scoring...")
-        r_df = createReport(m_dfc,journalData0, probeJournalJoin, myIndex, myRefDir, mySysDir,args.rbin,args.sbin,args.eks, args.dks, args.ntdks, args.kernel, outRootQuery, html=args.html,color=args.jpeg2000,verbose=reportq,precision=args.precision)
-
-        #get the manipulations that were not scored and set the same columns in journalData0 to 'N'
-        journalUpdate(probeJournalJoin,journalData0,r_df)
-        
-        metrics = ['OptimumThreshold','OptimumNMM','OptimumMCC','OptimumBWL1','GWL1','AUC','EER']
-        if args.sbin >= -1:
-            metrics.extend(['MaximumThreshold','MaximumNMM','MaximumMCC','MaximumBWL1',
-                            'ActualThreshold','ActualNMM','ActualMCC','ActualBWL1'])
-        constant_mets = ['PixelAverageAUC','MaskAverageAUC']
-        if args.sbin >= -1:
-            constant_mets.extend(['MaximumThreshold','ActualThreshold'])
+        printq("Filtering the reference and system output by index file...")
+        m_df = pd.merge(myIndex[param_ids + ['ProbeWidth']],m_df,how='left',on=param_ids).drop('ProbeWidth',1)
+
+    pd.options.mode.chained_assignment = None #NOTE: disable this when debugging
+
+    if len(m_df) == 0:
+        print("ERROR: the system output data does not match with the index. Either one may be empty. Please validate again.")
+        exit(1)
+
+    #apply to post-index filtering
+    totalTrials = len(m_df)
+    #NOTE: IsOptOut values can be any one of "Y", "N", "Detection", or "Localization"
+    #NOTE: ProbeStatus values can be any one of "Processed", "NonProcessed", "OptOutAll", "OptOutDetection", "OptOutLocalization"
+    optOutCol = localOptOutColName
+    if localOptOutColName in sysCols:
+        undesirables = str(['OptOutAll','OptOutLocalization'])
+        all_statuses = {'Y','N','Detection','Localization'}
+    elif pastOptOutColName in sysCols:
+        optOutCol = pastOptOutColName
+        undesirables = str(['Y','Localization'])
+        all_statuses = {'Processed','NonProcessed','OptOutAll','OptOutDetection','OptOutLocalization'}
+    #check to see if there are any values not one of these
+    probeStatuses = set(list(m_df[optOutCol].unique()))
+    if probeStatuses > all_statuses:
+        print("ERROR: Status {} is not recognized.".format(all_statuses - probeStatuses))
+        exit(1)
+
+    optOutQuery = "==".join([optOutCol,undesirables])
+
+    totalOptOut = len(m_df.query(optOutQuery))
+    totalOptIn = totalTrials - totalOptOut
+    TRR = float(totalOptIn)/totalTrials
+    m_df = m_df.query("IsTarget=='Y'") #TODO: don't filter anymore, but see Jon first.
+
+    if args.perProbePixelNoScore and (('ProbeOptOutPixelValue' not in sysCols) or ((args.task == 'splice') and ('DonorOptOutPixelValue' not in sysCols))):
+        if args.task == 'manipulation':
+            print("ERROR: 'ProbeOptOutPixelValue' is not found in the columns of the system output.")
+        elif args.task == 'splice':
+            print("ERROR: 'ProbeOptOutPixelValue' or 'DonorOptOutPixelValue' is not found in the columns of the system output.")
+        exit(1)
+
+    #opting out at the beginning
+    if args.optOut:
+        m_df = m_df.query(" ".join(['not',optOutQuery]))
+
+    outRoot = outdir
+    prefix = outpfx#os.path.basename(args.inSys).split('.')[0]
+
+    # Merge the reference and system output
+    if args.task == 'manipulation':
+        #TODO: basic data cleanup
+        # if the confidence score are 'nan', replace the values with the mininum score
+        m_df.loc[pd.isnull(m_df['ConfidenceScore']),'ConfidenceScore'] = mySys['ConfidenceScore'].min()
+        # convert to the str type to the float type for computations
+        m_df['ConfidenceScore'] = m_df['ConfidenceScore'].astype(np.float)
+        journaljoinfields = ['JournalName','StartNodeID','EndNodeID']
+    #    if 'BitPlane' in list(probeJournalJoin):
+    #        journaljoinfields.append('BitPlane')
+
+        journalData0 = pd.merge(probeJournalJoin,journalMask,how='left',on=journaljoinfields)
+        if args.indexFilter:
+            printq("Filtering the journal data by index file...")
+            myIndex = myIndex.query("ProbeFileID == {}".format(probeJournalJoin['ProbeFileID'].unique().tolist())) #filter index first.
+            journalData0 = pd.merge(myIndex[['ProbeFileID','ProbeWidth']],journalData0,how='left',on='ProbeFileID').drop('ProbeWidth',1)
+        n_journals = len(journalData0)
+        journalData0.index = range(n_journals)
+        #TODO: basic data cleanup ends here
 
-        a_df = 0
         if factor_mode == 'qm':
-            a_df = averageByFactors(r_df,metrics,constant_mets,factor_mode,q)
+            queryM = query
         else:
-            a_df = averageByFactors(r_df,metrics,constant_mets,factor_mode,query)
+            queryM = ['']
 
-        # tack on PixelAverageAUC and MaskAverageAUC to a_df and remove from r_df
-        r_df = r_df.drop(['PixelAverageAUC','MaskAverageAUC'],1)
-        if args.sbin >= -1:
-            r_df = r_df.drop(['MaximumThreshold','ActualThreshold'],1)
+        #with several queries, the masks of all the queries are scored together before the reports are generated
+        multiQuery = len(queryM) > 1
+        queryRuns = []
+        for qnum,q in enumerate(queryM):
+            #journalData0 = journalMask.copy() #pd.merge(probeJournalJoin,journalMask,how='left',on=['JournalName','StartNodeID','EndNodeID'])
+            journalData_df = pd.merge(probeJournalJoin,journalMask,how='left',on=journaljoinfields)
 
-#        if a_df is not 0:
-#            a_df['OptimumThreshold'] = a_df['OptimumThreshold'].dropna().apply(lambda x: str(int(x)))
-#            if args.sbin >= 0:
-#                a_df['MaximumThreshold'] = a_df['MaximumThreshold'].dropna().apply(lambda x: str(int(x)))
-#                a_df['ActualThreshold'] = a_df['ActualThreshold'].dropna().apply(lambda x: str(int(x)))
+            m_dfc = m_df.copy()
+            if factor_mode == 'qm':
+                journalData0['Evaluated'] = pd.Series(['N']*n_journals)
+            else:
+                journalData0['Evaluated'] = pd.Series(['Y']*n_journals) #add column for Evaluated: 'Y'/'N'
+
+            #journalData = journalData0.copy()
+            #use big_df to filter from the list as a temporary thing
+            if q is not '':
+                #exit if query does not match
+                printq("Merging main data and journal data and querying the result...")
+                try:
+                    big_df = pd.merge(m_df,journalData_df,how='left',on=['ProbeFileID','JournalName']).query(q) #TODO: test on sample with a print?
+                except pd.computation.ops.UndefinedVariableError:
+                    print("The query '{}' doesn't seem to refer to a valid key. Please correct the query and try again.".format(q))
+                    exit(1)
+
+                m_dfc = m_dfc.query("ProbeFileID=={}".format(np.unique(big_df.ProbeFileID).tolist()))
+                #journalData = journalData.query("ProbeFileID=={}".format(list(big_df.ProbeFileID)))
+                journalData_df = journalData_df.query("ProbeFileID=={}".format(list(big_df.ProbeFileID)))
+    #            journalData_df = journalData_df.merge(big_df[['ProbeFileID','JournalName','StartNodeID','EndNodeID']],how='left',on=['ProbeFileID','JournalName','StartNodeID','EndNodeID'])
+                journalData0.loc[journalData0.reset_index().merge(big_df[['ProbeFileID','ProbeMaskFileName'] + journaljoinfields],\
+                                 how='left',on=journaljoinfields).set_index('index').dropna().drop('ProbeMaskFileName',1).index,'Evaluated'] = 'Y'
+            m_dfc.index = range(len(m_dfc))
+                #journalData.index = range(0,len(journalData))
+
+            #if get empty journalData or if no ProbeFileID's match between the two, there is nothing to be scored.
+            if (len(journalData_df) == 0) or not (True in journalData_df['ProbeFileID'].isin(m_df['ProbeFileID']).unique()):
+                print("The query '{}' yielded no journal data over which computation may take place.".format(q))
+                continue
+
+            outRootQuery = outRoot
+            if len(queryM) > 1:
+                outRootQuery = os.path.join(outRoot,'index_{}'.format(qnum)) #affix outRoot with qnum suffix for some length
+                if not os.path.isdir(outRootQuery):
+                    os.makedirs(outRootQuery)
+            m_dfc['Scored'] = ['Y']*len(m_dfc)
+
+            if multiQuery:
+                #each query keeps its own selection of the journal
+                journalDataQ = journalData0.copy()
+                queryRuns.append([qnum,q,m_dfc,journalDataQ,outRootQuery,initRunner(m_dfc,journalDataQ,probeJournalJoin,myIndex,outRootQuery)])
+            else:
+                queryRuns.append([qnum,q,m_dfc,journalData0,outRootQuery,0])
 
-        r_idx = r_df.query('OptimumMCC == -2').index
-        if len(r_idx) > 0:
-            r_df.loc[r_idx,'Scored'] = 'N'
-            r_df.loc[r_idx,'OptimumNMM'] = ''
-            r_df.loc[r_idx,'OptimumBWL1'] = ''
-            r_df.loc[r_idx,'GWL1'] = ''
+        if multiQuery and (len(queryRuns) > 0):
+            printq("Beginning mask scoring for all queries...")
+            scoredDfs = scoreQueries([r[5][0] for r in queryRuns],[r[5][1] for r in queryRuns],args.processors)
+            for r,df in zip(queryRuns,scoredDfs):
+                r[5] = (r[5][0],df)
 
-        #convert all pixel values to decimal-less strings
-        pix2ints = ['OptimumThreshold','OptimumPixelTP','OptimumPixelFP','OptimumPixelTN','OptimumPixelFN',
-                    'PixelN','PixelBNS','PixelSNS','PixelPNS']
+        for qnum,q,m_dfc,journalData0,outRootQuery,scored in queryRuns:
+            if not multiQuery:
+                printq("Beginning mask scoring...")
+            r_df = createReport(m_dfc,journalData0, probeJournalJoin, myIndex, myRefDir, mySysDir,args.rbin,args.sbin,args.eks, args.dks, args.ntdks, args.kernel, outRootQuery, html=args.html,color=args.jpeg2000,verbose=reportq,precision=args.precision,scored=scored)
 
-        if args.sbin >= -1:
-            pix2ints.extend(['MaximumPixelTP','MaximumPixelFP','MaximumPixelTN','MaximumPixelFN',
-                             'ActualPixelTP','ActualPixelFP','ActualPixelTN','ActualPixelFN'])
+            #get the manipulations that were not scored and set the same columns in journalData0 to 'N'
+            journalUpdate(probeJournalJoin,journalData0,r_df)
+    
+            metrics = ['OptimumThreshold','OptimumNMM','OptimumMCC','OptimumBWL1','GWL1','AUC','EER']
+            if args.sbin >= -1:
+                metrics.extend(['MaximumThreshold','MaximumNMM','MaximumMCC','MaximumBWL1',
+                                'ActualThreshold','ActualNMM','ActualMCC','ActualBWL1'])
+            constant_mets = ['PixelAverageAUC','MaskAverageAUC']
+            if args.sbin >= -1:
+                constant_mets.extend(['MaximumThreshold','ActualThreshold'])
 
-        for pix in pix2ints:
-            r_df[pix] = r_df[pix].dropna().apply(lambda x: str(int(x)))
+            a_df = 0
+            if factor_mode == 'qm':
+                a_df = averageByFactors(r_df,metrics,constant_mets,factor_mode,q)
+            else:
+                a_df = averageByFactors(r_df,metrics,constant_mets,factor_mode,query)
 
-        #generate HTML table report
-        df2html(r_df,a_df,outRootQuery,args.queryManipulation,q)
+            # tack on PixelAverageAUC and MaskAverageAUC to a_df and remove from r_df
+            r_df = r_df.drop(['PixelAverageAUC','MaskAverageAUC'],1)
+            if args.sbin >= -1:
+                r_df = r_df.drop(['MaximumThreshold','ActualThreshold'],1)
 
-        r_df.loc[r_idx,'OptimumMCC'] = ''
-        prefix = outpfx#os.path.basename(args.inSys).split('.')[0]
+    #        if a_df is not 0:
+    #            a_df['OptimumThreshold'] = a_df['OptimumThreshold'].dropna().apply(lambda x: str(int(x)))
+    #            if args.sbin >= 0:
+    #                a_df['MaximumThreshold'] = a_df['MaximumThreshold'].dropna().apply(lambda x: str(int(x)))
+    #                a_df['ActualThreshold'] = a_df['ActualThreshold'].dropna().apply(lambda x: str(int(x)))
 
-        if args.outMeta:
-            roM_df = r_df[['TaskID','ProbeFileID','ProbeFileName','OutputProbeMaskFileName','IsTarget','ConfidenceScore',optOutCol,'OptimumNMM','OptimumMCC','OptimumBWL1','GWL1']]
-            roM_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'perimage-outMeta.csv'])),sep="|",index=False)
-        if args.outAllmeta:
-            #left join with index file and journal data
-            rAM_df = pd.merge(r_df,myIndex,how='left',on=['TaskID','ProbeFileID','ProbeFileName'])
-            rAM_df = pd.merge(rAM_df,journalData0,how='left',on=['ProbeFileID','JournalName'])
-            rAM_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'perimage-allMeta.csv'])),sep="|",index=False)
+            r_idx = r_df.query('OptimumMCC == -2').index
+            if len(r_idx) > 0:
+                r_df.loc[r_idx,'Scored'] = 'N'
+                r_df.loc[r_idx,'OptimumNMM'] = ''
+                r_df.loc[r_idx,'OptimumBWL1'] = ''
+                r_df.loc[r_idx,'GWL1'] = ''
 
-        r_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'mask_scores_perimage.csv'])),sep="|",index=False)
-    
-elif args.task == 'splice':
-    #TODO: basic data cleanup
-    # if the confidence score are 'nan', replace the values with the mininum score
-    m_df.loc[pd.isnull(m_df['ConfidenceScore']),'ConfidenceScore'] = mySys['ConfidenceScore'].min()
-    # convert to the str type to the float type for computations
-    m_df['ConfidenceScore'] = m_df['ConfidenceScore'].astype(np.float)
-
-#    journaljoinfields = ['JournalName','StartNodeID','EndNodeID']
-    journaljoinfields = ['JournalName']
-#    if 'BitPlane' in list(probeJournalJoin):
-#        journaljoinfields.append('BitPlane')
-
-    joinfields = param_ids+journaljoinfields
-    journalData0 = pd.merge(probeJournalJoin[joinfields].drop_duplicates(),journalMask,how='left',on=journaljoinfields).drop_duplicates()
-    if args.indexFilter:
-        printq("Filtering the journal data by index file...")
-        myIndex['ProbeDonorID'] = myIndex['ProbeFileID'] + ":" + myIndex['DonorFileID']
-        journalData0['ProbeDonorID'] = journalData0['ProbeFileID'] + ":" + journalData0['DonorFileID']
-        myIndex = myIndex.query("ProbeDonorID=={}".format(journalData0.ProbeDonorID.unique().tolist())) #first filter by Probe-Donor pairs
-        journalData0 = pd.merge(myIndex[['ProbeDonorID']],journalData0,how='left',on=['ProbeDonorID']).drop('ProbeDonorID',1)
-    
-    n_journals = len(journalData0)
-    journalData0.index = range(n_journals)
-    #TODO: basic data cleanup ends here
+            #convert all pixel values to decimal-less strings
+            pix2ints = ['OptimumThreshold','OptimumPixelTP','OptimumPixelFP','OptimumPixelTN','OptimumPixelFN',
+                        'PixelN','PixelBNS','PixelSNS','PixelPNS']
 
-    if factor_mode == 'qm':
-        queryM = query
-    else:
-        queryM = ['']
+            if args.sbin >= -1:
+                pix2ints.extend(['MaximumPixelTP','MaximumPixelFP','MaximumPixelTN','MaximumPixelFN',
+                                 'ActualPixelTP','ActualPixelFP','ActualPixelTN','ActualPixelFN'])
 
-    eval_pfx = param_pfx[:]
-    for qnum,q in enumerate(queryM):
-        m_dfc = m_df.copy()
+            for pix in pix2ints:
+                r_df[pix] = r_df[pix].dropna().apply(lambda x: str(int(x)))
 
-        for param in eval_pfx:
-            if factor_mode == 'qm':
-                journalData0[param+'Evaluated'] = pd.Series(['N']*n_journals)
-            else:
-                journalData0[param+'Evaluated'] = pd.Series(['Y']*n_journals)
-
-        #use big_df to filter from the list as a temporary thing
-        journalData_df = pd.merge(probeJournalJoin,journalMask,how='left',on=journaljoinfields)
-        #journalData = journalData0.copy()
-
-        if q is not '':
-            #exit if query does not match
-            printq("Merging main data and journal data and querying the result...")
-            try:
-                big_df = pd.merge(m_df,journalData_df,how='left',on=param_ids).query(q)
-            except pd.computation.ops.UndefinedVariableError:
-                print("The query '{}' doesn't seem to refer to a valid key. Please correct the query and try again.".format(q))
-                exit(1)
-
-            #do a join with the big dataframe and filter out the stuff that doesn't show up by pairs
-            m_dfc = pd.merge(m_dfc,big_df[param_ids],how='left',on=joinfields).dropna().drop('JournalName',1)
-            #journalData = pd.merge(journalData0,big_df[['ProbeFileID','DonorFileID','JournalName']],how='left',on=['ProbeFileID','DonorFileID','JournalName'])
-            journalData0.loc[journalData0.reset_index().merge(big_df[['JournalName','StartNodeID','EndNodeID','ProbeFileID','DonorFileID','ProbeMaskFileName']],\
-                             how='left',on=journaljoinfields).set_index('index').dropna().drop('ProbeMaskFileName',1).index,'ProbeEvaluated'] = 'Y'
-            journalData0.loc[journalData0.reset_index().merge(big_df[['JournalName','StartNodeID','EndNodeID','ProbeFileID','DonorFileID','DonorMaskFileName']],\
-                             how='left',on=journaljoinfields).set_index('index').dropna().drop('DonorMaskFileName',1).index,'DonorEvaluated'] = 'Y'
-
-        m_dfc.index = range(m_dfc.shape[0])
-            #journalData.index = range(0,len(journalData))
-
-        #if no (ProbeFileID,DonorFileID) pairs match between the two, there is nothing to be scored.
-        if len(pd.merge(m_df,journalData_df,how='left',on=param_ids)) == 0:
-            print("The query '{}' yielded no journal data over which computation may take place.".format(q))
-            continue
-
-        outRootQuery = outRoot
-        if len(queryM) > 1:
-            outRootQuery = os.path.join(outRoot,'index_{}'.format(qnum)) #affix outRoot with qnum suffix for some length
-            if not os.path.isdir(outRootQuery):
-                os.system(' '.join(['mkdir',outRootQuery]))
-   
-        m_dfc['Scored'] = ['Y']*m_dfc.shape[0]
+            #generate HTML table report
+            df2html(r_df,a_df,outRootQuery,args.queryManipulation,q)
 
-        printq("Beginning mask scoring...")
-        r_df,stackdf = createReport(m_dfc,journalData0, probeJournalJoin, myIndex, myRefDir, mySysDir,args.rbin,args.sbin,args.eks, args.dks, args.ntdks, args.kernel, outRootQuery, html=args.html,color=args.jpeg2000,verbose=reportq,precision=args.precision)
-        journalUpdate(probeJournalJoin,journalData0,r_df)
+            r_df.loc[r_idx,'OptimumMCC'] = ''
+            prefix = outpfx#os.path.basename(args.inSys).split('.')[0]
 
-        #filter here
-        metrics = ['pOptimumThreshold','pOptimumNMM','pOptimumMCC','pOptimumBWL1','pGWL1','pAUC','pEER',
-                   'dOptimumThreshold','dOptimumNMM','dOptimumMCC','dOptimumBWL1','dGWL1','dAUC','dEER']
-        if args.sbin >= -1:
-            metrics.extend(['pMaximumThreshold','pMaximumNMM','pMaximumMCC','pMaximumBWL1',
-                            'dMaximumThreshold','dMaximumNMM','dMaximumMCC','dMaximumBWL1',
-                            'pActualThreshold','pActualNMM','pActualMCC','pActualBWL1',
-                            'dActualThreshold','dActualNMM','dActualMCC','dActualBWL1'])
-        constant_mets = ['pPixelAverageAUC','dPixelAverageAUC','pMaskAverageAUC','dMaskAverageAUC']
-        if args.sbin >= -1:
-            constant_mets.extend(['pMaximumThreshold','dMaximumThreshold','pActualThreshold','dActualThreshold'])
+            if args.outMeta:
+                roM_df = r_df[['TaskID','ProbeFileID','ProbeFileName','OutputProbeMaskFileName','IsTarget','ConfidenceScore',optOutCol,'OptimumNMM','OptimumMCC','OptimumBWL1','GWL1']]
+                roM_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'perimage-outMeta.csv'])),sep="|",index=False)
+            if args.outAllmeta:
+                #left join with index file and journal data
+                rAM_df = pd.merge(r_df,myIndex,how='left',on=['TaskID','ProbeFileID','ProbeFileName'])
+                rAM_df = pd.merge(rAM_df,journalData0,how='left',on=['ProbeFileID','JournalName'])
+                rAM_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'perimage-allMeta.csv'])),sep="|",index=False)
+
+            r_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'mask_scores_perimage.csv'])),sep="|",index=False)
+
+    elif args.task == 'splice':
+        #TODO: basic data cleanup
+        # if the confidence score are 'nan', replace the values with the mininum score
+        m_df.loc[pd.isnull(m_df['ConfidenceScore']),'ConfidenceScore'] = mySys['ConfidenceScore'].min()
+        # convert to the str type to the float type for computations
+        m_df['ConfidenceScore'] = m_df['ConfidenceScore'].astype(np.float)
+
+    #    journaljoinfields = ['JournalName','StartNodeID','EndNodeID']
+        journaljoinfields = ['JournalName']
+    #    if 'BitPlane' in list(probeJournalJoin):
+    #        journaljoinfields.append('BitPlane')
+
+        joinfields = param_ids+journaljoinfields
+        journalData0 = pd.merge(probeJournalJoin[joinfields].drop_duplicates(),journalMask,how='left',on=journaljoinfields).drop_duplicates()
+        if args.indexFilter:
+            printq("Filtering the journal data by index file...")
+            myIndex['ProbeDonorID'] = myIndex['ProbeFileID'] + ":" + myIndex['DonorFileID']
+            journalData0['ProbeDonorID'] = journalData0['ProbeFileID'] + ":" + journalData0['DonorFileID']
+            myIndex = myIndex.query("ProbeDonorID=={}".format(journalData0.ProbeDonorID.unique().tolist())) #first filter by Probe-Donor pairs
+            journalData0 = pd.merge(myIndex[['ProbeDonorID']],journalData0,how='left',on=['ProbeDonorID']).drop('ProbeDonorID',1)
+
+        n_journals = len(journalData0)
+        journalData0.index = range(n_journals)
+        #TODO: basic data cleanup ends here
 
-        a_df = 0
         if factor_mode == 'qm':
-            a_df = averageByFactors(r_df,metrics,constant_mets,factor_mode,q)
+            queryM = query
         else:
-            a_df = averageByFactors(r_df,metrics,constant_mets,factor_mode,query)
+            queryM = ['']
+
+        eval_pfx = param_pfx[:]
+        for qnum,q in enumerate(queryM):
+            m_dfc = m_df.copy()
+
+            for param in eval_pfx:
+                if factor_mode == 'qm':
+                    journalData0[param+'Evaluated'] = pd.Series(['N']*n_journals)
+                else:
+                    journalData0[param+'Evaluated'] = pd.Series(['Y']*n_journals)
+
+            #use big_df to filter from the list as a temporary thing
+            journalData_df = pd.merge(probeJournalJoin,journalMask,how='left',on=journaljoinfields)
+            #journalData = journalData0.copy()
+
+            if q is not '':
+                #exit if query does not match
+                printq("Merging main data and journal data and querying the result...")
+                try:
+                    big_df = pd.merge(m_df,journalData_df,how='left',on=param_ids).query(q)
+                except pd.computation.ops.UndefinedVariableError:
+                    print("The query '{}' doesn't seem to refer to a valid key. Please correct the query and try again.".format(q))
+                    exit(1)
+
+                #do a join with the big dataframe and filter out the stuff that doesn't show up by pairs
+                m_dfc = pd.merge(m_dfc,big_df[param_ids],how='left',on=joinfields).dropna().drop('JournalName',1)
+                #journalData = pd.merge(journalData0,big_df[['ProbeFileID','DonorFileID','JournalName']],how='left',on=['ProbeFileID','DonorFileID','JournalName'])
+                journalData0.loc[journalData0.reset_index().merge(big_df[['JournalName','StartNodeID','EndNodeID','ProbeFileID','DonorFileID','ProbeMaskFileName']],\
+                                 how='left',on=journaljoinfields).set_index('index').dropna().drop('ProbeMaskFileName',1).index,'ProbeEvaluated'] = 'Y'
+                journalData0.loc[journalData0.reset_index().merge(big_df[['JournalName','StartNodeID','EndNodeID','ProbeFileID','DonorFileID','DonorMaskFileName']],\
+                                 how='left',on=journaljoinfields).set_index('index').dropna().drop('DonorMaskFileName',1).index,'DonorEvaluated'] = 'Y'
+
+            m_dfc.index = range(m_dfc.shape[0])
+                #journalData.index = range(0,len(journalData))
+
+            #if no (ProbeFileID,DonorFileID) pairs match between the two, there is nothing to be scored.
+            if len(pd.merge(m_df,journalData_df,how='left',on=param_ids)) == 0:
+                print("The query '{}' yielded no journal data over which computation may take place.".format(q))
+                continue
+
+            outRootQuery = outRoot
+            if len(queryM) > 1:
+                outRootQuery = os.path.join(outRoot,'index_{}'.format(qnum)) #affix outRoot with qnum suffix for some length
+                if not os.path.isdir(outRootQuery):
+                    os.makedirs(outRootQuery)
+   
+            m_dfc['Scored'] = ['Y']*m_dfc.shape[0]
 
-        r_df = r_df.drop(['pPixelAverageAUC','pMaskAverageAUC','dPixelAverageAUC','dMaskAverageAUC'],1)
-        if args.sbin >= -1:
-            r_df = r_df.drop(['pMaximumThreshold','pActualThreshold','dMaximumThreshold','dActualThreshold'],1)
-
-        #convert all to ints.
-#        if a_df is not 0:
-#            a_df['pOptimumThreshold'] = a_df['pOptimumThreshold'].dropna().apply(lambda x: str(int(x)))
-#            a_df['dOptimumThreshold'] = a_df['dOptimumThreshold'].dropna().apply(lambda x: str(int(x)))
-#            if args.sbin >= 0:
-#                a_df['pMaximumThreshold'] = a_df['pMaximumThreshold'].dropna().apply(lambda x: str(int(x)))
-#                a_df['pActualThreshold'] = a_df['pActualThreshold'].dropna().apply(lambda x: str(int(x)))
-#                a_df['dMaximumThreshold'] = a_df['dMaximumThreshold'].dropna().apply(lambda x: str(int(x)))
-#                a_df['dActualThreshold'] = a_df['dActualThreshold'].dropna().apply(lambda x: str(int(x)))
-
-        r_df.loc[r_df.query('pOptimumMCC == -2').index,'ProbeScored'] = 'N'
-        r_df.loc[r_df.query('pOptimumMCC == -2').index,'pOptimumNMM'] = ''
-        r_df.loc[r_df.query('pOptimumMCC == -2').index,'pOptimumBWL1'] = ''
-        r_df.loc[r_df.query('pOptimumMCC == -2').index,'pGWL1'] = ''
-        r_df.loc[r_df.query('dOptimumMCC == -2').index,'DonorScored'] = 'N'
-        r_df.loc[r_df.query('dOptimumMCC == -2').index,'dOptimumNMM'] = ''
-        r_df.loc[r_df.query('dOptimumMCC == -2').index,'dOptimumBWL1'] = ''
-        r_df.loc[r_df.query('dOptimumMCC == -2').index,'dGWL1'] = ''
-
-        #convert all pixel values to decimal-less strings
-        pix2ints = ['pOptimumThreshold','pOptimumPixelTP','pOptimumPixelFP','pOptimumPixelTN','pOptimumPixelFN',
-                    'pPixelN','pPixelBNS','pPixelSNS','pPixelPNS',
-                    'dOptimumThreshold','dOptimumPixelTP','dOptimumPixelFP','dOptimumPixelTN','dOptimumPixelFN',
-                    'dPixelN','dPixelBNS','dPixelSNS','dPixelPNS']
+            printq("Beginning mask scoring...")
+            r_df,stackdf = createReport(m_dfc,journalData0, probeJournalJoin, myIndex, myRefDir, mySysDir,args.rbin,args.sbin,args.eks, args.dks, args.ntdks, args.kernel, outRootQuery, html=args.html,color=args.jpeg2000,verbose=reportq,precision=args.precision)
+            journalUpdate(probeJournalJoin,journalData0,r_df)
 
-        if args.sbin >= -1:
-            pix2ints.extend(['pMaximumPixelTP','pMaximumPixelFP','pMaximumPixelTN','pMaximumPixelFN',
-                             'pActualPixelTP','pActualPixelFP','pActualPixelTN','pActualPixelFN',
-                             'dMaximumPixelTP','dMaximumPixelFP','dMaximumPixelTN','dMaximumPixelFN',
-                             'dActualPixelTP','dActualPixelFP','dActualPixelTN','dActualPixelFN'])
+            #filter here
+            metrics = ['pOptimumThreshold','pOptimumNMM','pOptimumMCC','pOptimumBWL1','pGWL1','pAUC','pEER',
+                       'dOptimumThreshold','dOptimumNMM','dOptimumMCC','dOptimumBWL1','dGWL1','dAUC','dEER']
+            if args.sbin >= -1:
+                metrics.extend(['pMaximumThreshold','pMaximumNMM','pMaximumMCC','pMaximumBWL1',
+                                'dMaximumThreshold','dMaximumNMM','dMaximumMCC','dMaximumBWL1',
+                                'pActualThreshold','pActualNMM','pActualMCC','pActualBWL1',
+                                'dActualThreshold','dActualNMM','dActualMCC','dActualBWL1'])
+            constant_mets = ['pPixelAverageAUC','dPixelAverageAUC','pMaskAverageAUC','dMaskAverageAUC']
+            if args.sbin >= -1:
+                constant_mets.extend(['pMaximumThreshold','dMaximumThreshold','pActualThreshold','dActualThreshold'])
 
-        for pix in pix2ints:
-            r_df[pix] = r_df[pix].dropna().apply(lambda x: str(int(x)))
+            a_df = 0
+            if factor_mode == 'qm':
+                a_df = averageByFactors(r_df,metrics,constant_mets,factor_mode,q)
+            else:
+                a_df = averageByFactors(r_df,metrics,constant_mets,factor_mode,query)
 
-        #generate HTML table report
-        df2html(r_df,a_df,outRootQuery,args.queryManipulation,q)
-    
-        r_df.loc[r_df.query('pOptimumMCC == -2').index,'pOptimumMCC'] = ''
-        r_df.loc[r_df.query('dOptimumMCC == -2').index,'dOptimumMCC'] = ''
-
-        prefix = outpfx#os.path.basename(args.inSys).split('.')[0]
-
-        #other reports of varying
-        if args.outMeta:
-            roM_df = stackdf[['TaskID','ProbeFileID','ProbeFileName','DonorFileID','DonorFileName','OutputProbeMaskFileName','OutputDonorMaskFileName','ScoredMask','IsTarget','ConfidenceScore',optOutCol,'OptimumNMM','OptimumMCC','OptimumBWL1','GWL1']]
-            roM_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'perimage-outMeta.csv'])),sep="|",index=False)
-        if args.outAllmeta:
-            #left join with index file and journal data
-            rAM_df = pd.merge(stackdf.copy(),myIndex,how='left',on=['TaskID','ProbeFileID','ProbeFileName','DonorFileID','DonorFileName'])
-            rAM_df = pd.merge(rAM_df,journalData0,how='left',on=['ProbeFileID','DonorFileID','JournalName'])
-            rAM_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'perimage-allMeta.csv'])),sep="|",index=False)
-
-        r_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'mask_scores_perimage.csv'])),sep="|",index=False)
+            r_df = r_df.drop(['pPixelAverageAUC','pMaskAverageAUC','dPixelAverageAUC','dMaskAverageAUC'],1)
+            if args.sbin >= -1:
+                r_df = r_df.drop(['pMaximumThreshold','pActualThreshold','dMaximumThreshold','dActualThreshold'],1)
+
+            #convert all to ints.
+    #        if a_df is not 0:
+    #            a_df['pOptimumThreshold'] = a_df['pOptimumThreshold'].dropna().apply(lambda x: str(int(x)))
+    #            a_df['dOptimumThreshold'] = a_df['dOptimumThreshold'].dropna().apply(lambda x: str(int(x)))
+    #            if args.sbin >= 0:
+    #                a_df['pMaximumThreshold'] = a_df['pMaximumThreshold'].dropna().apply(lambda x: str(int(x)))
+    #                a_df['pActualThreshold'] = a_df['pActualThreshold'].dropna().apply(lambda x: str(int(x)))
+    #                a_df['dMaximumThreshold'] = a_df['dMaximumThreshold'].dropna().apply(lambda x: str(int(x)))
+    #                a_df['dActualThreshold'] = a_df['dActualThreshold'].dropna().apply(lambda x: str(int(x)))
+
+            r_df.loc[r_df.query('pOptimumMCC == -2').index,'ProbeScored'] = 'N'
+            r_df.loc[r_df.query('pOptimumMCC == -2').index,'pOptimumNMM'] = ''
+            r_df.loc[r_df.query('pOptimumMCC == -2').index,'pOptimumBWL1'] = ''
+            r_df.loc[r_df.query('pOptimumMCC == -2').index,'pGWL1'] = ''
+            r_df.loc[r_df.query('dOptimumMCC == -2').index,'DonorScored'] = 'N'
+            r_df.loc[r_df.query('dOptimumMCC == -2').index,'dOptimumNMM'] = ''
+            r_df.loc[r_df.query('dOptimumMCC == -2').index,'dOptimumBWL1'] = ''
+            r_df.loc[r_df.query('dOptimumMCC == -2').index,'dGWL1'] = ''
+
+            #convert all pixel values to decimal-less strings
+            pix2ints = ['pOptimumThreshold','pOptimumPixelTP','pOptimumPixelFP','pOptimumPixelTN','pOptimumPixelFN',
+                        'pPixelN','pPixelBNS','pPixelSNS','pPixelPNS',
+                        'dOptimumThreshold','dOptimumPixelTP','dOptimumPixelFP','dOptimumPixelTN','dOptimumPixelFN',
+                        'dPixelN','dPixelBNS','dPixelSNS','dPixelPNS']
+
+            if args.sbin >= -1:
+                pix2ints.extend(['pMaximumPixelTP','pMaximumPixelFP','pMaximumPixelTN','pMaximumPixelFN',
+                                 'pActualPixelTP','pActualPixelFP','pActualPixelTN','pActualPixelFN',
+                                 'dMaximumPixelTP','dMaximumPixelFP','dMaximumPixelTN','dMaximumPixelFN',
+                                 'dActualPixelTP','dActualPixelFP','dActualPixelTN','dActualPixelFN'])
+
+            for pix in pix2ints:
+                r_df[pix] = r_df[pix].dropna().apply(lambda x: str(int(x)))
+
+            #generate HTML table report
+            df2html(r_df,a_df,outRootQuery,args.queryManipulation,q)
+
+            r_df.loc[r_df.query('pOptimumMCC == -2').index,'pOptimumMCC'] = ''
+            r_df.loc[r_df.query('dOptimumMCC == -2').index,'dOptimumMCC'] = ''
+
+            prefix = outpfx#os.path.basename(args.inSys).split('.')[0]
+
+            #other reports of varying
+            if args.outMeta:
+                roM_df = stackdf[['TaskID','ProbeFileID','ProbeFileName','DonorFileID','DonorFileName','OutputProbeMaskFileName','OutputDonorMaskFileName','ScoredMask','IsTarget','ConfidenceScore',optOutCol,'OptimumNMM','OptimumMCC','OptimumBWL1','GWL1']]
+                roM_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'perimage-outMeta.csv'])),sep="|",index=False)
+            if args.outAllmeta:
+                #left join with index file and journal data
+                rAM_df = pd.merge(stackdf.copy(),myIndex,how='left',on=['TaskID','ProbeFileID','ProbeFileName','DonorFileID','DonorFileName'])
+                rAM_df = pd.merge(rAM_df,journalData0,how='left',on=['ProbeFileID','DonorFileID','JournalName'])
+                rAM_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'perimage-allMeta.csv'])),sep="|",index=False)
+
+            r_df.to_csv(path_or_buf=os.path.join(outRootQuery,'_'.join([prefix,'mask_scores_perimage.csv'])),sep="|",index=False)
+
+    if checkpoint is not 0:
+        checkpoint.close()
+        checkpoint = 0
+
+#wait for the HTML reports still being written
+finishReports()
+stopPool()
+
+for traceName in traceNames:
+    printq(summarizeTrace(traceName))
 
 printq("Ending the mask scoring report.")
 exit(0)